@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmarks for the exam generation and book ingestion pipeline.
+
+Synthesizes problem banks of 100 / 1k / 10k problemN.tex files and book PDFs
+of 10 / 100 / 1000 pages in a temporary directory, then times each stage:
+bank indexing, .tex generation (full and incremental no-op), PDF splitting,
+outline indexing, page conversion (LLM calls stubbed), section assembly and
+the Markdown checker. Results are written as JSON so runs from different
+commits can be compared.
+
+Usage:
+    python3 scripts/bench_pipeline.py [--quick] [--repeat N] [--out bench.json]
+    python3 scripts/bench_pipeline.py --compare old.json new.json [--threshold 0.10]
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# convert_pdfs refuses to import without a key; no request is ever sent here
+os.environ.setdefault("MY_API_KEY", "bench")
+os.environ["LLM_CACHE"] = "off"
+
+import fitz  # PyMuPDF
+from PyPDF2 import PdfReader
+
+import check_section_markdown_formatting
+import combine_section_markdown
+import convert_pdfs
+import generate_all_banks_tex
+import split_pdf
+from problem_bank import discover_banks, get_problem_files
+
+BANK_SIZES = (100, 1000, 10000)
+PDF_PAGES = (10, 100, 1000)
+SECTION_EVERY = 5  # pages per synthetic outline section
+REPEAT = 3
+THRESHOLD = 0.10
+
+def make_banks(root, total):
+    """src/banks/Bank1 and Bank2 holding `total` problems between them."""
+    for b, count in enumerate((total - total // 2, total // 2), 1):
+        bank_dir = os.path.join(root, "src", "banks", f"Bank{b}")
+        os.makedirs(bank_dir, exist_ok=True)
+        for i in range(1, count + 1):
+            with open(os.path.join(bank_dir, f"problem{i}.tex"), "w") as f:
+                f.write(f"% Example problem {i}\n\\question What is ${i} + {b}$?\n"
+                        f"\\begin{{solution}}\n${i + b}$\n\\end{{solution}}\n")
+
+def make_book(path, pages):
+    """A text PDF with a two-level outline: a chapter every 4 sections, a section every SECTION_EVERY pages."""
+    with fitz.open() as doc:
+        toc = []
+        for p in range(1, pages + 1):
+            page = doc.new_page(width=612, height=792)
+            page.insert_text((72, 72), f"Page {p}", fontsize=14)
+            page.insert_textbox(fitz.Rect(72, 100, 540, 720), f"Body text of page {p}. " * 40, fontsize=10)
+            if (p - 1) % SECTION_EVERY == 0:
+                section = (p - 1) // SECTION_EVERY
+                if section % 4 == 0:
+                    toc.append([1, f"Chapter {section // 4 + 1}", p])
+                toc.append([2, f"Section {section + 1}", p])
+        doc.set_toc(toc)
+        doc.save(path)
+
+def stub_chat_completion(prompt, max_tokens, label, raise_errors=False):
+    return f"## {label}\n\nStub markdown.\n\n| a | b |\n|---|---|\n| 1 | 2 |"
+
+def measure(fn, setup=None, repeat=REPEAT):
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+def run_main(main, argv):
+    saved = sys.argv
+    sys.argv = argv
+    try:
+        main()
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = saved
+
+def bench_banks(workdir, sizes, repeat):
+    results = {}
+    for size in sizes:
+        root = os.path.join(workdir, f"banks_{size}")
+        make_banks(root, size)
+        os.chdir(root)
+        bank_dirs = discover_banks(generate_all_banks_tex.BANKS_ROOT)
+        results[f"get_problem_files[{size}]"] = measure(lambda: [get_problem_files(d) for d in bank_dirs], repeat=repeat)
+        results[f"generate_all_banks_tex[{size}]"] = measure(
+            lambda: run_main(generate_all_banks_tex.main, ["generate_all_banks_tex.py"]), repeat=repeat)
+        # Prime the manifest, then time a rebuild where nothing changed
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_main(generate_all_banks_tex.main, ["generate_all_banks_tex.py", "--incremental"])
+        results[f"generate_all_banks_tex --incremental no-op[{size}]"] = measure(
+            lambda: run_main(generate_all_banks_tex.main, ["generate_all_banks_tex.py", "--incremental"]), repeat=repeat)
+        print(f"[BENCH] banks of {size} problems done")
+    return results
+
+def bench_book(workdir, pages_list, repeat):
+    results = {}
+    convert_pdfs.chat_completion = stub_chat_completion
+    for pages in pages_list:
+        root = os.path.join(workdir, f"book_{pages}")
+        os.makedirs(root)
+        os.chdir(root)
+        make_book("book.pdf", pages)
+        results[f"split_pdf[{pages}]"] = measure(
+            lambda: split_pdf.split_pdf("book.pdf", "book_pages"),
+            setup=lambda: shutil.rmtree("book_pages", ignore_errors=True), repeat=repeat)
+        results[f"generate_index[{pages}]"] = measure(
+            lambda: split_pdf.generate_index(PdfReader("book.pdf"), "book_pages"), repeat=repeat)
+        results[f"convert_book (stubbed LLM)[{pages}]"] = measure(
+            lambda: convert_pdfs.convert_book("book.pdf", "book_pages_md"),
+            setup=lambda: shutil.rmtree("book_pages_md", ignore_errors=True), repeat=repeat)
+        index = combine_section_markdown.load_index(os.path.join("book_pages", "index.json"))
+        results[f"combine_section_markdown[{pages}]"] = measure(
+            lambda: combine_section_markdown.assemble_sections(index, "book_pages_md", "book_sections_md"), repeat=repeat)
+        md_files = sorted(os.path.join("book_sections_md", f) for f in os.listdir("book_sections_md") if f.endswith(".md"))
+        results[f"check_markdown_formatting[{pages}]"] = measure(
+            lambda: list(check_section_markdown_formatting.check_files(md_files, "book_sections_md", workers=1)),
+            repeat=repeat)
+        print(f"[BENCH] book of {pages} pages done")
+    return results
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, encoding="utf-8", check=False,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+def run(out_path, quick=False, repeat=REPEAT):
+    bank_sizes = BANK_SIZES[:1] if quick else BANK_SIZES
+    pdf_pages = PDF_PAGES[:1] if quick else PDF_PAGES
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    try:
+        results = {}
+        results.update(bench_banks(workdir, bank_sizes, repeat))
+        results.update(bench_book(workdir, pdf_pages, repeat))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    width = max(len(name) for name in results)
+    for name, r in results.items():
+        print(f"{name:<{width}}  {r['median']:>9.4f}s (min {r['min']:.4f}s)")
+    print(f"Results written to {out_path}")
+    return report
+
+def compare(old_path, new_path, threshold=THRESHOLD):
+    """Print old vs new median times; returns the names that got slower by more than threshold."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    names = [name for name in new["results"] if name in old["results"]]
+    regressions = []
+    width = max([len("Benchmark")] + [len(name) for name in names])
+    print(f"{'Benchmark':<{width}}  {'old (s)':>9}  {'new (s)':>9}  {'change':>8}")
+    for name in names:
+        before, after = old["results"][name]["median"], new["results"][name]["median"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<{width}}  {before:>9.4f}  {after:>9.4f}  {change:>+7.1%}{flag}")
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}: {len(regressions)} regression(s) over {threshold:.0%}")
+    return regressions
+
+def main():
+    args = sys.argv[1:]
+    options = {"--repeat": REPEAT, "--out": "bench_results.json", "--threshold": THRESHOLD}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if "--compare" in args:
+        i = args.index("--compare")
+        if len(args) < i + 3:
+            print("Usage: python3 bench_pipeline.py --compare old.json new.json [--threshold 0.10]")
+            sys.exit(1)
+        regressions = compare(args[i + 1], args[i + 2], float(options["--threshold"]))
+        sys.exit(1 if regressions else 0)
+    run(options["--out"], quick="--quick" in args, repeat=int(options["--repeat"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Content-hash build manifest for incremental generation of bank/combined .tex files.
+
+The manifest records, for every problem file, its (mtime_ns, size, sha256) so a
+no-op rebuild only needs one stat() per input, and for every generated output
+the digest of its inputs when it was last written and last compiled.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".build_manifest.json"
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class BuildCache:
+    def __init__(self, path):
+        self.path = path
+        self.files = {}    # input path -> [mtime_ns, size, sha256]
+        self.outputs = {}  # output path -> {"written": digest, "compiled": digest}
+        self.dirty = False
+        self._checked = {}  # inputs already stat()ed during this run
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.files = data.get("files", {})
+                self.outputs = data.get("outputs", {})
+            except (OSError, ValueError):
+                print(f"[WARN] Ignoring unreadable build manifest {path}")
+
+    def file_hash(self, path):
+        """sha256 of path, re-hashing only when its mtime or size changed."""
+        if path in self._checked:
+            return self._checked[path]
+        st = os.stat(path)
+        entry = self.files.get(path)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            digest = entry[2]
+        else:
+            digest = sha256_file(path)
+            self.files[path] = [st.st_mtime_ns, st.st_size, digest]
+            self.dirty = True
+        self._checked[path] = digest
+        return digest
+
+    def digest(self, inputs, params):
+        """Digest of the template parameters and the content of every input, in order."""
+        h = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+        for path in inputs:
+            h.update(b"\0" + path.encode("utf-8") + b"\0" + self.file_hash(path).encode("ascii"))
+        return h.hexdigest()
+
+    def needs_write(self, output, digest):
+        return not os.path.exists(output) or self.outputs.get(output, {}).get("written") != digest
+
+    def mark_written(self, output, digest):
+        self.outputs.setdefault(output, {})["written"] = digest
+        self.dirty = True
+
+    def needs_compile(self, output):
+        entry = self.outputs.get(output, {})
+        return entry.get("compiled") is None or entry.get("compiled") != entry.get("written")
+
+    def mark_compiled(self, output):
+        entry = self.outputs.setdefault(output, {})
+        entry["compiled"] = entry.get("written")
+        self.dirty = True
+
+    def prune(self, live_inputs, live_outputs):
+        """Forget inputs and outputs that are no longer part of the build."""
+        for table, live in ((self.files, set(live_inputs)), (self.outputs, set(live_outputs))):
+            for key in [k for k in table if k not in live]:
+                del table[key]
+                self.dirty = True
+
+    def split(self, groups):
+        """In-memory manifests for worker processes, one per group.
+
+        groups maps a key to (input directory, outputs); each part holds the entries
+        of the inputs directly in that directory and of those outputs. Hand the
+        parts back to merge() when the workers are done.
+        """
+        by_dir = {}
+        for path, entry in self.files.items():
+            by_dir.setdefault(os.path.normpath(os.path.dirname(path)), {})[path] = entry
+        parts = {}
+        for key, (input_dir, outputs) in groups.items():
+            part = BuildCache(None)
+            part.files = dict(by_dir.get(os.path.normpath(input_dir), {}))
+            part.outputs = {out: dict(self.outputs[out]) for out in outputs if out in self.outputs}
+            parts[key] = part
+        return parts
+
+    def merge(self, part):
+        """Fold a worker's manifest part back in."""
+        self.files.update(part.files)
+        self.outputs.update(part.outputs)
+        self._checked.update(part._checked)
+        self.dirty = self.dirty or part.dirty
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "outputs": self.outputs}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -1,60 +1,390 @@
+import hashlib
 import os
 import re
 import json
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def check_markdown_formatting(md_text, filename):
+import instrument
+
+IMAGE_RE = re.compile(r'!\[[^\]]*\]\(([^)]+)\)')
+URL_RE = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+LINT_CACHE_NAME = '.lint_cache.json'
+# Fewer files than this are checked in-process; a worker pool costs more than it saves
+PARALLEL_MIN_FILES = 16
+
+# One token per line of interest, produced by a single pass over the file
+Token = namedtuple('Token', ['kind', 'line', 'value'])
+
+def tokenize(md_text):
+    """Yield one table_row/table_start/other token per line, then its fence, yaml and image tokens."""
+    lines = md_text.split('\n')
+    last = len(lines) - 1
+    for lineno, line in enumerate(lines, 1):
+        # Table rows must end in '|' and be followed by a newline
+        kind, value = 'other', None
+        if lineno - 1 < last and line.endswith('|'):
+            first = line.find('|')
+            if first == 0 and len(line) >= 3:
+                kind, value = 'table_row', line
+            elif first < len(line) - 2:
+                # Can start a table but not continue one (text before the first '|')
+                kind, value = 'table_start', line[first:]
+        yield Token(kind, lineno, value)
+        fences = line.count('```')
+        if fences:
+            yield Token('fence', lineno, fences)
+        if line == '---':
+            yield Token('yaml', lineno, line)
+        for match in IMAGE_RE.finditer(line):
+            yield Token('image', lineno, match.group(1))
+
+LintContext = namedtuple('LintContext', ['filename', 'text', 'base_dir', 'existing_files', 'root'])
+
+RULES = []
+
+def register_rule(cls):
+    """Class decorator adding a lint rule plugin to RULES."""
+    RULES.append(cls)
+    return cls
+
+class Rule:
+    """Base class for lint rules.
+
+    A rule lists the token kinds it wants in `kinds`; visit() is called for each
+    such token in file order and finish() once at the end. Both return issues.
+    """
+    type = None
+    kinds = ()
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def issue(self, message):
+        return {'file': self.ctx.filename, 'type': self.type, 'message': message}
+
+    def visit(self, token):
+        return ()
+
+    def finish(self):
+        return ()
+
+@register_rule
+class UnclosedCodeBlock(Rule):
+    type = 'unclosed_code_block'
+    kinds = ('fence',)
+
+    def __init__(self, ctx):
+        super().__init__(ctx)
+        self.count = 0
+
+    def visit(self, token):
+        self.count += token.value
+        return ()
+
+    def finish(self):
+        if self.count % 2 != 0:
+            return [self.issue('Odd number of triple backticks (```), possible unclosed code block.')]
+        return ()
+
+@register_rule
+class UnclosedYaml(Rule):
+    type = 'unclosed_yaml'
+    kinds = ('yaml',)
+
+    def __init__(self, ctx):
+        super().__init__(ctx)
+        self.count = 0
+
+    def visit(self, token):
+        self.count += 1
+        return ()
+
+    def finish(self):
+        if self.ctx.text.strip().startswith('---') and self.count % 2 != 0:
+            return [self.issue('Odd number of YAML frontmatter delimiters (---), possible unclosed YAML.')]
+        return ()
+
+@register_rule
+class MissingImage(Rule):
+    type = 'missing_image'
+    kinds = ('image',)
+
+    def visit(self, token):
+        img_path = token.value
+        if image_exists(img_path, self.ctx.base_dir, self.ctx.existing_files, self.ctx.root):
+            return ()
+        return [self.issue(f'Image file not found: {img_path}')]
+
+@register_rule
+class TableColumnMismatch(Rule):
+    type = 'table_column_mismatch'
+    kinds = ('table_start', 'table_row', 'other')
+
+    def __init__(self, ctx):
+        super().__init__(ctx)
+        self.rows = []
+
+    def _close(self):
+        rows, self.rows = self.rows, []
+        if len(rows) > 1 and len({row.count('|') for row in rows}) > 1:
+            return [self.issue('Table rows have inconsistent number of columns.')]
+        return ()
+
+    def visit(self, token):
+        if token.kind == 'table_row' and self.rows:
+            self.rows.append(token.value)
+            return ()
+        issues = self._close()
+        if token.kind != 'other':
+            self.rows.append(token.value)
+        return issues
+
+    def finish(self):
+        return self._close()
+
+def image_path(img_path, base_dir):
+    """Normalized path of an image link relative to the lint root, or None for URLs."""
+    img_path = img_path.strip().strip('<>')
+    if URL_RE.match(img_path):
+        # Remote or data URLs are not checked
+        return None
+    return os.path.normpath(os.path.join(base_dir, img_path)) if base_dir else os.path.normpath(img_path)
+
+def image_exists(img_path, base_dir, existing_files, root=''):
+    """Check an image link against the prebuilt set of files (relative to the markdown file).
+
+    Links that leave the root are checked on disk, relative to root.
+    """
+    rel = image_path(img_path, base_dir)
+    if rel is None:
+        return True
+    if existing_files is not None and not rel.startswith(os.pardir):
+        return rel in existing_files
+    return Path(root, rel).exists()
+
+def outside_images(md_text, base_dir):
+    """Image links of md_text that leave the lint root, as paths relative to it."""
+    paths = (image_path(match.group(1), base_dir) for match in IMAGE_RE.finditer(md_text))
+    return sorted({rel for rel in paths if rel is not None and rel.startswith(os.pardir)})
+
+def check_markdown_formatting(md_text, filename, base_dir='', existing_files=None, root=''):
+    """Lint one markdown text in a single tokenizing pass with every registered rule.
+
+    Image links are resolved relative to base_dir (the markdown file's directory,
+    relative to root) and looked up in existing_files (paths relative to root)
+    when given.
+    """
+    ctx = LintContext(filename, md_text, base_dir, existing_files, root)
+    rules = [cls(ctx) for cls in RULES]
+    by_kind = {}
+    for r in rules:
+        for kind in r.kinds:
+            by_kind.setdefault(kind, []).append(r)
+    found = {id(r): [] for r in rules}
+    for token in tokenize(md_text):
+        for r in by_kind.get(token.kind, ()):
+            found[id(r)].extend(r.visit(token))
     issues = []
-    # Check for unclosed code blocks
-    code_blocks = re.findall(r'```', md_text)
-    if len(code_blocks) % 2 != 0:
-        issues.append({
-            'file': filename,
-            'type': 'unclosed_code_block',
-            'message': 'Odd number of triple backticks (```), possible unclosed code block.'
-        })
-    # Check for unclosed YAML frontmatter
-    if md_text.strip().startswith('---'):
-        yaml_count = len(re.findall(r'^---$', md_text, re.MULTILINE))
-        if yaml_count % 2 != 0:
-            issues.append({
-                'file': filename,
-                'type': 'unclosed_yaml',
-                'message': 'Odd number of YAML frontmatter delimiters (---), possible unclosed YAML.'
-            })
-    # Check for broken image links
-    for match in re.finditer(r'!\[[^\]]*\]\(([^)]+)\)', md_text):
-        img_path = match.group(1)
-        if not Path(img_path).exists():
-            issues.append({
-                'file': filename,
-                'type': 'missing_image',
-                'message': f'Image file not found: {img_path}'
-            })
-    # Check for tables with inconsistent columns
-    for table in re.findall(r'(\|.+\|\n(?:\|.+\|\n)+)', md_text):
-        rows = [row for row in table.strip().split('\n') if row.strip()]
-        if len(rows) > 1:
-            col_counts = [row.count('|') for row in rows]
-            if len(set(col_counts)) > 1:
-                issues.append({
-                    'file': filename,
-                    'type': 'table_column_mismatch',
-                    'message': 'Table rows have inconsistent number of columns.'
-                })
+    # Report in rule registration order
+    for r in rules:
+        found[id(r)].extend(r.finish())
+        issues.extend(found[id(r)])
     return issues
 
+def list_files(root):
+    """Every file under root, as normalized paths relative to root."""
+    existing = set()
+    for dirpath, _, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for name in filenames:
+            existing.add(os.path.normpath(os.path.join(rel_dir, name)))
+    return existing
+
+_existing_files = None
+
+def _init_worker(existing_files):
+    global _existing_files
+    _existing_files = existing_files
+
+def check_file(md_file, root):
+    with open(md_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    base_dir = os.path.relpath(os.path.dirname(md_file), root)
+    return check_markdown_formatting(text, os.path.basename(md_file), base_dir, _existing_files, root)
+
+def check_files(md_files, root, workers=None, existing_files=None):
+    """Yield the issue list of each file (in order), checking files in parallel."""
+    existing = list_files(root) if existing_files is None else existing_files
+    if workers == 1 or len(md_files) < PARALLEL_MIN_FILES:
+        _init_worker(existing)
+        for md_file in md_files:
+            yield check_file(md_file, root)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(existing,)) as pool:
+        chunksize = max(1, len(md_files) // ((workers or os.cpu_count() or 1) * 4))
+        yield from pool.map(check_file, md_files, [root] * len(md_files), chunksize=chunksize)
+
+def files_digest(existing_files):
+    # Only asset files can be image targets; adding or renaming a section must
+    # not invalidate every entry with image links
+    h = hashlib.sha256()
+    for name in sorted(existing_files):
+        if not name.endswith('.md') and not os.path.basename(name).startswith(LINT_CACHE_NAME):
+            h.update(name.encode('utf-8') + b'\0')
+    return h.hexdigest()
+
+class LintCache:
+    """Per-file content hash and issues from previous runs, kept in the section directory.
+
+    Entries are dropped wholesale when the registered rules change, and entries of
+    files with image links are dropped when the set of non-markdown files in the
+    directory changes.
+    Images linked from outside the directory are not in that set, so each entry
+    also keeps whether those existed and is re-linted when one appears or goes.
+    """
+    def __init__(self, path, existing_files):
+        self.path = path
+        # The cache file lives in the lint root
+        self.root = os.path.dirname(path)
+        self.rules = [cls.type for cls in RULES]
+        self.images = files_digest(existing_files)
+        # md file -> {"stat": [mtime_ns, size], "sha": ..., "images": bool, "outside": {path: exists}, "issues": [...]}
+        self.files = {}
+        self.dirty = False
+        self._pending = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                print(f"[WARN] Ignoring unreadable lint cache {path}")
+                data = {}
+            if data.get('rules') == self.rules:
+                self.files = data.get('files', {})
+                if data.get('images') != self.images:
+                    self.files = {k: v for k, v in self.files.items() if not v['images']}
+                    self.dirty = True
+
+    def outside_state(self, paths):
+        return {rel: os.path.exists(os.path.join(self.root, rel)) for rel in paths}
+
+    def lookup(self, md_file):
+        """Cached issues for md_file, or None if it must be re-linted."""
+        st = os.stat(md_file)
+        stat = [st.st_mtime_ns, st.st_size]
+        entry = self.files.get(md_file)
+        if entry and entry.get('outside') and self.outside_state(entry['outside']) != entry['outside']:
+            entry = None
+        if entry and entry['stat'] == stat:
+            return entry['issues']
+        with open(md_file, 'rb') as f:
+            data = f.read()
+        sha = hashlib.sha256(data).hexdigest()
+        if entry and entry['sha'] == sha:
+            entry['stat'] = stat
+            self.dirty = True
+            return entry['issues']
+        outside = {}
+        if b'![' in data:
+            base_dir = os.path.relpath(os.path.dirname(md_file), self.root)
+            outside = self.outside_state(outside_images(data.decode('utf-8', 'replace'), base_dir))
+        self._pending[md_file] = (stat, sha, b'![' in data, outside)
+        return None
+
+    def store(self, md_file, issues):
+        stat, sha, images, outside = self._pending.pop(md_file)
+        self.files[md_file] = {'stat': stat, 'sha': sha, 'images': images, 'outside': outside, 'issues': issues}
+        self.dirty = True
+
+    def prune(self, md_files):
+        live = set(md_files)
+        for key in [k for k in self.files if k not in live]:
+            del self.files[key]
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rules': self.rules, 'images': self.images, 'files': self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+def check_files_incremental(md_files, root, workers=None):
+    """Issue lists for md_files (in order), re-linting only files changed since the cached run.
+
+    Returns (issue_lists, number of files re-linted).
+    """
+    existing = list_files(root)
+    cache = LintCache(os.path.join(root, LINT_CACHE_NAME), existing)
+    results = {}
+    stale = []
+    for md_file in md_files:
+        issues = cache.lookup(md_file)
+        if issues is None:
+            stale.append(md_file)
+        else:
+            results[md_file] = issues
+    for md_file, issues in zip(stale, check_files(stale, root, workers, existing)):
+        cache.store(md_file, issues)
+        results[md_file] = issues
+    cache.prune(md_files)
+    cache.save()
+    return [results[md_file] for md_file in md_files], len(stale)
+
+def write_issues(issue_lists, out_path, jsonl=False):
+    """Stream issues to out_path as a JSON array or as JSON Lines; returns the issue count."""
+    count = 0
+    with open(out_path, 'w', encoding='utf-8') as f:
+        if not jsonl:
+            f.write('[')
+        for issues in issue_lists:
+            for issue in issues:
+                if jsonl:
+                    f.write(json.dumps(issue) + '\n')
+                else:
+                    # Same layout as json.dump(..., indent=2) for flat issue dicts
+                    fields = ',\n'.join(f'    {json.dumps(k)}: {json.dumps(v)}' for k, v in issue.items())
+                    f.write((',\n' if count else '\n') + '  {\n' + fields + '\n  }')
+                count += 1
+        if not jsonl:
+            f.write('\n]' if count else ']')
+    return count
+
 def main():
-    section_dir = Path('book_sections_md')
-    all_issues = []
-    for md_file in section_dir.glob('*.md'):
-        with open(md_file, 'r', encoding='utf-8') as f:
-            text = f.read()
-        issues = check_markdown_formatting(text, md_file.name)
-        all_issues.extend(issues)
-    with open('issues.json', 'w', encoding='utf-8') as f:
-        json.dump(all_issues, f, indent=2)
-    print(f"Checked {len(list(section_dir.glob('*.md')))} files. Issues written to issues.json.")
+    args = sys.argv[1:]
+    workers = None
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    jsonl = '--jsonl' in args
+    if jsonl:
+        args.remove('--jsonl')
+    incremental = '--incremental' in args
+    if incremental:
+        args.remove('--incremental')
+    section_dir = Path(args[0]) if args else Path('book_sections_md')
+    out_path = 'issues.jsonl' if jsonl else 'issues.json'
+    md_files = sorted(str(p) for p in section_dir.glob('*.md'))
+    with instrument.span('check_markdown', files=len(md_files), incremental=incremental):
+        if incremental:
+            issue_lists, rechecked = check_files_incremental(md_files, str(section_dir), workers)
+            count = write_issues(issue_lists, out_path, jsonl)
+        else:
+            rechecked = len(md_files)
+            count = write_issues(check_files(md_files, str(section_dir), workers), out_path, jsonl)
+    instrument.count('lint.files', len(md_files))
+    instrument.count('lint.files_rechecked', rechecked)
+    instrument.count('lint.issues', count)
+    if incremental:
+        print(f"Checked {len(md_files)} files ({rechecked} re-linted). {count} issues written to {out_path}.")
+    else:
+        print(f"Checked {len(md_files)} files. {count} issues written to {out_path}.")
 
 if __name__ == '__main__':
     main()
@@ -1,72 +1,152 @@
 import os
-import json
+from collections import OrderedDict
 from pathlib import Path
 import sys
 import shutil
 import re
 
+import instrument
+from section_index import SectionIndex
+
+# Pages kept in memory; sections are assembled in page order, so only the
+# boundary pages shared by neighbouring sections are ever needed again.
+PAGE_CACHE_SIZE = 8
+IMAGE_RE = re.compile(r'!\[[^\]]*\]\(([^)]+)\)')
+
 def load_index(index_path):
-    with open(index_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return SectionIndex.load(index_path)
 
 def find_images_in_markdown(md_content):
     # Find all image links: ![alt](filename)
-    return re.findall(r'!\[[^\]]*\]\(([^)]+)\)', md_content)
+    return IMAGE_RE.findall(md_content)
 
-def combine_pages_and_collect_images(section, page_numbers, pages_dir):
-    contents = []
-    images = set()
-    for page in page_numbers:
-        page_file = pages_dir / f"page_{str(page).zfill(4)}.md"
+class PageCache:
+    """Bounded LRU cache of page markdown and the images each page references."""
+    def __init__(self, pages_dir, maxsize=PAGE_CACHE_SIZE):
+        self.pages_dir = Path(pages_dir)
+        self.maxsize = maxsize
+        self.pages = OrderedDict()
+        self.reads = 0
+
+    def get(self, page):
+        """Return (markdown, images) for a page; markdown is None if the page file is missing."""
+        if page in self.pages:
+            self.pages.move_to_end(page)
+            return self.pages[page]
+        page_file = self.pages_dir / f"page_{str(page).zfill(4)}.md"
         if page_file.exists():
             with open(page_file, 'r', encoding='utf-8') as f:
                 md = f.read()
-                contents.append(md)
-                images.update(find_images_in_markdown(md))
+            self.reads += 1
+            instrument.count('combine.pages_read')
+            entry = (md, tuple(find_images_in_markdown(md)))
         else:
-            contents.append(f"<!-- Missing: {page_file.name} -->")
+            entry = (None, ())
+        self.pages[page] = entry
+        if len(self.pages) > self.maxsize:
+            self.pages.popitem(last=False)
+        return entry
+
+def iter_section_pages(page_numbers, cache):
+    for page in page_numbers:
+        md, images = cache.get(page)
+        if md is None:
+            yield f"<!-- Missing: page_{str(page).zfill(4)}.md -->", images
+        else:
+            yield md, images
+
+def combine_pages_and_collect_images(section, page_numbers, pages_dir, cache=None):
+    cache = cache or PageCache(pages_dir)
+    contents = []
+    images = set()
+    for md, page_images in iter_section_pages(page_numbers, cache):
+        contents.append(md)
+        images.update(page_images)
     return '\n\n'.join(contents), images
 
-def copy_images(images, src_dir, dest_dir):
+def link_or_copy(src, dest):
+    """Hard-link src to dest when possible (same filesystem), otherwise copy."""
+    if dest.exists():
+        if os.path.samefile(src, dest):
+            return
+        src_stat, dest_stat = src.stat(), dest.stat()
+        if src_stat.st_size == dest_stat.st_size and int(src_stat.st_mtime) == int(dest_stat.st_mtime):
+            return
+        dest.unlink()
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+def copy_images(images, src_dir, dest_dir, done=None):
+    """Place each image in dest_dir once; `done` tracks images already handled this run."""
+    done = set() if done is None else done
     for img in images:
-        src = src_dir / img
         dest = dest_dir / img
+        if dest in done:
+            continue
+        src = src_dir / img
         if src.exists():
-            shutil.copy2(src, dest)
+            link_or_copy(src, dest)
+        done.add(dest)
+
+def section_path(section, out_dir):
+    return out_dir / f"{section.replace('/', '_').replace(' ', '_')}.md"
 
-def write_section_md(section, page_numbers, out_dir, index_entry, images):
-    out_path = out_dir / f"{section.replace('/', '_').replace(' ', '_')}.md"
+def write_section_md(section, page_numbers, out_dir, cache):
+    """Stream a section's pages from the page cache into its markdown file; returns its images."""
+    out_path = section_path(section, out_dir)
     yaml_header = '---\n' + f'section: "{section}"\npages: {page_numbers}\n' + '---\n\n'
-    content, found_images = combine_pages_and_collect_images(section, page_numbers, Path('book_pages_md'))
+    images = set()
     with open(out_path, 'w', encoding='utf-8') as f:
         f.write(yaml_header)
-        f.write(content)
-    # Copy images for this section
-    copy_images(found_images, Path('book_pages_md'), out_path.parent)
+        for i, (md, page_images) in enumerate(iter_section_pages(page_numbers, cache)):
+            if i:
+                f.write('\n\n')
+            f.write(md)
+            images.update(page_images)
+        instrument.count('combine.bytes_written', f.tell())
+    instrument.count('combine.sections')
+    return images
+
+def section_pages_with_overlap(index):
+    """(section, pages) in index order, each extended by the next section's first page.
+
+    index: a SectionIndex, or an index dict in either index.json format.
+    """
+    if not isinstance(index, SectionIndex):
+        index = SectionIndex.from_dict(index)
+    sections = list(index)
+    for i, (section, pages) in enumerate(sections):
+        if not pages:
+            continue
+        pages = list(pages)
+        # Add the first page of the next section if it exists and is not already included
+        if i + 1 < len(sections):
+            next_pages = sections[i + 1][1]
+            if next_pages and next_pages[0] not in pages:
+                pages.append(next_pages[0])
+        yield section, pages
+
+@instrument.timed('combine_sections')
+def assemble_sections(index, pages_md_dir, out_dir, cache_size=PAGE_CACHE_SIZE):
+    """Write every section in one pass over the pages; returns the PageCache (for its stats)."""
+    pages_md_dir, out_dir = Path(pages_md_dir), Path(out_dir)
+    out_dir.mkdir(exist_ok=True)
+    cache = PageCache(pages_md_dir, cache_size)
+    placed = set()
+    for section, pages in section_pages_with_overlap(index):
+        images = write_section_md(section, pages, out_dir, cache)
+        copy_images(images, pages_md_dir, out_dir, placed)
+    return cache
 
 def main():
     index_path = Path('book_pages/index.json')
     pages_md_dir = Path('book_pages_md')
     out_dir = Path('book_sections_md')
-    out_dir.mkdir(exist_ok=True)
     index = load_index(index_path)
-    section_names = [k for k in index.keys() if k != '__all_pages__']
-    for i, section in enumerate(section_names):
-        pages = index[section]
-        if not pages:
-            continue
-        # Add the first page of the next section if it exists and is not already included
-        if i + 1 < len(section_names):
-            next_section = section_names[i + 1]
-            next_pages = index[next_section]
-            if next_pages:
-                next_first_page = next_pages[0]
-                if next_first_page not in pages:
-                    pages = pages + [next_first_page]
-        # Combine pages and collect images, then write section and copy images
-        content, images = combine_pages_and_collect_images(section, pages, pages_md_dir)
-        write_section_md(section, pages, out_dir, index[section], images)
-    print(f"Section markdown files and images written to {out_dir}/ (with overlap)")
+    cache = assemble_sections(index, pages_md_dir, out_dir)
+    print(f"Section markdown files and images written to {out_dir}/ (with overlap, {cache.reads} page files read)")
 
 if __name__ == "__main__":
     main()
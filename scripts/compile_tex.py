@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Parallel LaTeX compile scheduler for generated exam documents.
+
+Runs a bounded pool of pdflatex workers. Each job writes into its own output
+directory so that .aux/.log files of different documents never collide, and
+results are yielded as soon as each job finishes. Documents whose preamble
+ends in the endofdump marker are compiled against a precompiled format (see
+tex_format.py) unless --no-fmt is given.
+
+Usage:
+    python3 scripts/compile_tex.py [--jobs N] [--no-fmt] file1.tex [file2.tex ...]
+"""
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import instrument
+import tex_format
+
+PDFLATEX = "pdflatex"
+OUT_ROOT = os.path.join("build", "out")
+TIMEOUT = 30
+
+CompileResult = namedtuple("CompileResult", ["tex_path", "success", "output", "elapsed", "output_dir"])
+
+def run_pdflatex(tex_path, workdir, output_dir=None, timeout=TIMEOUT, fmt=None, fmt_dir=None):
+    """Run pdflatex in nonstopmode, return (success, output)"""
+    cmd = [PDFLATEX, "-interaction=nonstopmode"]
+    env = None
+    if fmt:
+        cmd.append(f"-fmt={fmt}")
+        # Trailing separator keeps kpathsea's default format path after ours
+        env = dict(os.environ, TEXFORMATS=os.path.abspath(fmt_dir) + os.pathsep)
+    if output_dir:
+        cmd.append(f"-output-directory={output_dir}")
+    cmd.append(os.path.basename(tex_path))
+    try:
+        result = subprocess.run(
+            cmd,
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=timeout,
+            check=False,
+            encoding="utf-8",
+            errors="replace"
+        )
+        success = (result.returncode == 0 and "! LaTeX Error" not in result.stdout)
+        return success, result.stdout
+    except Exception as e:
+        return False, str(e)
+
+def job_output_dir(tex_path, out_root=OUT_ROOT):
+    """Isolated output directory for one document, e.g. build/out/banks/Bank1/Bank1_all"""
+    parts = os.path.splitext(os.path.relpath(os.path.abspath(tex_path)))[0].split(os.sep)
+    if parts[0] == os.pardir:
+        # Outside the working directory: fall back to the bare document name
+        parts = parts[-1:]
+    elif len(parts) > 1 and parts[0] == "build":
+        parts = parts[1:]
+    return os.path.abspath(os.path.join(out_root, *parts))
+
+def _compile_one(tex_path, out_root, timeout, fmt_dir):
+    workdir = os.path.dirname(os.path.abspath(tex_path))
+    output_dir = job_output_dir(tex_path, out_root)
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    with instrument.span("tex_format.ensure_format"):
+        fmt = tex_format.ensure_format(tex_path, fmt_dir, PDFLATEX) if fmt_dir else None
+    with instrument.span("pdflatex", document=tex_path, fmt=fmt):
+        if fmt:
+            success, output = run_pdflatex(tex_path, workdir, output_dir=output_dir, timeout=timeout, fmt=fmt, fmt_dir=fmt_dir)
+        else:
+            success, output = run_pdflatex(tex_path, workdir, output_dir=output_dir, timeout=timeout)
+    instrument.count("pdflatex.runs")
+    if not success:
+        instrument.count("pdflatex.failures")
+    return CompileResult(tex_path, success, output, time.perf_counter() - start, output_dir)
+
+def compile_all(tex_files, jobs=None, out_root=OUT_ROOT, timeout=TIMEOUT, fmt_dir=tex_format.FMT_DIR):
+    """Compile tex_files with at most `jobs` concurrent pdflatex processes.
+
+    Documents with a dumpable preamble use the precompiled format in fmt_dir
+    (built on first use); pass fmt_dir=None to always load the full preamble.
+    Yields a CompileResult for each document in completion order.
+    """
+    tex_files = list(tex_files)
+    if not tex_files:
+        return
+    jobs = jobs or os.cpu_count() or 1
+    # Each worker only waits on its own pdflatex subprocess, so threads are
+    # enough to keep `jobs` LaTeX processes busy.
+    with ThreadPoolExecutor(max_workers=min(jobs, len(tex_files))) as pool:
+        futures = [pool.submit(_compile_one, tex, out_root, timeout, fmt_dir) for tex in tex_files]
+        for future in as_completed(futures):
+            yield future.result()
+
+def format_timing_table(results):
+    """Return a per-job timing table, slowest job first."""
+    results = sorted(results, key=lambda r: r.elapsed, reverse=True)
+    width = max([len("Document")] + [len(r.tex_path) for r in results])
+    lines = [f"{'Document':<{width}}  {'Status':<6}  {'Time (s)':>8}"]
+    lines.append("-" * len(lines[0]))
+    for r in results:
+        lines.append(f"{r.tex_path:<{width}}  {'OK' if r.success else 'FAIL':<6}  {r.elapsed:>8.2f}")
+    lines.append("-" * len(lines[0]))
+    lines.append(f"{'Total (sum of jobs)':<{width}}  {'':<6}  {sum(r.elapsed for r in results):>8.2f}")
+    return "\n".join(lines)
+
+def compile_and_report(tex_files, jobs=None, out_root=OUT_ROOT, timeout=TIMEOUT, fmt_dir=tex_format.FMT_DIR):
+    """Compile tex_files, printing each result as it finishes and a timing table at the end.
+
+    Returns the list of CompileResult objects.
+    """
+    results = []
+    start = time.perf_counter()
+    for result in compile_all(tex_files, jobs=jobs, out_root=out_root, timeout=timeout, fmt_dir=fmt_dir):
+        print(f"[COMPILE] {result.tex_path} ... {'OK' if result.success else 'FAIL'} ({result.elapsed:.2f}s)")
+        results.append(result)
+    if results:
+        print(format_timing_table(results))
+        print(f"Wall-clock time: {time.perf_counter() - start:.2f}s")
+    return results
+
+def main():
+    args = sys.argv[1:]
+    jobs = None
+    if "--jobs" in args:
+        idx = args.index("--jobs")
+        jobs = int(args[idx + 1])
+        del args[idx:idx + 2]
+    fmt_dir = tex_format.FMT_DIR
+    if "--no-fmt" in args:
+        args.remove("--no-fmt")
+        fmt_dir = None
+    if not args:
+        print("Usage: python3 compile_tex.py [--jobs N] [--no-fmt] file1.tex [file2.tex ...]")
+        sys.exit(1)
+    results = compile_and_report(args, jobs=jobs, fmt_dir=fmt_dir)
+    failed = [r for r in results if not r.success]
+    for r in failed:
+        print(f"--- {r.tex_path} ---\n{r.output}\n--- END ---\n")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,26 @@
 import os
 import sys
-import requests
 import time
 import json
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 import PyPDF2
+import instrument
+import llm_cache
+import pdf_ingest
+import rate_limit
+from split_pdf import pad_page_number
 
 load_dotenv()
 API_KEY = os.getenv("MY_API_KEY")
 if not API_KEY:
     raise RuntimeError("MY_API_KEY not set. Please set it in your .env file or environment.")
 
+CHAT_URL = "https://api.openai.com/v1/chat/completions"
+# Pages per extraction task when reading a whole book in parallel
+BOOK_CHUNK_SIZE = 16
+
 def pdf_page_to_text(pdf_path):
     try:
         reader = PyPDF2.PdfReader(pdf_path)
@@ -24,92 +34,347 @@ def pdf_page_to_text(pdf_path):
         print(f"[ERROR] Failed to extract text from {pdf_path}: {e}")
         return ""
 
-def openai_pdf_to_obsidian(text, page_num):
-    prompt = (
-        "Convert the following PDF page text into clean, well-structured Obsidian Markdown.\n"
-        "\n"
-        "Use:\n"
-        "- `##` and `###` for headings and logical sectioning\n"
-        "- bullet points or numbered lists where appropriate\n"
-        "- `> blockquotes` for author commentary or insights\n"
-        "- `**bold**` for emphasis\n"
-        "- backticks or triple backticks for code or technical terms\n"
-        "- horizontal rules (`---`) to separate major segments if useful\n"
-        "\n"
-        "Preserve all LaTeX-style math as inline (`$...$`) or block (`$$...$$`) where applicable.\n"
-        "Do not convert math to plain text. Reconstruct equations using standard LaTeX notation.\n"
-        "\n"
-        "If content seems list-oriented or enumerative, structure it that way.\n"
-        "Do not hallucinate content or include explanations, extra commentary, or LaTeX artifacts.\n"
-        "Output only valid Obsidian-compatible Markdown, with no YAML frontmatter.\n"
-        "If the page is mostly blank or not useful, return an empty string.\n\n"
-        f"Page {page_num} text:\n{text}\n\nMarkdown:"
-    )
+# Formatting rules shared by the single-page and multi-page prompts
+MARKDOWN_RULES = (
+    "Use:\n"
+    "- `##` and `###` for headings and logical sectioning\n"
+    "- bullet points or numbered lists where appropriate\n"
+    "- `> blockquotes` for author commentary or insights\n"
+    "- `**bold**` for emphasis\n"
+    "- backticks or triple backticks for code or technical terms\n"
+    "- horizontal rules (`---`) to separate major segments if useful\n"
+    "\n"
+    "Preserve all LaTeX-style math as inline (`$...$`) or block (`$$...$$`) where applicable.\n"
+    "Do not convert math to plain text. Reconstruct equations using standard LaTeX notation.\n"
+    "\n"
+    "If content seems list-oriented or enumerative, structure it that way.\n"
+    "Do not hallucinate content or include explanations, extra commentary, or LaTeX artifacts.\n"
+    "Output only valid Obsidian-compatible Markdown, with no YAML frontmatter.\n"
+)
+SYSTEM_MESSAGE = "You are a helpful assistant that converts PDF page text to clean, valid Obsidian Markdown."
+MAX_TOKENS = 1800
+# Upper bound on completion tokens for one multi-page request
+MAX_BATCH_TOKENS = 16000
+PAGE_MARKER_RE = re.compile(r'^<!-- PAGE (\d+) -->[ \t]*$', re.MULTILINE)
+
+def strip_code_fences(content):
+    # Strip ```markdown and ``` wrappers if present
+    if content.startswith('```markdown'):
+        content = content[len('```markdown'):].lstrip('\n')
+    if content.startswith('```'):
+        content = content[len('```'):].lstrip('\n')
+    if content.endswith('```'):
+        content = content[:-3].rstrip('\n')
+    return content.strip()
+
+def chat_completion(prompt, max_tokens, label, raise_errors=False):
+    """Send one chat request; returns the message content with fences stripped, or ''.
+
+    API and network errors also give '' unless raise_errors is set, in which case
+    they raise RuntimeError and '' only means the model returned nothing.
+    """
     headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
     data = {
         "model": "gpt-4o",
         "messages": [
-            {"role": "system", "content": "You are a helpful assistant that converts PDF page text to clean, valid Obsidian Markdown."},
+            {"role": "system", "content": SYSTEM_MESSAGE},
             {"role": "user", "content": prompt}
         ],
-        "max_tokens": 1800
+        "max_tokens": max_tokens
     }
-    for attempt in range(3):
-        try:
-            response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data)
-            if response.status_code == 200:
-                result = response.json()
-                usage = result.get("usage", {})
-                print(f"  [INFO] Tokens used: prompt={usage.get('prompt_tokens')}, completion={usage.get('completion_tokens')}")
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-                # Strip ```markdown and ``` wrappers if present
-                if content.startswith('```markdown'):
-                    content = content[len('```markdown'):].lstrip('\n')
-                if content.startswith('```'):
-                    content = content[len('```'):].lstrip('\n')
-                if content.endswith('```'):
-                    content = content[:-3].rstrip('\n')
-                return content.strip()
-            elif response.status_code >= 500:
-                print(f"[WARN] API 5xx error on page {page_num}, attempt {attempt+1}: {response.text}")
-                time.sleep(2 ** attempt)
-            else:
-                print(f"[ERROR] API error {response.status_code} on page {page_num}: {response.text}")
-                break
-        except Exception as e:
-            print(f"[ERROR] Exception on page {page_num}, attempt {attempt+1}: {e}")
-            time.sleep(2 ** attempt)
-    return ""
+    with instrument.span("llm.chat", label=label):
+        result, response = llm_cache.cached_post(CHAT_URL, data, headers=headers, label=label)
+    instrument.count("llm.requests")
+    if result is None:
+        if response is not None:
+            print(f"[ERROR] API error {response.status_code} on {label}: {response.text}")
+        if raise_errors:
+            raise RuntimeError(f"API request failed for {label}")
+        return ""
+    usage = result.get("usage", {})
+    print(f"  [INFO] Tokens used: prompt={usage.get('prompt_tokens')}, completion={usage.get('completion_tokens')}")
+    instrument.count("llm.prompt_tokens", usage.get("prompt_tokens") or 0)
+    instrument.count("llm.completion_tokens", usage.get("completion_tokens") or 0)
+    return strip_code_fences(result.get("choices", [{}])[0].get("message", {}).get("content", "").strip())
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 convert_pdfs.py <folder_of_single_page_pdfs> [output_folder]")
-        sys.exit(1)
-    pdf_folder = sys.argv[1]
-    output_folder = sys.argv[2] if len(sys.argv) > 2 else pdf_folder.rstrip("/") + "_md"
-    os.makedirs(output_folder, exist_ok=True)
+def openai_pdf_to_obsidian(text, page_num, raise_errors=False):
+    prompt = (
+        "Convert the following PDF page text into clean, well-structured Obsidian Markdown.\n"
+        "\n"
+        f"{MARKDOWN_RULES}"
+        "If the page is mostly blank or not useful, return an empty string.\n\n"
+        f"Page {page_num} text:\n{text}\n\nMarkdown:"
+    )
+    return chat_completion(prompt, MAX_TOKENS, f"page {page_num}", raise_errors)
+
+def split_batch_response(content, page_nums):
+    """Split a multi-page response on its <!-- PAGE N --> markers.
+
+    Returns {page_num: markdown}, or None unless every requested page appears
+    exactly once, in order.
+    """
+    markers = list(PAGE_MARKER_RE.finditer(content))
+    if [int(m.group(1)) for m in markers] != list(page_nums):
+        return None
+    pages = {}
+    for i, m in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(content)
+        pages[page_nums[i]] = content[m.end():end].strip()
+    return pages
+
+def openai_pages_to_obsidian(pages):
+    """Convert several (page_num, text) pages in one request.
+
+    Returns {page_num: markdown}, or None if the response could not be split.
+    """
+    page_nums = [page_num for page_num, _ in pages]
+    sections = "".join(f"=== PAGE {page_num} ===\n{text}\n\n" for page_num, text in pages)
+    prompt = (
+        f"Convert each of the following {len(pages)} PDF pages into clean, well-structured Obsidian Markdown.\n"
+        "Each page's text starts with a line `=== PAGE N ===`. Convert every page separately.\n"
+        "For each page, in the same order, output a line `<!-- PAGE N -->` (with N the page number) followed by that page's Markdown.\n"
+        "Do not merge content across pages and do not omit any marker.\n"
+        "\n"
+        f"{MARKDOWN_RULES}"
+        "If a page is mostly blank or not useful, output only its marker.\n\n"
+        f"{sections}Markdown:"
+    )
+    label = f"pages {page_nums[0]}-{page_nums[-1]}"
+    content = chat_completion(prompt, min(MAX_TOKENS * len(pages), MAX_BATCH_TOKENS), label)
+    return split_batch_response(content, page_nums) if content else None
+
+def convert_batch(pages):
+    """Convert a batch of pages, falling back to one request per page if the
+    multi-page response can't be split reliably. Returns {page_num: markdown}."""
+    if len(pages) > 1:
+        result = openai_pages_to_obsidian(pages)
+        if result is not None:
+            return result
+        print(f"  [WARN] Could not split response for pages {pages[0][0]}-{pages[-1][0]}, falling back to per-page requests")
+    return {page_num: openai_pdf_to_obsidian(text, page_num) for page_num, text in pages}
+
+def pack_batches(page_texts, token_budget):
+    """Group consecutive (page_num, text) pages into batches of about token_budget input tokens."""
+    batch = []
+    batch_tokens = 0
+    for page_num, text in page_texts:
+        tokens = len(text) // 4
+        if batch and batch_tokens + tokens > token_budget:
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((page_num, text))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+class Progress:
+    """Completed-page counter with a throughput/ETA readout."""
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    def step(self, label):
+        self.done += 1
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        print(f"  [PROGRESS] {self.done}/{self.total} pages ({rate:.2f} pages/s, ETA {eta:.0f}s) {label}")
+
+def write_markdown(md_file, md):
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(md)
+        instrument.count("markdown.bytes_written", f.tell())
+    instrument.count("pages.converted")
+    print(f"  -> {md_file}")
+
+def pending_pages(pdf_folder, output_folder):
+    """(page_num, pdf_path, md_file) for every page whose markdown does not exist yet."""
     pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.endswith('.pdf'))
+    pending = []
     for idx, pdf_file in enumerate(pdf_files):
-        page_num = idx + 1
-        pdf_path = os.path.join(pdf_folder, pdf_file)
         md_file = os.path.join(output_folder, os.path.splitext(pdf_file)[0] + ".md")
         if os.path.exists(md_file):
             print(f"  [SKIP] {md_file} already exists, skipping.")
             continue
-        print(f"Processing {pdf_file} ...")
-        text = pdf_page_to_text(pdf_path)
-        if not text.strip():
-            print("  (No text extracted, skipping)")
-            continue
-        md = openai_pdf_to_obsidian(text, page_num)
-        if not md.strip():
-            print("  (No markdown returned, skipping)")
+        pending.append((idx + 1, os.path.join(pdf_folder, pdf_file), md_file))
+    return pending
+
+def convert_page(page_num, text, md_file):
+    """API call + write for one page of already extracted text (serial mode)."""
+    if not text.strip():
+        print("  (No text extracted, skipping)")
+        return
+    md = openai_pdf_to_obsidian(text, page_num)
+    if not md.strip():
+        print("  (No markdown returned, skipping)")
+        return
+    write_markdown(md_file, md)
+    print("  ✓ Success")
+    # Rate limiting and backoff are handled in the API call
+
+def convert_serial(pending):
+    for page_num, pdf_path, md_file in pending:
+        print(f"Processing {os.path.basename(pdf_path)} ...")
+        convert_page(page_num, pdf_page_to_text(pdf_path), md_file)
+
+def _extract_files(items):
+    # Module-level so the process pool can pickle it; items are (page_num, pdf_path)
+    with instrument.span("extract_text", pages=len(items)):
+        texts = [(page_num, pdf_page_to_text(pdf_path)) for page_num, pdf_path in items]
+    instrument.flush()
+    return texts
+
+def convert_parallel(extract_jobs, md_files, workers, extract_workers=None):
+    """Pipelined conversion.
+
+    extract_jobs: (function, args) pairs, each returning a list of (page_num, text).
+    They run in a process pool (or on the API threads when extract_workers == 0),
+    at most `workers` API requests are in flight, and each page's markdown is
+    written to md_files[page_num] as soon as its response arrives.
+    """
+    progress = Progress(len(md_files))
+    extract_pool = ProcessPoolExecutor(extract_workers) if extract_workers != 0 else None
+    with ThreadPoolExecutor(max_workers=workers) as api_pool:
+        try:
+            running = {}
+            for fn, args in extract_jobs:
+                pool = extract_pool or api_pool
+                running[pool.submit(fn, *args)] = None
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    page_num = running.pop(future)
+                    if page_num is None:
+                        # Extraction finished: hand every non-empty page to the API pool
+                        for extracted_page, text in future.result():
+                            if not text.strip():
+                                progress.step(f"{os.path.basename(md_files[extracted_page])}: no text extracted, skipping")
+                                continue
+                            running[api_pool.submit(openai_pdf_to_obsidian, text, extracted_page)] = extracted_page
+                        continue
+                    name = os.path.basename(md_files[page_num])
+                    md = future.result()
+                    if not md.strip():
+                        progress.step(f"{name}: no markdown returned, skipping")
+                        continue
+                    write_markdown(md_files[page_num], md)
+                    progress.step(f"{name} ✓")
+        finally:
+            if extract_pool is not None:
+                extract_pool.shutdown()
+    elapsed = time.perf_counter() - progress.start
+    print(f"[INFO] Processed {progress.done} pages in {elapsed:.1f}s ({progress.done / elapsed if elapsed else 0:.2f} pages/s)")
+
+def convert_batched(page_texts, md_files, token_budget, workers=1):
+    """Batched conversion: pack consecutive pages of text into multi-page requests
+    of about token_budget input tokens, with at most `workers` requests in flight,
+    and split each response back into the per-page markdown files."""
+    progress = Progress(len(md_files))
+
+    def non_empty(pages):
+        for page_num, text in pages:
+            if text.strip():
+                yield page_num, text
+            else:
+                progress.step(f"{os.path.basename(md_files[page_num])}: no text extracted, skipping")
+
+    def write_results(futures):
+        for future in futures:
+            for page_num, md in sorted(future.result().items()):
+                name = os.path.basename(md_files[page_num])
+                if not md.strip():
+                    progress.step(f"{name}: no markdown returned, skipping")
+                    continue
+                write_markdown(md_files[page_num], md)
+                progress.step(f"{name} ✓")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        for batch in pack_batches(non_empty(page_texts), token_budget):
+            running.add(pool.submit(convert_batch, batch))
+            # Write whatever has finished while the next pages are being extracted
+            done = {f for f in running if f.done()}
+            running -= done
+            write_results(done)
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            write_results(done)
+    elapsed = time.perf_counter() - progress.start
+    print(f"[INFO] Processed {progress.done} pages in {elapsed:.1f}s ({progress.done / elapsed if elapsed else 0:.2f} pages/s)")
+
+@instrument.timed("convert_folder")
+def convert_folder(pdf_folder, output_folder, workers=1, extract_workers=None, batch_tokens=None):
+    os.makedirs(output_folder, exist_ok=True)
+    pending = pending_pages(pdf_folder, output_folder)
+    if batch_tokens:
+        page_texts = ((page_num, pdf_page_to_text(pdf_path)) for page_num, pdf_path, _ in pending)
+        convert_batched(page_texts, {page_num: md_file for page_num, _, md_file in pending}, batch_tokens, workers)
+    elif workers > 1:
+        jobs = [(_extract_files, ([(page_num, pdf_path)],)) for page_num, pdf_path, _ in pending]
+        convert_parallel(jobs, {page_num: md_file for page_num, _, md_file in pending}, workers, extract_workers)
+    else:
+        convert_serial(pending)
+    print(rate_limit.get_limiter().report())
+    print(llm_cache.get_cache().report())
+
+@instrument.timed("convert_book")
+def convert_book(pdf_path, output_folder, workers=1, extract_workers=None, pages_dir=None, chunk_size=BOOK_CHUNK_SIZE, batch_tokens=None):
+    """Convert a whole book PDF without split per-page files.
+
+    The book is opened once (once per extraction worker in parallel mode) and
+    page_XXXX.md names match split_pdf's page_XXXX.pdf numbering.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    total_pages = pdf_ingest.page_count(pdf_path)
+    md_files = {}
+    for page_num in range(1, total_pages + 1):
+        md_file = os.path.join(output_folder, f"page_{pad_page_number(page_num, total_pages)}.md")
+        if os.path.exists(md_file):
+            print(f"  [SKIP] {md_file} already exists, skipping.")
             continue
-        with open(md_file, "w", encoding="utf-8") as f:
-            f.write(md)
-        print(f"  -> {md_file}")
-        print("  ✓ Success")
-        # Exponential backoff is handled in the API call
+        md_files[page_num] = md_file
+    pages = sorted(md_files)
+    if batch_tokens:
+        records = pdf_ingest.iter_pages(pdf_path, pages, pages_dir=pages_dir)
+        convert_batched(((r.page_number, r.text) for r in records), md_files, batch_tokens, workers)
+    elif workers > 1:
+        jobs = [(pdf_ingest.extract_pages, (pdf_path, pages[i:i + chunk_size], pages_dir))
+                for i in range(0, len(pages), chunk_size)]
+        convert_parallel(jobs, md_files, workers, extract_workers)
+    else:
+        for record in pdf_ingest.iter_pages(pdf_path, pages, pages_dir=pages_dir):
+            print(f"Processing page {record.page_number} ...")
+            convert_page(record.page_number, record.text, md_files[record.page_number])
+    print(rate_limit.get_limiter().report())
+    print(llm_cache.get_cache().report())
+
+def main():
+    args = sys.argv[1:]
+    if "--no-cache" in args:
+        args.remove("--no-cache")
+        llm_cache.disable()
+    options = {"--workers": 1, "--extract-workers": None, "--write-pages": None, "--batch-tokens": None}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if len(args) < 1:
+        print("Usage: python3 convert_pdfs.py [--workers N] [--extract-workers N] [--write-pages DIR] [--batch-tokens N] [--no-cache] <book.pdf | folder_of_single_page_pdfs> [output_folder]")
+        sys.exit(1)
+    source = args[0]
+    workers = int(options["--workers"])
+    extract_workers = int(options["--extract-workers"]) if options["--extract-workers"] is not None else None
+    # --batch-tokens N packs consecutive pages into one request of about N input tokens
+    batch_tokens = int(options["--batch-tokens"]) if options["--batch-tokens"] is not None else None
+    if os.path.isfile(source) and source.lower().endswith(".pdf"):
+        # Single-pass mode: read the book directly, optionally writing per-page PDFs
+        output_folder = args[1] if len(args) > 1 else os.path.splitext(source)[0] + "_pages_md"
+        convert_book(source, output_folder, workers=workers, extract_workers=extract_workers, pages_dir=options["--write-pages"], batch_tokens=batch_tokens)
+    else:
+        output_folder = args[1] if len(args) > 1 else source.rstrip("/") + "_md"
+        convert_folder(source, output_folder, workers=workers, extract_workers=extract_workers, batch_tokens=batch_tokens)
 
 if __name__ == "__main__":
     main()
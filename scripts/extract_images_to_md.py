@@ -1,44 +1,110 @@
 import fitz  # PyMuPDF
+import hashlib
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import re
 
-def extract_images_from_pdf(pdf_path, md_dir):
+import instrument
+
+# Pages per worker task
+CHUNK_SIZE = 32
+
+def write_image(md_dir, image_bytes, ext):
+    """Store image bytes content-addressed as img_<sha256 prefix>.<ext>; returns the file name."""
+    image_name = f"img_{hashlib.sha256(image_bytes).hexdigest()[:16]}.{ext}"
+    image_path = md_dir / image_name
+    if not image_path.exists():
+        # Write-then-rename so concurrent workers never expose a partial file
+        tmp_path = image_path.with_name(f".{image_name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as imgf:
+            imgf.write(image_bytes)
+        os.replace(tmp_path, image_path)
+        instrument.count("images.bytes_written", len(image_bytes))
+    return image_name
+
+def _extract_pages(pdf_path, md_dir, page_numbers):
+    md_dir = Path(md_dir)
     pdf = fitz.open(pdf_path)
-    for page_num in range(len(pdf)):
-        page = pdf[page_num]
-        images = page.get_images(full=True)
-        if not images:
-            continue
-        # Markdown file for this page
-        md_file = md_dir / f"page_{str(page_num+1).zfill(4)}.md"
-        if not md_file.exists():
-            continue
-        with open(md_file, 'a', encoding='utf-8') as md:
-            for i, img in enumerate(images):
+    names_by_xref = {}
+    occurrences = 0
+    try:
+        for page_num in page_numbers:
+            # Markdown file for this page
+            md_file = md_dir / f"page_{str(page_num+1).zfill(4)}.md"
+            if not md_file.exists():
+                continue
+            images = pdf[page_num].get_images(full=True)
+            if not images:
+                continue
+            names = []
+            for img in images:
                 xref = img[0]
-                base_image = pdf.extract_image(xref)
-                ext = base_image['ext']
-                image_bytes = base_image['image']
-                # Try to get a meaningful name from the image info or fallback
-                name_hint = base_image.get('name', f"img{i+1}")
-                # Clean up name_hint for filesystem
-                name_hint = re.sub(r'[^a-zA-Z0-9_-]', '_', name_hint)
-                image_name = f"page_{str(page_num+1).zfill(4)}_{name_hint}.{ext}"
-                image_path = md_dir / image_name
-                with open(image_path, 'wb') as imgf:
-                    imgf.write(image_bytes)
-                # Add standard Markdown image reference at the end of the markdown file
-                md.write(f"\n![{image_name}]({image_name})\n")
-    print(f"Images extracted and references added to markdown in {md_dir}/")
+                occurrences += 1
+                if xref not in names_by_xref:
+                    base_image = pdf.extract_image(xref)
+                    names_by_xref[xref] = write_image(md_dir, base_image['image'], base_image['ext'])
+                if names_by_xref[xref] not in names:
+                    names.append(names_by_xref[xref])
+            # Add standard Markdown image references at the end of the markdown file (once)
+            existing = md_file.read_text(encoding='utf-8')
+            refs = [f"\n![{name}]({name})\n" for name in names if f"]({name})" not in existing]
+            if refs:
+                with open(md_file, 'a', encoding='utf-8') as md:
+                    md.write("".join(refs))
+    finally:
+        pdf.close()
+    return occurrences, names_by_xref
+
+def _extract_range(pdf_path, md_dir, page_numbers):
+    """Extract images for the given 0-based pages; returns (occurrences, set of image file names)."""
+    with instrument.span("extract_images.chunk", pages=len(page_numbers)):
+        occurrences, names_by_xref = _extract_pages(pdf_path, md_dir, page_numbers)
+    instrument.count("images.occurrences", occurrences)
+    instrument.count("images.decoded", len(names_by_xref))
+    # Process-pool workers exit without atexit handlers
+    instrument.flush()
+    return occurrences, set(names_by_xref.values())
+
+def extract_page_images(pdf_path, md_dir, page_num):
+    """Extract the images of one 1-based page and reference them from its markdown; returns the occurrence count."""
+    return _extract_range(str(pdf_path), str(md_dir), [page_num - 1])[0]
+
+@instrument.timed("extract_images_from_pdf")
+def extract_images_from_pdf(pdf_path, md_dir, workers=1, chunk_size=CHUNK_SIZE):
+    """Extract page images into md_dir and reference them from page_XXXX.md.
+
+    Each image xref is decoded once per worker and stored under a content hash,
+    so an image reused on many pages is written once and shared by every page.
+    With workers > 1, page ranges are processed in separate processes.
+    """
+    with fitz.open(pdf_path) as pdf:
+        total_pages = len(pdf)
+    chunks = [range(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_extract_range, [str(pdf_path)] * len(chunks), [str(md_dir)] * len(chunks), chunks))
+    else:
+        results = [_extract_range(str(pdf_path), str(md_dir), range(total_pages))]
+    occurrences = sum(r[0] for r in results)
+    # Images of this PDF only, not whatever earlier runs left in md_dir
+    unique = len(set().union(*(r[1] for r in results)))
+    print(f"Images extracted and references added to markdown in {md_dir}/ "
+          f"({occurrences} image occurrences, {unique} unique image files)")
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 extract_images_to_md.py <pdf_path> <md_dir>")
+    args = sys.argv[1:]
+    workers = 1
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    if len(args) < 2:
+        print("Usage: python3 extract_images_to_md.py [--workers N] <pdf_path> <md_dir>")
         sys.exit(1)
-    pdf_path = Path(sys.argv[1])
-    md_dir = Path(sys.argv[2])
-    extract_images_from_pdf(pdf_path, md_dir)
+    pdf_path = Path(args[0])
+    md_dir = Path(args[1])
+    extract_images_from_pdf(pdf_path, md_dir, workers=workers)
 
 if __name__ == "__main__":
     main()
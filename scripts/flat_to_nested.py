@@ -2,6 +2,8 @@ import json
 import sys
 from pathlib import Path
 
+from section_index import SectionIndex
+
 def insert_nested(d, keys, pages):
     key = keys[0]
     if key not in d:
@@ -12,12 +14,11 @@ def insert_nested(d, keys, pages):
     insert_nested(d[key]["children"], keys[1:], pages)
 
 def flat_to_nested(flat_index):
+    """Nested {title: {"pages", "children"}} view of an index (either index.json format)."""
+    index = flat_index if isinstance(flat_index, SectionIndex) else SectionIndex.from_dict(flat_index)
     nested = {}
-    for k, v in flat_index.items():
-        if k == "__all_pages__":
-            continue
-        keys = k.split(" > ")
-        insert_nested(nested, keys, v)
+    for path, start, end in zip(index.paths, index.starts, index.ends):
+        insert_nested(nested, path, range(start, end + 1))
     return nested
 
 def main():
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Cache of per-problem PDF fragments, and assembly of documents from them.
+
+Each problem is compiled on its own, as an exam question or with its solution,
+into build/fragments/<key>.pdf, where the key hashes the problem text, the
+variant, its question number and the document preamble. Fragments use the same
+static preamble as the generated documents (so they share the precompiled
+format and fonts) and keep the exam class's own question label, numbered for
+the position the problem has in the document. Each fragment is compiled with
+the problem's directory on \input@path, so \input and \includegraphics paths
+relative to the problem resolve as they would next to it. A document's title
+block (\maketitle and the section heading) is compiled as a fragment too.
+
+A document is assembled by cropping each fragment to its content and stacking
+the fragments on letter pages below the title block, so building a quiz from
+an already-compiled bank needs no full LaTeX run. In exam documents the space
+left on a page is shared out after each question, as the \vfill between
+questions does.
+
+This is an approximation of the pdflatex output, not a replacement: text,
+fonts and labels are LaTeX's, but page breaks fall between questions (a
+question is only split across pages when it is longer than a page) and the
+space between stacked fragments is a fixed gap rather than TeX's glue. Use
+--compile for the exact documents.
+
+Usage:
+    python3 scripts/fragment_cache.py [--solutions] [--jobs N] --title TITLE --out quiz.pdf problem1.tex ...
+"""
+import hashlib
+import os
+import shutil
+import sys
+
+import fitz  # PyMuPDF
+
+import compile_tex
+import tex_format
+
+FRAGMENT_ROOT = os.path.join("build", "fragments")
+VARIANTS = ("exam", "solutions")
+
+FRAGMENT_BODY = r"""\pagestyle{empty}
+\makeatletter
+\def\input@path{{%(resource_dir)s/}}
+\makeatother
+
+\begin{document}
+\begin{questions}
+\setcounter{question}{%(previous)d}
+%(question)s
+\end{questions}
+\end{document}
+"""
+
+# Assembly layout, in PDF points (letter paper, 1in margins)
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 72
+GAP = 12
+
+def resource_dir(problem_path, src_dir):
+    """Directory of problem_path relative to where fragments are compiled, with TeX's separators."""
+    return os.path.relpath(os.path.dirname(os.path.abspath(problem_path)), os.path.abspath(src_dir)).replace(os.sep, "/")
+
+class FragmentCache:
+    """Compiled problem and title fragments, keyed by content hash.
+
+    templates maps each variant to the document template; fragments are compiled
+    with its static preamble (everything up to the endofdump marker) and title
+    blocks with the template itself.
+    """
+    def __init__(self, templates, margin="1in", author="", date="", root=FRAGMENT_ROOT):
+        self.root = root
+        self.src_dir = os.path.join(root, "src")
+        self.templates = templates
+        self.margin = margin
+        self.author = author
+        self.date = date
+        self.preambles = {
+            variant: template.split(tex_format.ENDOFDUMP)[0].format(margin=margin) + tex_format.ENDOFDUMP + "\n"
+            for variant, template in templates.items()
+        }
+
+    def problem_source(self, problem_path, variant, number):
+        with open(problem_path, "r", encoding="utf-8") as f:
+            question = f.read()
+        return self.preambles[variant] + FRAGMENT_BODY % {
+            "resource_dir": resource_dir(problem_path, self.src_dir),
+            "previous": number - 1,
+            "question": question.rstrip("\n"),
+        }
+
+    def title_source(self, variant, title):
+        # The template down to its questions, on a page without header or footer
+        head = self.templates[variant].format(exam_title=title, sol_title=title, author=self.author, date=self.date,
+                                              margin=self.margin, questions="\0").split("\0")[0]
+        return head[:head.index(r"\begin{questions}")] + "\\thispagestyle{empty}\n\\end{document}\n"
+
+    def key(self, source, variant):
+        h = hashlib.sha256(variant.encode("ascii") + b"\0" + source.encode("utf-8"))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ".pdf")
+
+    def build(self, sources, jobs=None, fmt_dir=tex_format.FMT_DIR):
+        """Compile the fragments that are not cached yet.
+
+        sources: {name: (variant, LaTeX source)}. Returns ({name: fragment pdf},
+        [CompileResult of failed fragments]).
+        """
+        fragments = {}
+        pending = {}
+        for name, (variant, source) in sources.items():
+            key = self.key(source, variant)
+            fragments[name] = self.path(key)
+            if not os.path.exists(self.path(key)):
+                pending.setdefault(key, source)
+        failed = []
+        if pending:
+            os.makedirs(self.src_dir, exist_ok=True)
+            tex_files = {}
+            for key, source in pending.items():
+                tex_path = os.path.join(self.src_dir, key + ".tex")
+                with open(tex_path, "w", encoding="utf-8") as f:
+                    f.write(source)
+                tex_files[tex_path] = key
+            out_root = os.path.join(self.root, "out")
+            for result in compile_tex.compile_all(list(tex_files), jobs=jobs, out_root=out_root, fmt_dir=fmt_dir):
+                key = tex_files[result.tex_path]
+                pdf = os.path.join(result.output_dir, key + ".pdf")
+                if result.success and os.path.exists(pdf):
+                    os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+                    shutil.copyfile(pdf, self.path(key))
+                else:
+                    failed.append(result)
+        print(f"[INFO] Fragments: {len(fragments) - len(pending)} cached, {len(pending) - len(failed)} compiled, {len(failed)} failed.")
+        return fragments, failed
+
+    def build_documents(self, documents, jobs=None, fmt_dir=tex_format.FMT_DIR):
+        """Compile the missing fragments of every document, then assemble them.
+
+        documents: (pdf_path, variant, problem_paths, title) tuples. All fragments
+        are compiled in one batch. Returns the failed CompileResults; nothing is
+        assembled if any fragment fails.
+        """
+        sources = {}
+        for _, variant, problem_paths, title in documents:
+            sources[("title", variant, title)] = (variant, self.title_source(variant, title))
+            for number, problem_path in enumerate(problem_paths, 1):
+                name = (problem_path, variant, number)
+                if name not in sources:
+                    sources[name] = (variant, self.problem_source(problem_path, variant, number))
+        fragments, failed = self.build(sources, jobs=jobs, fmt_dir=fmt_dir)
+        if failed:
+            return failed
+        for pdf_path, variant, problem_paths, title in documents:
+            assemble(fragments[("title", variant, title)],
+                     [fragments[(p, variant, n)] for n, p in enumerate(problem_paths, 1)],
+                     pdf_path, vfill=variant == "exam")
+        return []
+
+def content_rect(page):
+    """Bounding box of everything drawn on page, or None for a blank page."""
+    rects = [fitz.Rect(block[:4]) for block in page.get_text("blocks")]
+    rects += [drawing["rect"] for drawing in page.get_drawings()]
+    rects += [info["bbox"] for info in page.get_image_info()]
+    rects = [r for r in rects if not r.is_empty]
+    if not rects:
+        return None
+    clip = rects[0]
+    for r in rects[1:]:
+        clip |= r
+    return (clip + (-2, -2, 2, 2)) & page.rect
+
+def assemble(title_pdf, fragment_pdfs, out_path, vfill=False):
+    """Stack the cropped title block and problem fragments into out_path.
+
+    With vfill, the space left at the bottom of each page is shared out equally
+    after every question that ends on it, as \vfill does in exam documents.
+    """
+    out = fitz.open()
+    bottom = PAGE_HEIGHT - MARGIN
+    placed = []  # (clip, src, pno, height, ends a question) on the current page
+    y = MARGIN
+
+    def flush():
+        ends = sum(1 for *_, question_end in placed if question_end)
+        stretch = (bottom - y + GAP) / ends if vfill and ends and y > MARGIN else 0
+        page = out.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        top = MARGIN
+        for clip, src, pno, height, question_end in placed:
+            # Keep the fragment's horizontal position, so hanging labels stay in the margin
+            page.show_pdf_page(fitz.Rect(clip.x0, top, clip.x1, top + height), src, pno, clip=clip)
+            top += height + GAP + (stretch if question_end else 0)
+        placed.clear()
+
+    sources = []
+    try:
+        for i, fragment_pdf in enumerate([title_pdf] + list(fragment_pdfs)):
+            src = fitz.open(fragment_pdf)
+            sources.append(src)
+            pieces = [(pno, content_rect(src[pno])) for pno in range(src.page_count)]
+            pieces = [(pno, clip) for pno, clip in pieces if clip is not None]
+            for j, (pno, clip) in enumerate(pieces):
+                if y + clip.height > bottom and placed:
+                    flush()
+                    y = MARGIN
+                # Scale down only if taller than a page
+                height = min(clip.height, bottom - y)
+                placed.append((clip, src, pno, height, i > 0 and j == len(pieces) - 1))
+                y += height + GAP
+        if placed or out.page_count == 0:
+            flush()
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        out.save(out_path, garbage=3, deflate=True)
+    finally:
+        out.close()
+        for src in sources:
+            src.close()
+    return out_path
+
+def build_document(cache, problem_paths, variant, out_path, title, jobs=None, fmt_dir=tex_format.FMT_DIR):
+    """Compile missing fragments for problem_paths and assemble them. Returns out_path, or None on failure."""
+    failed = cache.build_documents([(out_path, variant, problem_paths, title)], jobs=jobs, fmt_dir=fmt_dir)
+    if failed:
+        for r in failed:
+            print(f"[ERROR] Fragment {r.tex_path} failed to compile.")
+        return None
+    return out_path
+
+def main():
+    import generate_all_banks_tex as gen
+
+    args = sys.argv[1:]
+    options = {"--jobs": None, "--title": "", "--out": None}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    variant = "exam"
+    if "--solutions" in args:
+        args.remove("--solutions")
+        variant = "solutions"
+    if not args or not options["--out"]:
+        print("Usage: python3 fragment_cache.py [--solutions] [--jobs N] --title TITLE --out quiz.pdf problem1.tex ...")
+        sys.exit(1)
+    cache = FragmentCache({"exam": gen.EXAM_TEMPLATE, "solutions": gen.SOL_TEMPLATE}, gen.MARGIN, gen.AUTHOR, gen.DATE)
+    jobs = int(options["--jobs"]) if options["--jobs"] else None
+    if build_document(cache, args, variant, options["--out"], options["--title"], jobs=jobs) is None:
+        sys.exit(1)
+    print(f"Assembled {len(args)} problems into {options['--out']}.")
+
+if __name__ == "__main__":
+    main()
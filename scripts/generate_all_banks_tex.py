@@ -1,14 +1,22 @@
 import os
 import random
+import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import build_cache
+import compile_tex
+import instrument
+import problem_bank
+import tex_format
 
 # === CONFIGURABLE CONSTANTS ===
 SRC_ROOT = "src"
 BUILD_ROOT = "build"
 BANKS_ROOT = os.path.join(SRC_ROOT, "banks")
-BANK_DIRS = [os.path.join(BANKS_ROOT, "Bank1"), os.path.join(BANKS_ROOT, "Bank2")]
-PROBLEM_PREFIX = "problem"
-PROBLEM_SUFFIX = ".tex"
+# Banks are discovered at run time: every directory under BANKS_ROOT
+# Fewer banks than this are rendered in-process; a worker pool costs more than it saves
+PARALLEL_MIN_BANKS = 4
 EXAM_TITLE = "Sample Exam"
 SOL_TITLE = "Sample Exam Solutions"
 ALL_TITLE = "All Problems"
@@ -23,6 +31,7 @@ EXAM_TEMPLATE = r"""% main.tex - Auto-generated LaTeX file
 \usepackage{{amssymb}}
 \usepackage{{amsmath}}
 \usepackage[margin={margin}]{{geometry}}
+\csname endofdump\endcsname
 \title{{{exam_title}}}
 \author{{{author}}}
 \date{{{date}}}
@@ -43,6 +52,7 @@ SOL_TEMPLATE = r"""% main_solutions.tex - Auto-generated LaTeX file
 \usepackage{{amssymb}}
 \usepackage{{amsmath}}
 \usepackage[margin={margin}]{{geometry}}
+\csname endofdump\endcsname
 \title{{{sol_title}}}
 \author{{{author}}}
 \date{{{date}}}
@@ -57,36 +67,87 @@ SOL_TEMPLATE = r"""% main_solutions.tex - Auto-generated LaTeX file
 \end{{document}}
 """
 
-def get_problem_files(bank_dir):
-    files = [f for f in os.listdir(bank_dir) if f.startswith(PROBLEM_PREFIX) and f.endswith(PROBLEM_SUFFIX)]
-    files.sort(key=lambda x: int(x[len(PROBLEM_PREFIX):-len(PROBLEM_SUFFIX)]))
-    return [os.path.join(bank_dir, f) for f in files]
-
-def write_tex(filename, template, questions, title, author, date, margin, directory=None):
-    tex_content = template.format(
-        exam_title=title,
-        sol_title=title,
-        author=author,
-        date=date,
-        margin=margin,
-        questions=questions
-    )
-    if directory:
-        os.makedirs(directory, exist_ok=True)
-        filename = os.path.join(directory, filename)
-    with open(filename, "w") as f:
-        f.write(tex_content)
-
-def check_generated_files():
-    """Check that all expected .tex files exist and are non-empty."""
+def append_file(f, src):
+    """Append the open binary file src to the text file f, zero-copy via sendfile where possible."""
+    size = os.fstat(src.fileno()).st_size
+    f.flush()
+    offset = 0
+    try:
+        while offset < size:
+            sent = os.sendfile(f.fileno(), src.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+    except (AttributeError, OSError):
+        # No sendfile between regular files on this platform: bulk copy instead
+        src.seek(offset)
+        shutil.copyfileobj(src, f.buffer)
+        f.buffer.flush()
+
+def write_tex_streams(documents, files, author=AUTHOR, date=DATE, margin=MARGIN, exam_template=EXAM_TEMPLATE,
+                      bundle=False):
+    """Write several documents over the same problems in a single pass over `files`.
+
+    documents: (out_path, template, title) tuples. Each template is split around
+    its questions: the header is written first, then an \\input line per problem
+    is streamed to every document, then the footer, so no document is ever built
+    up as one string in memory. Documents using exam_template get \\vfill after
+    every question.
+
+    With bundle=True the problem files are copied into the documents instead of
+    \\input, each preceded by a "% source: <path>" comment for mapping errors back.
+    """
+    streams = []
+    try:
+        for out_path, template, title in documents:
+            out_dir = os.path.dirname(out_path)
+            if out_dir:
+                os.makedirs(out_dir, exist_ok=True)
+            # Render the template around a placeholder, then split it into header and footer
+            head, tail = template.format(exam_title=title, sol_title=title, author=author, date=date,
+                                         margin=margin, questions="\0").split("\0")
+            f = open(out_path, "w")
+            streams.append((f, out_dir or os.curdir, template is exam_template, tail))
+            f.write(head)
+        first = True
+        for fname in files:
+            if bundle:
+                with open(fname, "rb") as src:
+                    size = os.fstat(src.fileno()).st_size
+                    src.seek(max(size - 1, 0))
+                    newline = "" if src.read(1) in (b"\n", b"") else "\n"
+                    for f, _, exam, _ in streams:
+                        f.write(f"% source: {fname}\n")
+                        append_file(f, src)
+                        f.write(newline + ("\\vfill\n" if exam else ""))
+                first = False
+                continue
+            # Use correct relative path for \input relative to the generated file
+            lines = {}
+            for f, out_dir, exam, _ in streams:
+                if out_dir not in lines:
+                    lines[out_dir] = f"    \\input{{{os.path.relpath(fname, out_dir)}}}"
+                if exam:
+                    f.write(lines[out_dir] + "\n\\vfill\n")
+                else:
+                    f.write(lines[out_dir] if first else "\n" + lines[out_dir])
+            first = False
+        for f, _, exam, tail in streams:
+            if exam and first:
+                f.write("\n\\vfill\n")
+            f.write(tail)
+    finally:
+        for stream in streams:
+            stream[0].close()
+
+def check_generated_files(bank_dirs=None):
+    """Check that all expected .tex files exist and are non-empty (for every bank by default)."""
     success = True
     missing = []
     empty = []
     # Per-bank files
-    for bank_dir in BANK_DIRS:
-        build_bank_dir = os.path.join(BUILD_ROOT, os.path.relpath(bank_dir, SRC_ROOT))
-        for suffix in ["_all.tex", "_all_solutions.tex"]:
-            fname = os.path.join(build_bank_dir, os.path.basename(bank_dir) + suffix)
+    for bank_dir in problem_bank.discover_banks(BANKS_ROOT) if bank_dirs is None else bank_dirs:
+        for fname, _, _ in bank_documents(bank_dir):
             if not os.path.exists(fname):
                 missing.append(fname)
                 success = False
@@ -103,41 +164,155 @@ def check_generated_files():
             success = False
     return success, missing, empty
 
+@instrument.timed("emit_documents")
+def emit_documents(documents, files, cache=None, bundle=False):
+    """Write the (out_path, template, title) documents whose inputs changed, in one pass over files.
+
+    Without a build cache every document is written. Returns the paths written.
+    """
+    stale = []
+    digests = {}
+    for out_path, template, title in documents:
+        if cache is not None:
+            params = [template, title, AUTHOR, DATE, MARGIN, out_path] + (["bundle"] if bundle else [])
+            digests[out_path] = cache.digest(files, params)
+            if not cache.needs_write(out_path, digests[out_path]):
+                continue
+        stale.append((out_path, template, title))
+    if stale:
+        write_tex_streams(stale, files, bundle=bundle)
+    if cache is not None:
+        for out_path, _, _ in stale:
+            cache.mark_written(out_path, digests[out_path])
+    instrument.count("tex.documents_written", len(stale))
+    return [out_path for out_path, _, _ in stale]
+
+def bank_documents(bank_dir):
+    """The (out_path, template, title) documents generated for one bank."""
+    build_bank_dir = os.path.join(BUILD_ROOT, os.path.relpath(bank_dir, SRC_ROOT))
+    bank_name = os.path.basename(bank_dir)
+    return [
+        (os.path.join(build_bank_dir, f"{bank_name}_all.tex"), EXAM_TEMPLATE, f"{bank_name} Problems"),
+        (os.path.join(build_bank_dir, f"{bank_name}_all_solutions.tex"), SOL_TEMPLATE, f"{bank_name} Problems with Solutions"),
+    ]
+
+def render_bank(bank_dir, cache=None, bundle=False):
+    """Index one bank and write its documents (worker task).
+
+    cache is the bank's part of the build manifest (BuildCache.split), or None
+    for a full build. Returns (problem files, paths written, updated cache part).
+    """
+    if cache is not None:
+        bank = problem_bank.ProblemBank.load(bank_dir, problem_bank.default_index_path(bank_dir))
+    else:
+        bank = problem_bank.ProblemBank.scan(bank_dir)
+    files = bank.files()
+    written = emit_documents(bank_documents(bank_dir), files, cache, bundle) if files else []
+    # Process-pool workers exit without atexit handlers
+    instrument.flush()
+    return files, written, cache
+
+def render_banks(bank_dirs, cache=None, bundle=False, workers=None):
+    """Render every bank, in parallel worker processes when there are enough of them.
+
+    Returns {bank_dir: problem files}; manifest updates are merged into cache.
+    """
+    parts = {}
+    if cache is not None:
+        parts = cache.split({d: (d, [out for out, _, _ in bank_documents(d)]) for d in bank_dirs})
+    if workers == 1 or len(bank_dirs) < PARALLEL_MIN_BANKS:
+        results = [render_bank(d, parts.get(d), bundle) for d in bank_dirs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_bank, bank_dirs, [parts.get(d) for d in bank_dirs],
+                                    [bundle] * len(bank_dirs)))
+    bank_files = {}
+    written = []
+    for bank_dir, (files, bank_written, part) in zip(bank_dirs, results):
+        bank_files[bank_dir] = files
+        written.extend(bank_written)
+        if cache is not None:
+            cache.merge(part)
+    return bank_files, written
+
 def main():
-    # Per-bank generation
-    for bank_dir in BANK_DIRS:
-        files = get_problem_files(bank_dir)
+    # With --incremental, only outputs whose problem files or template parameters
+    # changed are rewritten (keeping latexmk's timestamps valid) and recompiled.
+    cache = build_cache.BuildCache(os.path.join(BUILD_ROOT, build_cache.MANIFEST_NAME)) if "--incremental" in sys.argv else None
+    # With --bundle, problem bodies are inlined so each document is self-contained
+    bundle = "--bundle" in sys.argv
+    # --workers N renders banks in N processes (default: one per core)
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else None
+    bank_dirs = problem_bank.discover_banks(BANKS_ROOT)
+    with instrument.span("render_banks", banks=len(bank_dirs)):
+        bank_files, written = render_banks(bank_dirs, cache, bundle, workers)
+    outputs = []
+    pdf_jobs = []  # (out_path, variant, files, title) for --fragments
+    all_files = []
+    generated_banks = []
+    for bank_dir in bank_dirs:
+        files = bank_files[bank_dir]
+        all_files.extend(files)
         if not files:
             continue
-        build_bank_dir = os.path.join(BUILD_ROOT, os.path.relpath(bank_dir, SRC_ROOT))
-        # Use correct relative path for \input in per-bank .tex files
-        questions = "\n\\vfill\n".join([
-            f"    \\input{{{os.path.relpath(fname, build_bank_dir)}}}" for fname in files
-        ]) + "\n\\vfill\n"
-        sol_questions = "\n".join([
-            f"    \\input{{{os.path.relpath(fname, build_bank_dir)}}}" for fname in files
-        ])
-        write_tex(f"{os.path.basename(bank_dir)}_all.tex", EXAM_TEMPLATE, questions, f"{os.path.basename(bank_dir)} Problems", AUTHOR, DATE, MARGIN, directory=build_bank_dir)
-        write_tex(f"{os.path.basename(bank_dir)}_all_solutions.tex", SOL_TEMPLATE, sol_questions, f"{os.path.basename(bank_dir)} Problems with Solutions", AUTHOR, DATE, MARGIN, directory=build_bank_dir)
-    # All banks combined
-    all_files = []
-    for bank_dir in BANK_DIRS:
-        all_files.extend(get_problem_files(bank_dir))
-    # Use correct relative path for \input in combined .tex files
-    build_dir = BUILD_ROOT
-    all_questions = "\n\\vfill\n".join([
-        f"    \\input{{{os.path.relpath(fname, build_dir)}}}" for fname in all_files
-    ]) + "\n\\vfill\n"
-    all_sol_questions = "\n".join([
-        f"    \\input{{{os.path.relpath(fname, build_dir)}}}" for fname in all_files
-    ])
-    write_tex(os.path.join(BUILD_ROOT, "all_problems.tex"), EXAM_TEMPLATE, all_questions, ALL_TITLE, AUTHOR, DATE, MARGIN)
-    write_tex(os.path.join(BUILD_ROOT, "all_problems_sol.tex"), SOL_TEMPLATE, all_sol_questions, ALL_SOL_TITLE, AUTHOR, DATE, MARGIN)
+        generated_banks.append(bank_dir)
+        documents = bank_documents(bank_dir)
+        outputs.extend(out_path for out_path, _, _ in documents)
+        pdf_jobs.extend((out_path, "exam" if template is EXAM_TEMPLATE else "solutions", files, title)
+                        for out_path, template, title in documents)
+    # All banks combined, from the merged per-bank indexes (no rescan; hashes come from the workers)
+    documents = [
+        (os.path.join(BUILD_ROOT, "all_problems.tex"), EXAM_TEMPLATE, ALL_TITLE),
+        (os.path.join(BUILD_ROOT, "all_problems_sol.tex"), SOL_TEMPLATE, ALL_SOL_TITLE),
+    ]
+    outputs.extend(out_path for out_path, _, _ in documents)
+    pdf_jobs.extend((out_path, "exam" if template is EXAM_TEMPLATE else "solutions", all_files, title)
+                    for out_path, template, title in documents)
+    written.extend(emit_documents(documents, all_files, cache, bundle))
+    if cache is not None:
+        cache.prune(all_files, outputs)
+        cache.save()
+        print(f"[INFO] Incremental build: {len(written)} of {len(outputs)} .tex files rewritten.")
     print("Generated .tex files for each bank (in build/) and for all problems (in build/).")
 
+    # With --fragments, PDFs are assembled from per-problem fragments compiled once
+    # and cached by content, instead of running pdflatex on every document. The
+    # result approximates the compiled documents (see fragment_cache.py)
+    if "--fragments" in sys.argv:
+        import fragment_cache  # needs PyMuPDF, which plain .tex generation does not
+        jobs = int(sys.argv[sys.argv.index("--jobs") + 1]) if "--jobs" in sys.argv else None
+        fmt_dir = None if "--no-fmt" in sys.argv else tex_format.FMT_DIR
+        fragments_cache = fragment_cache.FragmentCache({"exam": EXAM_TEMPLATE, "solutions": SOL_TEMPLATE}, MARGIN, AUTHOR, DATE)
+        documents = [(os.path.join(compile_tex.job_output_dir(out_path), os.path.splitext(os.path.basename(out_path))[0] + ".pdf"),
+                      variant, files, title) for out_path, variant, files, title in pdf_jobs]
+        with instrument.span("fragments.build", problems=len(all_files), documents=len(documents)):
+            failed = fragments_cache.build_documents(documents, jobs=jobs, fmt_dir=fmt_dir)
+        if failed:
+            for r in failed:
+                print(f"[ERROR] Fragment {r.tex_path} failed to compile.")
+            sys.exit(1)
+        for (out_path, _, _, _), (pdf_path, _, _, _) in zip(pdf_jobs, documents):
+            print(f"[ASSEMBLE] {out_path} -> {pdf_path}")
+
+    # If --compile flag is present, compile the generated files in parallel
+    if "--compile" in sys.argv:
+        jobs = int(sys.argv[sys.argv.index("--jobs") + 1]) if "--jobs" in sys.argv else None
+        to_compile = [out for out in outputs if cache.needs_compile(out)] if cache is not None else outputs
+        # Documents share two preambles (exam/solutions), dumped once into build/fmt
+        fmt_dir = None if "--no-fmt" in sys.argv else tex_format.FMT_DIR
+        results = compile_tex.compile_and_report(to_compile, jobs=jobs, fmt_dir=fmt_dir)
+        if cache is not None:
+            for r in results:
+                if r.success:
+                    cache.mark_compiled(r.tex_path)
+            cache.save()
+        if not all(r.success for r in results):
+            print("[ERROR] Some .tex files failed to compile.")
+            sys.exit(1)
+
     # If --test flag is present, run checks
     if "--test" in sys.argv:
-        success, missing, empty = check_generated_files()
+        success, missing, empty = check_generated_files(generated_banks)
         if success:
             print("[TEST] All expected .tex files exist and are non-empty.")
             sys.exit(0)
@@ -1,13 +1,26 @@
+import asyncio
+import glob
+import json
 import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import requests
+from problem_bank import ProblemBank, discover_banks
+import llm_cache
+import rate_limit
 
 load_dotenv()
 API_KEY = os.getenv("MY_API_KEY")
 if not API_KEY:
     raise RuntimeError("MY_API_KEY not set. Please set it in your .env file or environment.")
 
+COMPLETIONS_URL = "https://api.openai.com/v1/completions"
+MODEL = "gpt-3.5-turbo-instruct"
+BANKS_ROOT = "src/banks"
+DEFAULT_CONCURRENCY = 8
+
 def get_context_text():
     context_path = os.path.join(os.path.dirname(__file__), '../context')
     if os.path.isfile(context_path):
@@ -31,8 +44,7 @@ def extract_question_and_solution(latex_content):
         solution = '<solution here>'
     return question, solution
 
-def generate_problem(prompt, bank_dir, problem_number):
-    context_text = get_context_text()
+def build_problem_prompt(prompt, context_text):
     format_instruction = (
         "\n\n---\n"
         "The output MUST be a single LaTeX exam problem for the exam class, with this format (no point allocation):\n"
@@ -40,30 +52,38 @@ def generate_problem(prompt, bank_dir, problem_number):
         "Do not include any LaTeX preamble, documentclass, or extra environments. Only output the question and solution as shown."
     )
     if context_text:
-        prompt = (
+        return (
             f"[CONTEXT: The following is background for the audience and expectations of the questions and answers.]\n{context_text}\n\n"
             f"[PROMPT]: {prompt}{format_instruction}"
         )
-    else:
-        prompt = f"{prompt}{format_instruction}"
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-    data = {
-        "model": "gpt-3.5-turbo-instruct",
-        "prompt": prompt,
-        "max_tokens": 500
-    }
-    response = requests.post("https://api.openai.com/v1/completions", headers=headers, json=data)
-    if response.status_code != 200:
-        print(f"API error: {response.status_code} {response.text}")
-        return False
-    result = response.json()
-    latex_content = result.get("choices", [{}])[0].get("text", "").strip()
-    if not latex_content:
-        print("No content generated.")
-        return False
+    return f"{prompt}{format_instruction}"
+
+def build_prompt_list_prompt(section_content, n, context_text):
+    format_instruction = (
+        "\n\n---\n"
+        "When you generate prompts, remember that each will be used to create a LaTeX exam problem for the exam class, with this format (no point allocation):\n"
+        "\\question <the question text>\n\\begin{solution}\n<the solution>\n\\end{solution}\n"
+        "Do not include any LaTeX preamble, documentclass, or extra environments. Only output the question and solution as shown."
+    )
+    return (
+        f"[CONTEXT: The following is background for the audience and expectations of the questions and answers.]\n{context_text}\n\n"
+        f"[PROMPT]: Given the following section of text, generate a numbered list of {n} distinct, high-quality LaTeX exam problem prompts (not full problems, just prompts) inspired by the content. "
+        f"Do NOT include solutions or LaTeX markup, just the prompts.\n\nSection:\n{section_content}\n\nList of {n} distinct problem prompts:{format_instruction}"
+    )
+
+def parse_prompt_list(text):
+    # Parse the numbered list of prompts
+    prompts = []
+    for line in text.splitlines():
+        m = re.match(r"\s*\d+\.\s*(.*)", line)
+        if m:
+            prompts.append(m.group(1).strip())
+    return prompts
+
+def format_problem(latex_content, problem_number):
+    """Normalize model output into a single \\question + solution problem file body."""
     # Extract question and solution
     question, solution = extract_question_and_solution(latex_content)
-    import re
     # Remove any point allocation like [10] from the start of the question
     if question.startswith('\\question'):
         question = re.sub(r'^\\question\s*\[[^\]]*\]', r'\\question', question)
@@ -82,31 +102,45 @@ def generate_problem(prompt, bank_dir, problem_number):
     formatted = f"% Example problem {problem_number}\n"
     formatted += question.strip() + "\n"
     formatted += "\\begin{solution}\n" + solution.strip() + "\n\\end{solution}\n"
-    formatted = formatted.strip() + "\n"
+    return formatted.strip() + "\n"
+
+def write_problem(bank_dir, problem_number, formatted):
     os.makedirs(bank_dir, exist_ok=True)
     fname = os.path.join(bank_dir, f"problem{problem_number}.tex")
     with open(fname, "w") as f:
         f.write(formatted)
     print(f"Generated {fname}")
+    return fname
+
+def generate_problem(prompt, bank_dir, problem_number):
+    prompt = build_problem_prompt(prompt, get_context_text())
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    data = {
+        "model": MODEL,
+        "prompt": prompt,
+        "max_tokens": 500
+    }
+    result, response = llm_cache.cached_post(COMPLETIONS_URL, data, headers=headers, label=f"problem {problem_number}")
+    if result is None:
+        if response is not None:
+            print(f"API error: {response.status_code} {response.text}")
+        return False
+    latex_content = result.get("choices", [{}])[0].get("text", "").strip()
+    if not latex_content:
+        print("No content generated.")
+        return False
+    write_problem(bank_dir, problem_number, format_problem(latex_content, problem_number))
     return True
 
 def get_next_problem_number(bank_dir):
-    files = [f for f in os.listdir(bank_dir) if f.startswith('problem') and f.endswith('.tex')]
-    nums = [int(f[len('problem'):-len('.tex')]) for f in files if f[len('problem'):-len('.tex')].isdigit()]
-    return max(nums, default=0) + 1
+    return ProblemBank.scan(bank_dir).next_number()
 
 def generate_prompts_for_folder(folder_path):
-    import glob
-    import re
-    BANKS = ["Bank1", "Bank2"]
+    BANKS = [os.path.basename(d) for d in discover_banks(BANKS_ROOT)] or ["Bank1"]
     context_text = get_context_text()
-    format_instruction = (
-        "\n\n---\n"
-        "When you generate prompts, remember that each will be used to create a LaTeX exam problem for the exam class, with this format (no point allocation):\n"
-        "\\question <the question text>\n\\begin{solution}\n<the solution>\n\\end{solution}\n"
-        "Do not include any LaTeX preamble, documentclass, or extra environments. Only output the question and solution as shown."
-    )
     files = sorted([f for f in glob.glob(os.path.join(folder_path, '*')) if os.path.isfile(f)])
+    # One index per bank, scanned once and updated as problems are written
+    bank_indexes = {}
     for file_path in files:
         print(f"\n=== {os.path.basename(file_path)} ===")
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -131,33 +165,24 @@ def generate_prompts_for_folder(folder_path):
                 pass
             print("Invalid choice. Try again.")
         bank = BANKS[bank_choice - 1]
-        bank_dir = os.path.join("src/banks", bank)
-        prompt = (
-            f"[CONTEXT: The following is background for the audience and expectations of the questions and answers.]\n{context_text}\n\n"
-            f"[PROMPT]: Given the following section of text, generate a numbered list of {n} distinct, high-quality LaTeX exam problem prompts (not full problems, just prompts) inspired by the content. "
-            f"Do NOT include solutions or LaTeX markup, just the prompts.\n\nSection:\n{section_content}\n\nList of {n} distinct problem prompts:{format_instruction}"
-        )
+        bank_dir = os.path.join(BANKS_ROOT, bank)
+        prompt = build_prompt_list_prompt(section_content, n, context_text)
         headers = {"Authorization": f"Bearer {API_KEY}"}
         data = {
-            "model": "gpt-3.5-turbo-instruct",
+            "model": MODEL,
             "prompt": prompt,
             "max_tokens": 500,
             "temperature": 0.7
         }
-        response = requests.post("https://api.openai.com/v1/completions", headers=headers, json=data)
-        if response.status_code != 200:
-            print(f"API error: {response.status_code} {response.text}")
+        result, response = llm_cache.cached_post(COMPLETIONS_URL, data, headers=headers, label=os.path.basename(file_path))
+        if result is None:
+            if response is not None:
+                print(f"API error: {response.status_code} {response.text}")
             continue
-        result = response.json()
         text = result.get("choices", [{}])[0].get("text", "").strip()
         print(f"\nSuggested prompts for {os.path.basename(file_path)}:")
         print(text)
-        # Parse the numbered list of prompts
-        prompts = []
-        for line in text.splitlines():
-            m = re.match(r"\s*\d+\.\s*(.*)", line)
-            if m:
-                prompts.append(m.group(1).strip())
+        prompts = parse_prompt_list(text)
         if not prompts:
             print("No prompts parsed from API output.")
             continue
@@ -166,13 +191,159 @@ def generate_prompts_for_folder(folder_path):
             print(f"\nPrompt: {prompt_text}")
             use = input("Use this prompt to generate a problem? (y/n): ").strip().lower()
             if use == 'y':
-                problem_number = get_next_problem_number(bank_dir)
+                if bank not in bank_indexes:
+                    bank_indexes[bank] = ProblemBank.scan(bank_dir)
+                problem_number = bank_indexes[bank].next_number()
                 print(f"Generating problem {problem_number} in {bank}...")
-                generate_problem(prompt_text, bank_dir, problem_number)
+                if generate_problem(prompt_text, bank_dir, problem_number):
+                    bank_indexes[bank].add(problem_number)
             else:
                 print("Skipped.")
 
+def load_jobs(job_file):
+    """Load a batch job file: a JSON list of {"section": path, "bank": name, "count": n}."""
+    with open(job_file, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    for job in jobs:
+        if not {"section", "bank", "count"} <= set(job):
+            raise ValueError(f"Invalid job (needs section, bank, count): {job}")
+    return jobs
+
+def make_session(concurrency):
+    """One pooled HTTP session shared by every request of a batch run."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.headers["Authorization"] = f"Bearer {API_KEY}"
+    return session
+
+def post_completion(session, data):
+    """Blocking completion request; returns the generated text or '' on error."""
+    result, response = llm_cache.cached_post(COMPLETIONS_URL, data, session=session, label="batch request")
+    if result is None:
+        if response is not None:
+            print(f"[ERROR] API error: {response.status_code} {response.text}")
+        return ""
+    return result.get("choices", [{}])[0].get("text", "").strip()
+
+async def complete_async(executor, session, data):
+    # Blocking requests in threads rather than an async HTTP client: the cache,
+    # retries and rate limiter in llm_cache/rate_limit are built on requests.
+    # An explicit executor, since the loop's default one is capped at
+    # min(32, cpu + 4) threads and would silently throttle larger --concurrency
+    return await asyncio.get_running_loop().run_in_executor(executor, post_completion, session, data)
+
+def close_gaps(bank_dir, reserved, contents):
+    """Move the highest written problems into the numbers of failed ones.
+
+    reserved: numbers reserved for this batch; contents: number -> latex of the
+    problems written. Returns {number: path} after renumbering.
+    """
+    kept = reserved[:len(contents)]
+    holes = [n for n in kept if n not in contents]
+    movers = sorted((n for n in contents if n not in kept), reverse=True)
+    for hole, number in zip(holes, movers):
+        os.remove(os.path.join(bank_dir, f"problem{number}.tex"))
+        contents[hole] = contents.pop(number)
+        write_problem(bank_dir, hole, format_problem(contents[hole], hole))
+        print(f"[INFO] Renumbered problem{number}.tex to problem{hole}.tex")
+    return {n: os.path.join(bank_dir, f"problem{n}.tex") for n in sorted(contents)}
+
+async def run_batch(jobs, concurrency=DEFAULT_CONCURRENCY, on_prompts=None, on_written=None):
+    """Generate problems for every job without any interactive prompts.
+
+    Prompt lists for all sections are requested concurrently, then problem
+    numbers are reserved in job order (so numbering does not depend on response
+    timing), then problems are generated concurrently and each one is written
+    as soon as its response arrives. Problems whose request failed have their
+    numbers filled by the last problems of the batch, so no gaps are left.
+    Returns the list of written files.
+
+    A job may carry the "prompts" of an earlier run and the indexes of those
+    already written ("done"); on_prompts(job_index, prompts) and
+    on_written(job_index, prompt_index, path) let the caller record both.
+    """
+    context_text = get_context_text()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    session = make_session(concurrency)
+    try:
+        async def prompts_for(i, job):
+            if "prompts" in job:
+                return job["prompts"]
+            with open(job["section"], 'r', encoding='utf-8') as f:
+                section_content = f.read()
+            data = {
+                "model": MODEL,
+                "prompt": build_prompt_list_prompt(section_content, job["count"], context_text),
+                "max_tokens": 500,
+                "temperature": 0.7
+            }
+            prompts = parse_prompt_list(await complete_async(executor, session, data))[:job["count"]]
+            if prompts and on_prompts:
+                on_prompts(i, prompts)
+            return prompts
+
+        prompt_lists = await asyncio.gather(*[prompts_for(i, job) for i, job in enumerate(jobs)])
+
+        banks = {}
+        reserved = {}
+        assignments = []
+        for i, (job, prompts) in enumerate(zip(jobs, prompt_lists)):
+            if not prompts:
+                print(f"[WARN] No prompts parsed for {job['section']}")
+                continue
+            bank_dir = os.path.join(BANKS_ROOT, job["bank"])
+            if bank_dir not in banks:
+                banks[bank_dir] = ProblemBank.scan(bank_dir)
+                reserved[bank_dir] = []
+            done = set(job.get("done", ()))
+            for j, prompt_text in enumerate(prompts[:job["count"]]):
+                if j in done:
+                    continue
+                problem_number = banks[bank_dir].next_number()
+                banks[bank_dir].add(problem_number)
+                reserved[bank_dir].append(problem_number)
+                assignments.append((i, j, prompt_text, bank_dir, problem_number))
+
+        async def problem_for(i, j, prompt_text, bank_dir, problem_number):
+            data = {
+                "model": MODEL,
+                "prompt": build_problem_prompt(prompt_text, context_text),
+                "max_tokens": 500
+            }
+            return i, j, bank_dir, problem_number, await complete_async(executor, session, data)
+
+        contents = {bank_dir: {} for bank_dir in banks}
+        for coro in asyncio.as_completed([problem_for(*a) for a in assignments]):
+            i, j, bank_dir, problem_number, latex_content = await coro
+            if not latex_content:
+                print(f"[WARN] No content generated for problem {problem_number} in {bank_dir}")
+                continue
+            path = write_problem(bank_dir, problem_number, format_problem(latex_content, problem_number))
+            contents[bank_dir][problem_number] = latex_content
+            if on_written:
+                on_written(i, j, path)
+        written = []
+        for bank_dir in banks:
+            written.extend(close_gaps(bank_dir, reserved[bank_dir], contents[bank_dir]).values())
+        print(f"[INFO] Batch complete: {len(written)} of {len(assignments)} problems written.")
+        print(rate_limit.get_limiter().report())
+        print(llm_cache.get_cache().report())
+        return written
+    finally:
+        session.close()
+        executor.shutdown()
+
 def main():
+    if "--no-cache" in sys.argv:
+        sys.argv.remove("--no-cache")
+        llm_cache.disable()
+    # Non-interactive batch mode: --batch jobs.json [--concurrency N]
+    if "--batch" in sys.argv:
+        job_file = sys.argv[sys.argv.index("--batch") + 1]
+        concurrency = int(sys.argv[sys.argv.index("--concurrency") + 1]) if "--concurrency" in sys.argv else DEFAULT_CONCURRENCY
+        asyncio.run(run_batch(load_jobs(job_file), concurrency))
+        return
     # Always run batch prompt generation for a folder (default: test_sections)
     folder = sys.argv[1] if len(sys.argv) > 1 else "test_sections"
     generate_prompts_for_folder(folder)
@@ -1,10 +1,13 @@
 import os
 import random
+import sys
+
+import compile_tex
+from generate_all_banks_tex import write_tex_streams
+from problem_bank import ProblemBank
 
 # === CONFIGURABLE CONSTANTS ===
 BANK_DIRS = ["Bank1", "Bank2"]  # List of problem bank directories
-PROBLEM_PREFIX = "problem"
-PROBLEM_SUFFIX = ".tex"
 EXAM_TITLE = "Sample Exam"
 SOL_TITLE = "Sample Exam Solutions"
 ALL_TITLE = "All Problems"
@@ -19,6 +22,7 @@ EXAM_TEMPLATE = r"""% main.tex - Auto-generated LaTeX file
 \usepackage{{amssymb}}
 \usepackage{{amsmath}}
 \usepackage[margin={margin}]{{geometry}}
+\csname endofdump\endcsname
 \title{{{exam_title}}}
 \author{{{author}}}
 \date{{{date}}}
@@ -39,6 +43,7 @@ SOL_TEMPLATE = r"""% main_solutions.tex - Auto-generated LaTeX file
 \usepackage{{amssymb}}
 \usepackage{{amsmath}}
 \usepackage[margin={margin}]{{geometry}}
+\csname endofdump\endcsname
 \title{{{sol_title}}}
 \author{{{author}}}
 \date{{{date}}}
@@ -53,27 +58,98 @@ SOL_TEMPLATE = r"""% main_solutions.tex - Auto-generated LaTeX file
 \end{{document}}
 """
 
-def get_problem_files(bank_dir):
-    files = [f for f in os.listdir(bank_dir) if f.startswith(PROBLEM_PREFIX) and f.endswith(PROBLEM_SUFFIX)]
-    files.sort(key=lambda x: int(x[len(PROBLEM_PREFIX):-len(PROBLEM_SUFFIX)]))
-    return [os.path.join(bank_dir, f) for f in files]
-
-def write_tex(filename, template, questions, title, author, date, margin, directory=None):
-    tex_content = template.format(
-        exam_title=title,
-        sol_title=title,
-        author=author,
-        date=date,
-        margin=margin,
-        questions=questions
-    )
-    if directory:
-        os.makedirs(directory, exist_ok=True)
-        filename = os.path.join(directory, filename)
-    with open(filename, "w") as f:
-        f.write(tex_content)
+def write_tex_pair(exam_path, sol_path, files, exam_title, sol_title):
+    """Stream an exam/solutions pair over the same problems in one pass (\\input paths relative to each file)."""
+    write_tex_streams([(exam_path, EXAM_TEMPLATE, exam_title), (sol_path, SOL_TEMPLATE, sol_title)],
+                      files, AUTHOR, DATE, MARGIN, exam_template=EXAM_TEMPLATE)
+
+def sample_variants(files, n, seeds):
+    """Yield (seed, problems) for each seed; each variant has its own random.Random(seed).
+
+    files must be in a stable order (ProblemBank.files() is sorted by problem number)
+    for a seed to always give the same quiz.
+    """
+    for seed in seeds:
+        yield seed, random.Random(seed).sample(files, n)
+
+def write_quiz_variants(bank_dir, n, seeds, out_dir=None, prefix="quiz"):
+    """Write <prefix>_<seed>.tex / <prefix>_<seed>_sol.tex for every seed, sampling n problems of bank_dir.
+
+    Only the variant files are written. Returns a list of (seed, problems, exam_path, sol_path).
+    """
+    out_dir = out_dir or bank_dir
+    files = ProblemBank.scan(bank_dir).files()
+    if not 1 <= n <= len(files):
+        raise ValueError(f"Cannot select {n} problems from {len(files)} in {bank_dir}")
+    variants = []
+    for seed, selected in sample_variants(files, n, seeds):
+        exam_name, sol_name = f"{prefix}_{seed}.tex", f"{prefix}_{seed}_sol.tex"
+        write_tex_pair(os.path.join(out_dir, exam_name), os.path.join(out_dir, sol_name), selected,
+                       *quiz_titles(seed, bank_dir))
+        variants.append((seed, selected, os.path.join(out_dir, exam_name), os.path.join(out_dir, sol_name)))
+    return variants
+
+def quiz_titles(seed, bank_dir):
+    return f"Random Quiz {seed} from {bank_dir}", f"Random Quiz {seed} with Solutions from {bank_dir}"
+
+def assemble_variants(variants, bank_dir, jobs=None):
+    """Build every variant's PDFs from the shared per-problem fragment cache. Returns False on failure.
+
+    The PDFs approximate the compiled quizzes (see fragment_cache.py).
+    """
+    import fragment_cache  # needs PyMuPDF, which plain .tex generation does not
+
+    cache = fragment_cache.FragmentCache({"exam": EXAM_TEMPLATE, "solutions": SOL_TEMPLATE}, MARGIN, AUTHOR, DATE)
+    documents = []
+    for seed, selected, exam_path, sol_path in variants:
+        exam_title, sol_title = quiz_titles(seed, bank_dir)
+        documents.append((os.path.splitext(exam_path)[0] + ".pdf", "exam", selected, exam_title))
+        documents.append((os.path.splitext(sol_path)[0] + ".pdf", "solutions", selected, sol_title))
+    failed = cache.build_documents(documents, jobs=jobs)
+    for r in failed:
+        print(f"[ERROR] Fragment {r.tex_path} failed to compile.")
+    return not failed
+
+def batch_main(args):
+    # Non-interactive mode: --bank DIR --problems N (--count N | --seeds 1,2,3) [--out DIR] [--prefix P]
+    #                       [--compile | --fragments] [--jobs N]
+    options = {"--bank": None, "--problems": None, "--count": None, "--seeds": None, "--out": None,
+               "--prefix": "quiz", "--jobs": None}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if not options["--bank"] or not options["--problems"] or not (options["--count"] or options["--seeds"]):
+        print("Usage: python3 generate_random_quiz_tex.py --bank DIR --problems N (--count N | --seeds 1,2,3) "
+              "[--out DIR] [--prefix P] [--compile | --fragments] [--jobs N]")
+        sys.exit(1)
+    if options["--seeds"]:
+        seeds = [int(s) for s in options["--seeds"].split(",") if s]
+    else:
+        seeds = range(1, int(options["--count"]) + 1)
+    jobs = int(options["--jobs"]) if options["--jobs"] else None
+    try:
+        variants = write_quiz_variants(options["--bank"], int(options["--problems"]), seeds,
+                                       out_dir=options["--out"], prefix=options["--prefix"])
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    print(f"Generated {len(variants)} quiz variants (and solutions) in {options['--out'] or options['--bank']}/.")
+    if "--fragments" in args:
+        if not assemble_variants(variants, options["--bank"], jobs=jobs):
+            sys.exit(1)
+    elif "--compile" in args:
+        tex_files = [path for _, _, exam_path, sol_path in variants for path in (exam_path, sol_path)]
+        results = compile_tex.compile_and_report(tex_files, jobs=jobs)
+        if not all(r.success for r in results):
+            print("[ERROR] Some quiz variants failed to compile.")
+            sys.exit(1)
 
 def main():
+    if any(flag in sys.argv for flag in ("--count", "--seeds")):
+        batch_main(sys.argv[1:])
+        return
     # Interactive random quiz generation
     print("Available banks:")
     for idx, bank_dir in enumerate(BANK_DIRS, 1):
@@ -83,7 +159,9 @@ def main():
         print("Invalid bank selection.")
         return
     bank_dir = BANK_DIRS[bank_choice - 1]
-    files = get_problem_files(bank_dir)
+    # List each bank directory once and reuse the index for every pass below
+    banks = {d: ProblemBank.scan(d) for d in BANK_DIRS}
+    files = banks[bank_dir].files()
     if not files:
         print(f"No problems found in {bank_dir}.")
         return
@@ -92,30 +170,20 @@ def main():
         print(f"Please select a number between 1 and {len(files)}.")
         return
     selected = random.sample(files, n)
-    questions = "\n\\vfill\n".join([f"    \\input{{{os.path.basename(fname)}}}" for fname in selected]) + "\n\\vfill\n"
-    sol_questions = "\n".join([f"    \\input{{{os.path.basename(fname)}}}" for fname in selected])
-    write_tex("random_quiz.tex", EXAM_TEMPLATE, questions, f"Random Quiz from {bank_dir}", AUTHOR, DATE, MARGIN, directory=bank_dir)
-    write_tex("random_quiz_sol.tex", SOL_TEMPLATE, sol_questions, f"Random Quiz with Solutions from {bank_dir}", AUTHOR, DATE, MARGIN, directory=bank_dir)
+    write_tex_pair(os.path.join(bank_dir, "random_quiz.tex"), os.path.join(bank_dir, "random_quiz_sol.tex"), selected,
+                   f"Random Quiz from {bank_dir}", f"Random Quiz with Solutions from {bank_dir}")
     print(f"random_quiz.tex and random_quiz_sol.tex generated with {n} problems from {bank_dir} in {bank_dir}/.")
 
-    # Per-bank generation
+    # Per-bank generation (\input paths are just the file names)
     for bank_dir in BANK_DIRS:
-        files = get_problem_files(bank_dir)
+        files = banks[bank_dir].files()
         if not files:
             continue
-        # Use only the filename for \input in per-bank .tex files
-        questions = "\n\\vfill\n".join([f"    \\input{{{os.path.basename(fname)}}}" for fname in files]) + "\n\\vfill\n"
-        sol_questions = "\n".join([f"    \\input{{{os.path.basename(fname)}}}" for fname in files])
-        write_tex(f"{bank_dir}_all.tex", EXAM_TEMPLATE, questions, f"{bank_dir} Problems", AUTHOR, DATE, MARGIN, directory=bank_dir)
-        write_tex(f"{bank_dir}_all_solutions.tex", SOL_TEMPLATE, sol_questions, f"{bank_dir} Problems with Solutions", AUTHOR, DATE, MARGIN, directory=bank_dir)
-    # All banks combined
-    all_files = []
-    for bank_dir in BANK_DIRS:
-        all_files.extend(get_problem_files(bank_dir))
-    all_questions = "\n\\vfill\n".join([f"    \\input{{{os.path.dirname(fname)}/{os.path.basename(fname)}}}" for fname in all_files]) + "\n\\vfill\n"
-    all_sol_questions = "\n".join([f"    \\input{{{os.path.dirname(fname)}/{os.path.basename(fname)}}}" for fname in all_files])
-    write_tex("all_problems.tex", EXAM_TEMPLATE, all_questions, ALL_TITLE, AUTHOR, DATE, MARGIN)
-    write_tex("all_problems_sol.tex", SOL_TEMPLATE, all_sol_questions, ALL_SOL_TITLE, AUTHOR, DATE, MARGIN)
+        write_tex_pair(os.path.join(bank_dir, f"{bank_dir}_all.tex"), os.path.join(bank_dir, f"{bank_dir}_all_solutions.tex"),
+                       files, f"{bank_dir} Problems", f"{bank_dir} Problems with Solutions")
+    # All banks combined, streamed from every bank index in turn
+    all_files = (fname for bank_dir in BANK_DIRS for fname in banks[bank_dir].files())
+    write_tex_pair("all_problems.tex", "all_problems_sol.tex", all_files, ALL_TITLE, ALL_SOL_TITLE)
     print("Generated .tex files for each bank (in their directory) and for all problems (in root).")
 
 if __name__ == "__main__":
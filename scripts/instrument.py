@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Shared timing spans, counters and optional profiling for the pipeline scripts.
+
+Instrumentation is off unless TRACE_FILE is set. Then every span (a timed
+block) and counter is recorded and written at exit as a JSON trace in the
+Chrome trace event format, so it also opens in chrome://tracing or Perfetto.
+Worker processes write TRACE_FILE with their pid inserted before the
+extension (trace.1234.json); the aggregate command merges any number of
+trace files into a per-stage table.
+
+INSTRUMENT_PROFILE=out.prof additionally runs the main process under cProfile.
+
+Usage:
+    TRACE_FILE=trace.json python3 scripts/split_pdf.py book.pdf
+    python3 scripts/instrument.py aggregate trace.json [trace.*.json ...]
+"""
+import atexit
+import cProfile
+import functools
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+PROFILE_FILE = os.getenv("INSTRUMENT_PROFILE")
+enabled = bool(TRACE_FILE)
+
+# Spawned workers re-import this module; the first process to do so is the main one
+os.environ.setdefault("INSTRUMENT_MAIN_PID", str(os.getpid()))
+
+_lock = threading.Lock()
+_events = []
+_counters = {}
+# Offset turning perf_counter readings into wall-clock time, so traces of different processes line up
+_epoch_ns = time.perf_counter_ns() - time.time_ns()
+
+def _now_us():
+    return (time.perf_counter_ns() - _epoch_ns) / 1000
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed block as `name` (attrs are stored with it)."""
+    if not enabled:
+        yield
+        return
+    start = _now_us()
+    try:
+        yield
+    finally:
+        event = {"name": name, "ph": "X", "ts": start, "dur": _now_us() - start,
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        if attrs:
+            event["args"] = attrs
+        with _lock:
+            _events.append(event)
+
+def timed(name=None):
+    """Decorator form of span(), named after the function by default."""
+    def decorate(fn):
+        label = name or fn.__qualname__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, n=1):
+    """Add n to counter `name` (pages, tokens, bytes written, cache hits, ...)."""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def trace_path():
+    if str(os.getpid()) == os.environ["INSTRUMENT_MAIN_PID"]:
+        return TRACE_FILE
+    root, ext = os.path.splitext(TRACE_FILE)
+    return f"{root}.{os.getpid()}{ext or '.json'}"
+
+def flush():
+    """Write everything recorded so far by this process to its trace file.
+
+    Called at exit; process-pool workers call it at the end of each task since
+    their interpreters exit without running atexit handlers.
+    """
+    if not enabled:
+        return
+    with _lock:
+        data = {"traceEvents": list(_events), "counters": dict(_counters),
+                "pid": os.getpid(), "argv": sys.argv}
+    path = trace_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _reset_after_fork():
+    # A forked worker starts with its own (empty) record, not a copy of the parent's
+    global _lock
+    _lock = threading.Lock()
+    _events.clear()
+    _counters.clear()
+
+if enabled:
+    atexit.register(flush)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_reset_after_fork)
+
+if PROFILE_FILE and str(os.getpid()) == os.environ["INSTRUMENT_MAIN_PID"]:
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+    def _dump_profile():
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_FILE)
+    atexit.register(_dump_profile)
+
+def aggregate(paths):
+    """Merge trace files into ({span: {count, total, mean, max}} in seconds, {counter: total})."""
+    spans = {}
+    counters = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for event in data.get("traceEvents", []):
+            if event.get("ph") != "X":
+                continue
+            s = spans.setdefault(event["name"], {"count": 0, "total": 0.0, "max": 0.0})
+            seconds = event["dur"] / 1e6
+            s["count"] += 1
+            s["total"] += seconds
+            s["max"] = max(s["max"], seconds)
+        for name, value in data.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + value
+    for s in spans.values():
+        s["mean"] = s["total"] / s["count"]
+    return spans, counters
+
+def format_aggregate(spans, counters):
+    """Span table (largest total time first) followed by the counters."""
+    width = max([len("Span")] + [len(name) for name in spans])
+    lines = [f"{'Span':<{width}}  {'Count':>7}  {'Total (s)':>10}  {'Mean (s)':>9}  {'Max (s)':>9}"]
+    lines.append("-" * len(lines[0]))
+    for name, s in sorted(spans.items(), key=lambda item: item[1]["total"], reverse=True):
+        lines.append(f"{name:<{width}}  {s['count']:>7}  {s['total']:>10.3f}  {s['mean']:>9.4f}  {s['max']:>9.4f}")
+    if counters:
+        lines.append("")
+        cwidth = max(len(name) for name in counters)
+        for name in sorted(counters):
+            lines.append(f"{name:<{cwidth}}  {counters[name]:>12}")
+    return "\n".join(lines)
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] != "aggregate":
+        print("Usage: python3 instrument.py aggregate trace.json [more traces or globs ...]")
+        sys.exit(1)
+    paths = sorted({p for pattern in args[1:] for p in (glob.glob(pattern) or [pattern])})
+    print(format_aggregate(*aggregate(paths)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+On-disk cache of LLM API responses, keyed by a hash of the request.
+
+Responses are stored in SQLite and keyed on (model, messages/prompt,
+max_tokens, temperature). Requests with a temperature above 0 ask for a fresh
+sample (e.g. the problem prompt lists), so they always go to the API and are
+not cached. When the cache grows past its size budget the least recently used
+entries are evicted. Set LLM_CACHE=off (or pass --no-cache to the
+scripts) to bypass it; LLM_CACHE_PATH and LLM_CACHE_MAX_MB configure it.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import instrument
+import rate_limit
+
+CACHE_PATH = os.path.join(".cache", "llm_responses.sqlite3")
+MAX_MB = 512
+KEY_FIELDS = ("model", "messages", "prompt", "max_tokens", "temperature")
+
+def cache_key(payload):
+    key = {field: payload.get(field) for field in KEY_FIELDS}
+    return hashlib.sha256(json.dumps(key, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_MB * 1024 * 1024, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        if enabled:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+            self.conn.commit()
+
+    def get(self, payload):
+        """Cached response JSON for payload, or None."""
+        if not self.enabled:
+            return None
+        key = cache_key(payload)
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                instrument.count("llm_cache.misses")
+                return None
+            self.hits += 1
+            instrument.count("llm_cache.hits")
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, payload, result):
+        if not self.enabled:
+            return
+        body = json.dumps(result, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, last_access) VALUES (?, ?, ?, ?)",
+                (cache_key(payload), body, len(body.encode("utf-8")), time.time()),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def report(self):
+        if not self.enabled:
+            return "[INFO] Response cache: disabled"
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"[INFO] Response cache: hits={self.hits}, misses={self.misses} ({rate:.0f}% hit rate), evictions={self.evictions}"
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            self.enabled = False
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Process-wide cache configured from LLM_CACHE / LLM_CACHE_PATH / LLM_CACHE_MAX_MB."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            enabled = os.getenv("LLM_CACHE", "on").lower() not in ("0", "off", "false", "no")
+            _cache = ResponseCache(
+                path=os.getenv("LLM_CACHE_PATH", CACHE_PATH),
+                max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", MAX_MB)) * 1024 * 1024,
+                enabled=enabled,
+            )
+        return _cache
+
+def disable():
+    """Bypass the cache for the rest of this process (the scripts' --no-cache flag)."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = ResponseCache(enabled=False)
+
+def is_sampled(payload):
+    return (payload.get("temperature") or 0) > 0
+
+def cached_post(url, payload, headers=None, session=None, label="request"):
+    """POST through the cache and the shared rate limiter.
+
+    Returns (result, response): result is the response JSON (from the cache or a
+    200 response), or None on failure, including a 200 response whose body is
+    not JSON; response is the HTTP response, or None when the result came from
+    the cache or every attempt raised.
+    """
+    cache = get_cache()
+    sampled = is_sampled(payload)
+    result = None if sampled else cache.get(payload)
+    if result is not None:
+        return result, None
+    response = rate_limit.post_with_retry(url, payload, headers=headers, session=session, label=label)
+    if response is None or response.status_code != 200:
+        return None, response
+    try:
+        result = response.json()
+    except ValueError:
+        print(f"[ERROR] Malformed JSON response on {label}")
+        return None, response
+    if not sampled:
+        cache.put(payload, result)
+    return result, response
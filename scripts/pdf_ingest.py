@@ -0,0 +1,55 @@
+"""
+Single-pass PDF ingestion with PyMuPDF.
+
+Opens the source book once and yields one PageRecord per page, so the
+conversion stage no longer needs split_pdf's per-page files. Writing those
+per-page PDFs is still available through `pages_dir`. Conversion is text only;
+page images are extracted separately by extract_images_to_md.
+"""
+import os
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+import instrument
+from split_pdf import pad_page_number
+
+PageRecord = namedtuple("PageRecord", ["page_number", "text"])
+
+def page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def page_ranges(total_pages, chunk_size):
+    """Split pages 1..total_pages into inclusive (start, end) ranges of chunk_size pages."""
+    return [(start, min(start + chunk_size - 1, total_pages)) for start in range(1, total_pages + 1, chunk_size)]
+
+def write_page_pdf(doc, page_number, pages_dir):
+    """Write page `page_number` (1-based) of an open document as pages_dir/page_XXXX.pdf."""
+    out_path = os.path.join(pages_dir, f"page_{pad_page_number(page_number, doc.page_count)}.pdf")
+    with fitz.open() as single:
+        single.insert_pdf(doc, from_page=page_number - 1, to_page=page_number - 1)
+        single.save(out_path, garbage=3, deflate=True)
+    return out_path
+
+def iter_pages(pdf_path, pages=None, pages_dir=None):
+    """Yield PageRecord(page_number, text) for each requested page.
+
+    pages: iterable of 1-based page numbers (default: every page).
+    pages_dir: if given, also write each page as a single-page PDF there.
+    """
+    with fitz.open(pdf_path) as doc:
+        if pages_dir:
+            os.makedirs(pages_dir, exist_ok=True)
+        for page_number in (pages if pages is not None else range(1, doc.page_count + 1)):
+            if pages_dir:
+                write_page_pdf(doc, page_number, pages_dir)
+            yield PageRecord(page_number, doc[page_number - 1].get_text())
+
+def extract_pages(pdf_path, pages, pages_dir=None):
+    """List form of iter_pages for process-pool workers."""
+    with instrument.span("extract_text", pages=len(pages)):
+        texts = [(r.page_number, r.text) for r in iter_pages(pdf_path, pages, pages_dir=pages_dir)]
+    instrument.count("pages.extracted", len(texts))
+    instrument.flush()
+    return texts
@@ -0,0 +1,129 @@
+"""
+In-memory index of the problemN.tex files in a bank directory.
+
+A ProblemBank lists its directory once, keeps problem numbers in a sorted list
+and is updated in place as problems are added. The index can optionally be
+persisted to a JSON file; it is reused as long as the bank directory's mtime
+(which changes whenever a file is created, renamed or deleted) is unchanged.
+
+As with git's "racily clean" entries, an index saved in the same timestamp tick
+as the directory's last change is not trusted: a file created later in that
+tick would leave the mtime unchanged. Such an index is rescanned on load.
+"""
+import bisect
+import glob
+import json
+import os
+import re
+
+PROBLEM_PREFIX = "problem"
+PROBLEM_SUFFIX = ".tex"
+INDEX_ROOT = os.path.join("build", ".bank_index")
+
+def parse_problem_number(filename):
+    """Return N for 'problemN.tex', or None for any other file name."""
+    if not (filename.startswith(PROBLEM_PREFIX) and filename.endswith(PROBLEM_SUFFIX)):
+        return None
+    stem = filename[len(PROBLEM_PREFIX):-len(PROBLEM_SUFFIX)]
+    return int(stem) if stem.isdigit() else None
+
+def discover_banks(banks_root, pattern="*"):
+    """Bank directories matching pattern under banks_root, in natural order (Bank2 before Bank10)."""
+    dirs = [d for d in glob.glob(os.path.join(banks_root, pattern)) if os.path.isdir(d)]
+    return sorted(dirs, key=lambda d: [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", os.path.basename(d))])
+
+def default_index_path(bank_dir):
+    rel = os.path.relpath(os.path.abspath(bank_dir))
+    name = rel.replace(os.sep, "__").replace(os.pardir, "_") + ".json"
+    return os.path.join(INDEX_ROOT, name)
+
+class ProblemBank:
+    def __init__(self, bank_dir, entries=()):
+        self.bank_dir = bank_dir
+        self.index_path = None
+        # Parallel lists sorted by problem number
+        self.numbers = []
+        self.names = []
+        for number, name in sorted(entries):
+            self.numbers.append(number)
+            self.names.append(name)
+
+    @classmethod
+    def scan(cls, bank_dir):
+        """Build the index with a single directory listing."""
+        entries = []
+        if os.path.isdir(bank_dir):
+            with os.scandir(bank_dir) as it:
+                for entry in it:
+                    number = parse_problem_number(entry.name)
+                    if number is not None:
+                        entries.append((number, entry.name))
+        return cls(bank_dir, entries)
+
+    @classmethod
+    def load(cls, bank_dir, index_path=None):
+        """Scan bank_dir, or reuse the index persisted at index_path if it is still valid."""
+        if index_path is None:
+            return cls.scan(bank_dir)
+        dir_mtime = os.stat(bank_dir).st_mtime_ns if os.path.isdir(bank_dir) else None
+        bank = None
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                # The index file's mtime is its save time, on the filesystem's clock
+                racy = dir_mtime is not None and dir_mtime >= os.stat(index_path).st_mtime_ns
+                if data.get("dir_mtime_ns") == dir_mtime and not racy:
+                    bank = cls(bank_dir, [tuple(e) for e in data["problems"]])
+            except (OSError, ValueError, KeyError, TypeError):
+                bank = None
+        stale = bank is None
+        if stale:
+            bank = cls.scan(bank_dir)
+        bank.index_path = index_path
+        if stale:
+            bank.save()
+        return bank
+
+    def save(self):
+        """Persist the index to self.index_path (no-op when not persistent)."""
+        if self.index_path is None:
+            return
+        dir_mtime = os.stat(self.bank_dir).st_mtime_ns if os.path.isdir(self.bank_dir) else None
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dir_mtime_ns": dir_mtime, "problems": list(zip(self.numbers, self.names))}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __contains__(self, number):
+        i = bisect.bisect_left(self.numbers, number)
+        return i < len(self.numbers) and self.numbers[i] == number
+
+    def path(self, number):
+        i = bisect.bisect_left(self.numbers, number)
+        if i == len(self.numbers) or self.numbers[i] != number:
+            raise KeyError(number)
+        return os.path.join(self.bank_dir, self.names[i])
+
+    def files(self):
+        """Problem file paths sorted by problem number."""
+        return [os.path.join(self.bank_dir, name) for name in self.names]
+
+    def next_number(self):
+        return self.numbers[-1] + 1 if self.numbers else 1
+
+    def add(self, number, name=None):
+        """Register a newly written problem file and update the persisted index."""
+        name = name or f"{PROBLEM_PREFIX}{number}{PROBLEM_SUFFIX}"
+        if number not in self:
+            i = bisect.bisect_left(self.numbers, number)
+            self.numbers.insert(i, number)
+            self.names.insert(i, name)
+        self.save()
+
+def get_problem_files(bank_dir, index_path=None):
+    return ProblemBank.load(bank_dir, index_path).files()
@@ -0,0 +1,206 @@
+"""
+Shared request/token rate limiting and retry logic for the OpenAI API scripts.
+
+A RateLimiter budgets requests per minute and tokens per minute with two token
+buckets. Token usage is estimated before each request and corrected from the
+response's `usage` field. 429 and 5xx responses are retried with jittered
+exponential backoff (or the server's Retry-After), and a 429 pauses every
+caller sharing the limiter so concurrent workers don't hammer the API.
+
+Limits come from OPENAI_RPM / OPENAI_TPM (environment or .env).
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+
+import requests
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 30000
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+REQUEST_TIMEOUT = 120
+# After a 429 the request rate drops to this fraction, then recovers per success
+BACKOFF_FACTOR = 0.8
+MIN_RATE_FRACTION = 0.1
+RECOVERY_FRACTION = 0.01
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, clock=time.monotonic):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take `amount` (possibly going into debt) and return seconds to wait before using it."""
+        self._refill()
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class RateLimiter:
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, clock=time.monotonic, sleep=time.sleep):
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.blocked_until = 0.0
+        self.metrics = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "throttled": 0,
+            "wait_seconds": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def acquire(self, est_tokens):
+        """Block until one request of about est_tokens tokens fits in the budget."""
+        with self.lock:
+            wait = max(self.requests.reserve(1), self.tokens.reserve(est_tokens),
+                       self.blocked_until - self.clock())
+            self.metrics["requests"] += 1
+            if wait > 0:
+                self.metrics["throttled"] += 1
+                self.metrics["wait_seconds"] += wait
+        if wait > 0:
+            self.sleep(wait)
+
+    def record_usage(self, usage, est_tokens):
+        """Correct the token estimate with the `usage` reported by the API."""
+        usage = usage or {}
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        actual = usage.get("total_tokens") or (prompt + completion)
+        with self.lock:
+            self.metrics["prompt_tokens"] += prompt
+            self.metrics["completion_tokens"] += completion
+            if actual:
+                self.tokens.refund(est_tokens - actual)
+            # Additive recovery of the request rate after a 429 slowdown
+            bucket = self.requests
+            bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * RECOVERY_FRACTION)
+
+    def block_for(self, seconds, rate_limited=False):
+        """Pause every caller of this limiter for `seconds`."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+            self.metrics["retries"] += 1
+            if rate_limited:
+                self.metrics["rate_limited"] += 1
+                bucket = self.requests
+                bucket.rate = max(bucket.max_rate * MIN_RATE_FRACTION, bucket.rate * BACKOFF_FACTOR)
+            else:
+                self.metrics["server_errors"] += 1
+
+    def report(self):
+        m = self.metrics
+        return (f"[INFO] API calls: requests={m['requests']}, retries={m['retries']}, "
+                f"429s={m['rate_limited']}, 5xx/errors={m['server_errors']}, "
+                f"throttled={m['throttled']} ({m['wait_seconds']:.1f}s waiting), "
+                f"tokens: prompt={m['prompt_tokens']}, completion={m['completion_tokens']}")
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+    """Process-wide limiter shared by every API call."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                rpm=int(os.getenv("OPENAI_RPM", DEFAULT_RPM)),
+                tpm=int(os.getenv("OPENAI_TPM", DEFAULT_TPM)),
+            )
+        return _limiter
+
+def parse_retry_after(headers):
+    """Seconds to wait from Retry-After / retry-after-ms headers, or None."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP-date form
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None, base=BASE_DELAY, cap=MAX_DELAY, rng=random.random):
+    """Retry-After when given, otherwise full-jitter exponential backoff."""
+    if retry_after is not None:
+        return min(cap, retry_after) + rng() * base
+    return rng() * min(cap, base * (2 ** attempt))
+
+def estimate_tokens(payload):
+    """Rough token count for a completion/chat payload (~4 characters per token)."""
+    chars = len(payload.get("prompt", "") or "")
+    for message in payload.get("messages", []):
+        chars += len(message.get("content", "") or "")
+    return chars // 4 + payload.get("max_tokens", 0)
+
+def post_with_retry(url, payload, headers=None, session=None, limiter=None, max_retries=MAX_RETRIES, label="request"):
+    """POST payload as JSON under the shared rate limit, retrying 429/5xx and network errors.
+
+    Returns the final response, or None if every attempt raised.
+    """
+    limiter = limiter or get_limiter()
+    poster = session or requests
+    est_tokens = estimate_tokens(payload)
+    response = None
+    for attempt in range(max_retries + 1):
+        limiter.acquire(est_tokens)
+        try:
+            response = poster.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            response = None
+            if attempt == max_retries:
+                print(f"[ERROR] {label}: giving up after {attempt + 1} attempts: {e}")
+                break
+            delay = backoff_delay(attempt)
+            print(f"[WARN] {label}: {e}; retrying in {delay:.1f}s (attempt {attempt + 1})")
+            limiter.block_for(delay)
+            continue
+        if response.status_code == 200:
+            try:
+                usage = response.json().get("usage")
+            except ValueError:
+                usage = None
+            limiter.record_usage(usage, est_tokens)
+            return response
+        if response.status_code != 429 and response.status_code < 500:
+            return response
+        if attempt == max_retries:
+            break
+        delay = backoff_delay(attempt, parse_retry_after(response.headers))
+        print(f"[WARN] {label}: API {response.status_code}; retrying in {delay:.1f}s (attempt {attempt + 1})")
+        limiter.block_for(delay, rate_limited=response.status_code == 429)
+    return response
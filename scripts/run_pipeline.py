@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Run the whole book workflow, from a PDF to problem banks, as one pipeline.
+
+The stages of the manual chain (split_pdf, convert_pdfs, extract_images_to_md,
+combine_section_markdown, check_section_markdown_formatting,
+generate_problem_via_api, generate_all_banks_tex) become work items:
+
+    split:<page> -> convert:<page> -> images:<page> -> combine:<section> -> lint:<section> -> problems:<section> -> banks
+
+Every item runs as soon as the items it depends on are done, so a section is
+combined, checked and turned into problems while later pages are still being
+converted. PDF work runs in a process pool, API calls in a thread pool, and
+problem generation in a single-worker pool of its own.
+
+Finished items are appended to a checkpoint log (.<book>_pipeline.jsonl in the
+output directory); rerunning the same command after a crash skips everything
+already done and resumes at the items that were in flight.
+
+Usage:
+    python3 scripts/run_pipeline.py [--out DIR] [--workers N] [--cpu-workers N]
+                                    [--problems N --bank NAME] [--restart] [--no-cache] book.pdf
+"""
+import asyncio
+import heapq
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import fitz  # PyMuPDF
+from PyPDF2 import PdfReader
+
+import check_section_markdown_formatting
+import combine_section_markdown
+import convert_pdfs
+import extract_images_to_md
+import generate_problem_via_api
+import instrument
+import llm_cache
+import pdf_ingest
+import split_pdf
+from split_pdf import pad_page_number
+
+# Stage order; when several items are ready, later stages go first so finished
+# sections move on before more pages are started
+STAGES = ["split", "convert", "images", "combine", "lint", "problems", "banks"]
+DEFAULT_WORKERS = 4
+DEFAULT_BANK = "Bank1"
+
+class Checkpoint:
+    """Append-only JSON Lines log of finished work items and their results.
+
+    The first line identifies the source PDF; the log of a different or modified
+    PDF is discarded. Every record is flushed and fsynced as the item finishes,
+    so a crash loses at most the items that were running. Records may come from
+    any thread.
+    """
+    def __init__(self, path, pdf_path, restart=False):
+        self.path = path
+        self.done = {}
+        self.lock = threading.Lock()
+        st = os.stat(pdf_path)
+        header = {"pdf": os.path.abspath(pdf_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if os.path.exists(path) and not restart:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+            try:
+                previous = json.loads(lines[0])
+            except ValueError:
+                previous = None
+            if previous == header:
+                for line in lines[1:]:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record torn by the crash, and nothing after it
+                        break
+                    self.done[record["item"]] = record.get("result")
+            else:
+                print(f"[WARN] {path} belongs to another version of the PDF, starting over.")
+        # Rewrite the valid part of the log so appends never follow a torn line
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for item, result in self.done.items():
+                f.write(json.dumps({"item": item, "result": result}) + "\n")
+        os.replace(tmp_path, path)
+        self.f = open(path, "a", encoding="utf-8")
+
+    def record(self, item, result=None):
+        with self.lock:
+            self.done[item] = result
+            self.f.write(json.dumps({"item": item, "result": result}) + "\n")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+class Scheduler:
+    """Dependency-aware runner for work items.
+
+    Items are "<stage>:<target>" keys run by a named pool ("cpu", "llm", "bank") or, with
+    pool None, inline in the scheduling thread. At most limits[pool] items of a
+    pool are submitted at a time, so ready items of later stages never queue
+    behind a backlog of earlier ones.
+    """
+    def __init__(self):
+        self.items = {}       # key -> (pool, fn, args)
+        self.waiting = {}     # key -> prerequisites not finished yet
+        self.dependents = {}  # key -> keys waiting on it
+
+    def add(self, key, pool, fn, *args, after=()):
+        self.items[key] = (pool, fn, args)
+        self.waiting[key] = set(after)
+        for dep in after:
+            self.dependents.setdefault(dep, []).append(key)
+
+    def run(self, pools, limits, checkpoint):
+        """Run every item not in the checkpoint yet; returns the keys that failed."""
+        order = {key: i for i, key in enumerate(self.items)}
+        # pool -> heap of (stage priority, insertion order, key); None holds the inline items
+        ready = {pool: [] for pool in pools if pools[pool] is not None}
+        ready[None] = []
+
+        def push(key):
+            pool = self.items[key][0]
+            heapq.heappush(ready[pool if pool in ready else None], (-STAGES.index(key.split(":", 1)[0]), order[key], key))
+
+        def finish(key, result):
+            if key not in checkpoint.done:
+                checkpoint.record(key, result)
+            for dependent in self.dependents.get(key, ()):
+                self.waiting[dependent].discard(key)
+                if not self.waiting[dependent]:
+                    push(dependent)
+
+        for key, deps in self.waiting.items():
+            if not deps:
+                push(key)
+        running = {}
+        in_flight = {pool: 0 for pool in ready}
+        failed = []
+        while True:
+            # Start everything that can start; finishing an inline or checkpointed
+            # item can make items of any pool ready, so go round until nothing moves
+            progressed = True
+            while progressed:
+                progressed = False
+                for pool, heap in ready.items():
+                    while heap and (pool is None or in_flight[pool] < limits[pool]):
+                        key = heapq.heappop(heap)[2]
+                        progressed = True
+                        if key in checkpoint.done:
+                            finish(key, None)
+                            continue
+                        _, fn, args = self.items[key]
+                        if pool is not None:
+                            running[pools[pool].submit(fn, *args)] = (key, pool)
+                            in_flight[pool] += 1
+                            continue
+                        try:
+                            result = fn(*args)
+                        except Exception as e:
+                            print(f"[ERROR] {key} failed: {e}")
+                            failed.append(key)
+                            continue
+                        finish(key, result)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, pool = running.pop(future)
+                in_flight[pool] -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[ERROR] {key} failed: {e}")
+                    failed.append(key)
+                    continue
+                finish(key, result)
+        return failed
+
+# Work item functions; module-level so the process pool can pickle them
+
+def split_page(pdf_path, pages_dir, page_num):
+    with fitz.open(pdf_path) as doc:
+        return pdf_ingest.write_page_pdf(doc, page_num, pages_dir)
+
+def convert_page(page_pdf, page_num, md_file):
+    """Convert one split page; returns "written", "blank" (no text) or "empty" (no markdown returned).
+
+    The model returns nothing for blank or useless pages, so "empty" counts as
+    done; API errors raise and leave the item to be retried on the next run.
+    """
+    text = convert_pdfs.pdf_page_to_text(page_pdf)
+    if not text.strip():
+        return "blank"
+    md = convert_pdfs.openai_pdf_to_obsidian(text, page_num, raise_errors=True)
+    if not md.strip():
+        print(f"[WARN] No markdown returned for page {page_num}")
+        return "empty"
+    convert_pdfs.write_markdown(md_file, md)
+    return "written"
+
+def lint_section(md_path):
+    with open(md_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    # Image links are checked relative to the section directory
+    return check_section_markdown_formatting.check_markdown_formatting(
+        text, os.path.basename(md_path), os.path.dirname(md_path))
+
+class BookPipeline:
+    """The work items for one book, laid out like the manual chain's directories."""
+    def __init__(self, pdf_path, out_dir=".", problems=0, bank=DEFAULT_BANK, workers=DEFAULT_WORKERS, cpu_workers=None):
+        stem = Path(pdf_path).stem
+        self.pdf_path = str(pdf_path)
+        self.pages_dir = os.path.join(out_dir, f"{stem}_pages")
+        self.pages_md_dir = os.path.join(out_dir, f"{stem}_pages_md")
+        self.sections_dir = os.path.join(out_dir, f"{stem}_sections_md")
+        self.state_path = os.path.join(out_dir, f".{stem}_pipeline.jsonl")
+        self.issues_path = os.path.join(out_dir, "issues.json")
+        self.problems = problems
+        self.bank = bank
+        self.workers = workers
+        self.cpu_workers = (os.cpu_count() or 1) if cpu_workers is None else cpu_workers
+        self.page_cache = combine_section_markdown.PageCache(self.pages_md_dir)
+        self.placed_images = set()
+        self.checkpoint = None
+
+    def load_index(self, checkpoint):
+        index_path = os.path.join(self.pages_dir, "index.json")
+        if "index" in checkpoint.done and os.path.exists(index_path):
+            return combine_section_markdown.load_index(index_path)
+        index = split_pdf.generate_index(PdfReader(self.pdf_path), self.pages_dir)
+        checkpoint.record("index")
+        return index
+
+    def combine(self, section, pages):
+        images = combine_section_markdown.write_section_md(section, pages, Path(self.sections_dir), self.page_cache)
+        combine_section_markdown.copy_images(images, Path(self.pages_md_dir), Path(self.sections_dir), self.placed_images)
+        return str(combine_section_markdown.section_path(section, Path(self.sections_dir)))
+
+    def generate_problems(self, section):
+        # Runs in the single-worker "bank" pool: banks are numbered by scanning
+        # them, so sections take turns without holding up the scheduler.
+        # The prompt list and every written problem are checkpointed, so a
+        # rerun after a crash only generates the problems still missing.
+        md_path = str(combine_section_markdown.section_path(section, Path(self.sections_dir)))
+        job = {"section": md_path, "bank": self.bank, "count": self.problems}
+        prompts = self.checkpoint.done.get(f"prompts:{section}")
+        if prompts:
+            job["prompts"] = prompts
+            job["done"] = [j for j in range(len(prompts)) if f"problem:{section}:{j}" in self.checkpoint.done]
+        written = asyncio.run(generate_problem_via_api.run_batch(
+            [job], self.workers,
+            on_prompts=lambda i, prompts: self.checkpoint.record(f"prompts:{section}", prompts),
+            on_written=lambda i, j, path: self.checkpoint.record(f"problem:{section}:{j}", path)))
+        return len(written) + len(job.get("done", ()))
+
+    def build_banks(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate_all_banks_tex.py")
+        if subprocess.run([sys.executable, script, "--incremental"]).returncode != 0:
+            raise RuntimeError("generate_all_banks_tex.py failed")
+
+    def schedule(self, index, total_pages):
+        scheduler = Scheduler()
+        for page in range(1, total_pages + 1):
+            name = f"page_{pad_page_number(page, total_pages)}"
+            page_pdf = os.path.join(self.pages_dir, name + ".pdf")
+            scheduler.add(f"split:{page}", "cpu", split_page, self.pdf_path, self.pages_dir, page)
+            scheduler.add(f"convert:{page}", "llm", convert_page, page_pdf, page,
+                          os.path.join(self.pages_md_dir, name + ".md"), after=[f"split:{page}"])
+            scheduler.add(f"images:{page}", "cpu", extract_images_to_md.extract_page_images,
+                          self.pdf_path, self.pages_md_dir, page, after=[f"convert:{page}"])
+        problem_items = []
+        for section, pages in combine_section_markdown.section_pages_with_overlap(index):
+            scheduler.add(f"combine:{section}", None, self.combine, section, pages,
+                          after=[f"images:{page}" for page in pages if 1 <= page <= total_pages])
+            md_path = str(combine_section_markdown.section_path(section, Path(self.sections_dir)))
+            scheduler.add(f"lint:{section}", None, lint_section, md_path, after=[f"combine:{section}"])
+            if self.problems > 0:
+                scheduler.add(f"problems:{section}", "bank", self.generate_problems, section, after=[f"lint:{section}"])
+                problem_items.append(f"problems:{section}")
+        if problem_items:
+            scheduler.add("banks", None, self.build_banks, after=problem_items)
+        return scheduler
+
+    def run(self, restart=False):
+        """Run (or resume) the pipeline; returns the keys of failed items."""
+        for d in (self.pages_dir, self.pages_md_dir, self.sections_dir):
+            os.makedirs(d, exist_ok=True)
+        checkpoint = self.checkpoint = Checkpoint(self.state_path, self.pdf_path, restart)
+        if checkpoint.done:
+            print(f"[INFO] Resuming from {self.state_path}: {len(checkpoint.done)} items already done.")
+        try:
+            with instrument.span("pipeline", pdf=self.pdf_path):
+                index = self.load_index(checkpoint)
+                scheduler = self.schedule(index, pdf_ingest.page_count(self.pdf_path))
+                # Spawned workers: forking while API threads hold locks is unsafe
+                cpu_pool = None
+                if self.cpu_workers > 0:
+                    cpu_pool = ProcessPoolExecutor(self.cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+                try:
+                    with ThreadPoolExecutor(max_workers=self.workers) as llm_pool, \
+                            ThreadPoolExecutor(max_workers=1) as bank_pool:
+                        failed = scheduler.run({"cpu": cpu_pool, "llm": llm_pool, "bank": bank_pool},
+                                               {"cpu": self.cpu_workers, "llm": self.workers, "bank": 1}, checkpoint)
+                finally:
+                    if cpu_pool is not None:
+                        cpu_pool.shutdown()
+        finally:
+            checkpoint.close()
+        issues = [checkpoint.done[key] for key in scheduler.items if key.startswith("lint:") and key in checkpoint.done]
+        count = check_section_markdown_formatting.write_issues(issues, self.issues_path)
+        done = sum(key in checkpoint.done for key in scheduler.items)
+        blocked = len(scheduler.items) - done - len(failed)
+        print(f"[INFO] Pipeline: {done} of {len(scheduler.items)} items done, {len(failed)} failed, "
+              f"{blocked} waiting on failed items. {count} formatting issues written to {self.issues_path}.")
+        return failed
+
+def main():
+    args = sys.argv[1:]
+    if "--no-cache" in args:
+        args.remove("--no-cache")
+        llm_cache.disable()
+    restart = "--restart" in args
+    if restart:
+        args.remove("--restart")
+    options = {"--out": ".", "--workers": DEFAULT_WORKERS, "--cpu-workers": None, "--problems": 0, "--bank": DEFAULT_BANK}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = args[i + 1]
+            del args[i:i + 2]
+    if len(args) != 1:
+        print("Usage: python3 run_pipeline.py [--out DIR] [--workers N] [--cpu-workers N] "
+              "[--problems N --bank NAME] [--restart] [--no-cache] book.pdf")
+        sys.exit(1)
+    cpu_workers = int(options["--cpu-workers"]) if options["--cpu-workers"] is not None else None
+    pipeline = BookPipeline(args[0], options["--out"], problems=int(options["--problems"]), bank=options["--bank"],
+                            workers=int(options["--workers"]), cpu_workers=cpu_workers)
+    if pipeline.run(restart):
+        print("[ERROR] Some work items failed; rerun the same command to retry them.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Compact outline index of a book: every section as a page interval, in a tree.
+
+index.json used to map each "Chapter > Section" key to the full list of its
+pages, plus an "__all_pages__" list. It now stores the outline tree with one
+[start, end] interval per section:
+
+    {"format": "section-index", "version": 2, "total_pages": 320,
+     "sections": [{"title": "Chapter 1", "start": 1, "end": 2, "children": [
+                      {"title": "Section 1.1", "start": 3, "end": 9}]}, ...]}
+
+A section's interval runs from its own first page to the page before the next
+section (in page order) starts, so a parent only covers the pages before its
+first child, as before. Outline entries without a page have null start/end
+and only group their children. Old index files are still read.
+"""
+import json
+from bisect import bisect_right
+
+FORMAT = "section-index"
+VERSION = 2
+ALL_PAGES_KEY = "__all_pages__"
+SEPARATOR = " > "
+
+class SectionIndex:
+    """Sections of a book in page order, with O(log n) page lookups.
+
+    Each section is (path, start, end) where path is the tuple of outline titles
+    and end < start for a section with no pages of its own (one that starts on
+    the same page as the next section).
+    """
+    def __init__(self, sections, total_pages):
+        self.total_pages = total_pages
+        self.paths = [tuple(path.split(SEPARATOR)) if isinstance(path, str) else tuple(path) for path, _, _ in sections]
+        self.starts = [start for _, start, _ in sections]
+        self.ends = [end for _, _, end in sections]
+        # Later duplicates win, as they did in the old dict
+        self.positions = {SEPARATOR.join(path): i for i, path in enumerate(self.paths)}
+
+    @classmethod
+    def from_starts(cls, section_starts, total_pages):
+        """Build from (path or key, start page) pairs already sorted by start page."""
+        sections = []
+        for i, (path, start) in enumerate(section_starts):
+            end = section_starts[i + 1][1] - 1 if i + 1 < len(section_starts) else total_pages
+            sections.append((path, start, end))
+        return cls(sections, total_pages)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Read either format; old indexes are assumed to hold contiguous page lists."""
+        if data.get("format") == FORMAT:
+            entries = []
+            def walk(nodes, parent):
+                for node in nodes:
+                    path = parent + (node["title"],)
+                    if node.get("start") is not None:
+                        entries.append((path, node["start"], node["end"]))
+                    walk(node.get("children", ()), path)
+            walk(data["sections"], ())
+            # Outline order to page order; stable, so ties keep outline order
+            entries.sort(key=lambda entry: entry[1])
+            return cls(entries, data["total_pages"])
+        items = [(key, pages) for key, pages in data.items() if key != ALL_PAGES_KEY]
+        total_pages = len(data.get(ALL_PAGES_KEY, ())) or max((pages[-1] for _, pages in items if pages), default=0)
+        sections = []
+        next_start = total_pages + 1
+        for key, pages in reversed(items):
+            start, end = (pages[0], pages[-1]) if pages else (next_start, next_start - 1)
+            sections.append((tuple(key.split(SEPARATOR)), start, end))
+            next_start = start
+        sections.reverse()
+        return cls(sections, total_pages)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        roots = []
+        nodes = {}
+        for path, start, end in zip(self.paths, self.starts, self.ends):
+            siblings = roots
+            for depth in range(1, len(path)):
+                parent = nodes.get(path[:depth])
+                if parent is None:
+                    # Outline entry without a page of its own
+                    parent = nodes[path[:depth]] = {"title": path[depth - 1], "start": None, "end": None}
+                    siblings.append(parent)
+                siblings = parent.setdefault("children", [])
+            node = nodes.get(path)
+            if node is not None and node["start"] is None:
+                # Placeholder created for a child that comes first in page order
+                node["start"], node["end"] = start, end
+                continue
+            node = nodes[path] = {"title": path[-1], "start": start, "end": end}
+            siblings.append(node)
+        return {"format": FORMAT, "version": VERSION, "total_pages": self.total_pages, "sections": roots}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def keys(self):
+        """Section keys ("Chapter > Section") in page order."""
+        return [SEPARATOR.join(path) for path in self.paths]
+
+    def __iter__(self):
+        """(key, pages range) for every section, in page order."""
+        for path, start, end in zip(self.paths, self.starts, self.ends):
+            yield SEPARATOR.join(path), range(start, end + 1)
+
+    def pages(self, key):
+        i = self.positions[key]
+        return range(self.starts[i], self.ends[i] + 1)
+
+    def all_pages(self):
+        return range(1, self.total_pages + 1)
+
+    def section_at(self, page):
+        """Key of the section containing page, or None before the first section."""
+        i = bisect_right(self.starts, page) - 1
+        if i < 0 or page > self.ends[i]:
+            return None
+        return SEPARATOR.join(self.paths[i])
@@ -1,95 +1,178 @@
 import os
 import sys
-import json
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import IndirectObject
+
+import instrument
+from section_index import SectionIndex
+
+# Pages handled per chunk (and per worker task) when splitting
+CHUNK_SIZE = 64
 
 def pad_page_number(page_num, total_pages):
     width = max(4, len(str(total_pages)))
     return str(page_num).zfill(width)
 
-def split_pdf(input_pdf, output_dir):
-    reader = PdfReader(input_pdf)
-    total_pages = len(reader.pages)
-    os.makedirs(output_dir, exist_ok=True)
+def _write_pages(reader, output_dir, start, end, total_pages):
+    """Write pages start..end (0-based, exclusive end) as single-page PDFs."""
     page_files = []
-    for i in range(total_pages):
+    for i in range(start, end):
         writer = PdfWriter()
         writer.add_page(reader.pages[i])
         padded = pad_page_number(i+1, total_pages)
         out_path = os.path.join(output_dir, f"page_{padded}.pdf")
         with open(out_path, "wb") as f:
             writer.write(f)
+            instrument.count("split_pdf.bytes_written", f.tell())
         page_files.append(out_path)
+    instrument.count("split_pdf.pages", end - start)
+    return page_files
+
+def _split_chunk(reader, output_dir, start, end, total_pages):
+    page_files = _write_pages(reader, output_dir, start, end, total_pages)
+    # Drop objects parsed for this chunk so memory does not grow with page count;
+    # the reader only keeps its xref table and page tree between chunks
+    reader.resolved_objects.clear()
+    return page_files
+
+_worker_reader = None
+
+def _init_split_worker(input_pdf):
+    # Each worker parses the document once and reuses it for all its chunks
+    global _worker_reader
+    _worker_reader = PdfReader(input_pdf)
+
+def _split_range(output_dir, start, end, total_pages):
+    with instrument.span("split_pdf.chunk", start=start, end=end):
+        page_files = _split_chunk(_worker_reader, output_dir, start, end, total_pages)
+    instrument.flush()
+    return page_files
+
+def split_pdf(input_pdf, output_dir, reader=None, workers=1, chunk_size=CHUNK_SIZE):
+    """Split input_pdf into one PDF per page, processing pages in chunks of chunk_size.
+
+    reader: an already-open PdfReader to reuse (e.g. shared with generate_index).
+    workers: > 1 splits page ranges in that many worker processes.
+    """
+    with instrument.span("split_pdf", pdf=str(input_pdf), workers=workers):
+        return _split_pdf(input_pdf, output_dir, reader, workers, chunk_size)
+
+def _split_pdf(input_pdf, output_dir, reader, workers, chunk_size):
+    if reader is None:
+        reader = PdfReader(input_pdf)
+    total_pages = len(reader.pages)
+    os.makedirs(output_dir, exist_ok=True)
+    ranges = [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+    page_files = []
+    if workers > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_split_worker, initargs=(str(input_pdf),)) as pool:
+            futures = [pool.submit(_split_range, output_dir, start, end, total_pages) for start, end in ranges]
+            for future in futures:
+                page_files.extend(future.result())
+        return page_files
+    for start, end in ranges:
+        page_files.extend(_split_chunk(reader, output_dir, start, end, total_pages))
     return page_files
 
+def page_index_map(reader):
+    """Map each page object's id number to its 0-based index, walking the page tree once."""
+    return {page.indirect_reference.idnum: i for i, page in enumerate(reader.pages)
+            if page.indirect_reference is not None}
+
+def destination_page(reader, destination, page_ids):
+    """1-based page number of an outline destination, or None if it does not point into this document."""
+    page = destination.get('/Page')
+    if isinstance(page, IndirectObject):
+        index = page_ids.get(page.idnum)
+    elif isinstance(page, int) and 0 <= page < len(page_ids):
+        # Some writers store the page index itself instead of a reference
+        index = int(page)
+    else:
+        index = None
+    if index is None:
+        # Not a page reference we know: let PyPDF2 try
+        try:
+            index = reader.get_destination_page_number(destination)
+        except Exception:
+            return None
+        if index < 0:
+            return None
+    return index + 1
+
 def extract_outline(reader):
-    # Recursively extract outline (bookmarks) as a tree with page numbers
-    def walk(outline, parent=None):
+    """Outline (bookmarks) as a tree of {'title', 'page', 'children'} nodes.
+
+    Destinations are resolved against a page map built once, instead of a
+    page lookup per bookmark.
+    """
+    try:
+        outline = reader.outline
+    except Exception:
+        return []
+    page_ids = page_index_map(reader)
+    def walk(outline):
         items = []
         for item in outline:
             if isinstance(item, list):
                 # Nested list: subsection
                 if items:
-                    items[-1]['children'] = walk(item, items[-1])
+                    items[-1]['children'] = walk(item)
             else:
                 title = getattr(item, 'title', str(item))
-                try:
-                    page_num = reader.get_destination_page_number(item) + 1
-                except Exception:
-                    page_num = None
-                items.append({'title': title, 'page': page_num, 'children': []})
+                items.append({'title': title, 'page': destination_page(reader, item, page_ids), 'children': []})
         return items
-    try:
-        outline = reader.outline
-    except Exception:
-        outline = []
     return walk(outline)
 
-def flatten_outline_ranges(outline):
-    # Returns a list of (section_title, start_page) in order
+def outline_section_starts(outline):
+    """(title path tuple, start page) of every outline entry with a page, in page order."""
     result = []
     def walk(node, path):
-        title = node['title']
-        page = node['page']
-        key = ' > '.join(path + [title])
-        if page is not None:
-            result.append((key, page))
+        path = path + (node['title'],)
+        if node['page'] is not None:
+            result.append((path, node['page']))
         for child in node.get('children', []):
-            walk(child, path + [title])
+            walk(child, path)
     for node in outline:
-        walk(node, [])
+        walk(node, ())
     return sorted(result, key=lambda x: x[1])
 
+def flatten_outline_ranges(outline):
+    # Returns a list of (section_title, start_page) in order
+    return [(' > '.join(path), page) for path, page in outline_section_starts(outline)]
+
+@instrument.timed("generate_index")
 def generate_index(reader, output_dir):
     os.makedirs(output_dir, exist_ok=True)  # Ensure output_dir exists
     outline = extract_outline(reader)
-    section_ranges = flatten_outline_ranges(outline)
     total_pages = len(reader.pages)
-    index = {}
-    # For each section, include all pages from its start to the next section's start-1 (inclusive)
-    for i, (title, start_page) in enumerate(section_ranges):
-        start = start_page
-        end = section_ranges[i+1][1] - 1 if i+1 < len(section_ranges) else total_pages
-        index[title] = list(range(start, end+1))
-    # Add a special key for all pages
-    all_pages = list(range(1, total_pages + 1))
-    index['__all_pages__'] = all_pages
+    # Each section covers the pages from its start to the next section's start-1 (inclusive),
+    # stored as an interval rather than a list of every page. Title paths are kept as
+    # tuples so the tree is stored as the outline has it, whatever the titles contain.
+    index = SectionIndex.from_starts(outline_section_starts(outline), total_pages)
     # NOTE: When processing split pages, ensure downstream GPT prompts include:
     # "Preserve all LaTeX-style math as inline (`$...$`) or block (`$$...$$`) where applicable.
     # Do not convert math to plain text. Reconstruct equations using standard LaTeX notation."
-    with open(os.path.join(output_dir, "index.json"), "w", encoding="utf-8") as f:
-        json.dump(index, f, indent=2)
+    index.save(os.path.join(output_dir, "index.json"))
     return index
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 split_pdf.py <input.pdf> [output_dir]")
+    args = sys.argv[1:]
+    options = {"--workers": 1, "--chunk-size": CHUNK_SIZE}
+    for flag in options:
+        if flag in args:
+            i = args.index(flag)
+            options[flag] = int(args[i + 1])
+            del args[i:i + 2]
+    if len(args) < 1:
+        print("Usage: python3 split_pdf.py [--workers N] [--chunk-size N] <input.pdf> [output_dir]")
         sys.exit(1)
-    input_pdf = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else Path(input_pdf).stem + "_pages"
+    input_pdf = args[0]
+    output_dir = args[1] if len(args) > 1 else Path(input_pdf).stem + "_pages"
+    # Parse the document once and share it between splitting and outline indexing
     reader = PdfReader(input_pdf)
-    split_pdf(input_pdf, output_dir)
+    split_pdf(input_pdf, output_dir, reader=reader, workers=options["--workers"], chunk_size=options["--chunk-size"])
     generate_index(reader, output_dir)
     print(f"Split complete. Output in {output_dir}/. Index written to index.json.")
 
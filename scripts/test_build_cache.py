@@ -0,0 +1,83 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import build_cache
+import generate_all_banks_tex
+
+def make_tree(root, problems):
+    bank = root / "src" / "banks" / "Bank1"
+    bank.mkdir(parents=True)
+    for n in problems:
+        (bank / f"problem{n}.tex").write_text(f"\\question Problem {n}\n")
+    return bank
+
+def run_incremental(monkeypatch, root, bank):
+    monkeypatch.chdir(root)
+    monkeypatch.setattr(sys, "argv", ["generate_all_banks_tex.py", "--incremental"])
+    generate_all_banks_tex.main()
+    return {p: os.stat(p).st_mtime_ns for p in ["build/banks/Bank1/Bank1_all.tex", "build/all_problems.tex"]}
+
+def test_file_hash_only_rehashes_on_change(tmp_path):
+    path = tmp_path / "a.tex"
+    path.write_text("one")
+    cache = build_cache.BuildCache(str(tmp_path / "manifest.json"))
+    first = cache.file_hash(str(path))
+    assert first == build_cache.sha256_file(str(path))
+    cache.save()
+    # A fresh cache loaded from disk trusts the stored hash while stat() matches
+    cache = build_cache.BuildCache(str(tmp_path / "manifest.json"))
+    assert cache.file_hash(str(path)) == first
+    assert not cache.dirty
+    path.write_text("two, longer")
+    cache = build_cache.BuildCache(str(tmp_path / "manifest.json"))
+    assert cache.file_hash(str(path)) != first
+    assert cache.dirty
+
+def test_needs_write_and_compile(tmp_path):
+    out = tmp_path / "out.tex"
+    cache = build_cache.BuildCache(str(tmp_path / "manifest.json"))
+    assert cache.needs_write(str(out), "d1")
+    out.write_text("x")
+    cache.mark_written(str(out), "d1")
+    assert not cache.needs_write(str(out), "d1")
+    assert cache.needs_write(str(out), "d2")
+    assert cache.needs_compile(str(out))
+    cache.mark_compiled(str(out))
+    assert not cache.needs_compile(str(out))
+    cache.mark_written(str(out), "d2")
+    assert cache.needs_compile(str(out))
+
+def test_incremental_main_skips_unchanged_outputs(tmp_path, monkeypatch):
+    bank = make_tree(tmp_path, [1, 2, 3])
+    first = run_incremental(monkeypatch, tmp_path, bank)
+    assert (tmp_path / "build" / build_cache.MANIFEST_NAME).exists()
+    # No-op rebuild leaves outputs untouched
+    assert run_incremental(monkeypatch, tmp_path, bank) == first
+    # Editing a problem rewrites the outputs that depend on it
+    (bank / "problem2.tex").write_text("\\question Changed problem 2\n")
+    third = run_incremental(monkeypatch, tmp_path, bank)
+    assert all(third[p] != first[p] for p in first)
+    # Adding a problem changes the generated document
+    (bank / "problem4.tex").write_text("\\question Problem 4\n")
+    run_incremental(monkeypatch, tmp_path, bank)
+    assert "problem4.tex" in (tmp_path / "build" / "banks" / "Bank1" / "Bank1_all.tex").read_text()
+
+def test_split_and_merge_worker_parts(tmp_path):
+    for bank in ("Bank1", "Bank2"):
+        (tmp_path / bank).mkdir()
+        (tmp_path / bank / "problem1.tex").write_text(bank)
+    p1, p2 = str(tmp_path / "Bank1" / "problem1.tex"), str(tmp_path / "Bank2" / "problem1.tex")
+    cache = build_cache.BuildCache(str(tmp_path / "manifest.json"))
+    cache.file_hash(p1)
+    cache.mark_written("out1.tex", "d1")
+    cache.save()
+    parts = cache.split({"b1": (str(tmp_path / "Bank1"), ["out1.tex"]), "b2": (str(tmp_path / "Bank2"), ["out2.tex"])})
+    assert list(parts["b1"].files) == [p1] and parts["b1"].outputs == {"out1.tex": {"written": "d1"}}
+    assert parts["b2"].files == {} and parts["b2"].outputs == {}
+    parts["b2"].file_hash(p2)
+    parts["b2"].mark_written("out2.tex", "d2")
+    for part in parts.values():
+        cache.merge(part)
+    assert cache.dirty
+    assert set(cache.files) == {p1, p2}
+    assert cache.outputs["out2.tex"] == {"written": "d2"}
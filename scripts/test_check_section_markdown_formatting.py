@@ -0,0 +1,152 @@
+import json
+import os
+import re
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import check_section_markdown_formatting as lint
+
+def issue_types(issues):
+    return [i['type'] for i in issues]
+
+def old_table_issues(md_text):
+    # The previous whole-file regex check, for comparison
+    count = 0
+    for table in re.findall(r'(\|.+\|\n(?:\|.+\|\n)+)', md_text):
+        rows = [row for row in table.strip().split('\n') if row.strip()]
+        if len({row.count('|') for row in rows}) > 1:
+            count += 1
+    return count
+
+def test_code_block_and_yaml():
+    text = '---\ntitle: x\n\n```python\nprint(1)\n'
+    assert issue_types(lint.check_markdown_formatting(text, 'a.md', existing_files=set())) == ['unclosed_code_block', 'unclosed_yaml']
+    text = '---\ntitle: x\n---\n```\ncode\n```\n'
+    assert lint.check_markdown_formatting(text, 'a.md', existing_files=set()) == []
+
+def test_tables_match_previous_regex():
+    samples = [
+        '| a | b |\n|---|---|\n| 1 | 2 |\n',
+        '| a | b |\n| 1 | 2 | 3 |\n',
+        'text | a | b |\n| 1 |\n\n| c | d |\n| e | f |\n',
+        '| a | b |\n| 1 |',
+        '| a | b |\n| 1 | 2 |\nx | y |\n| 1 | 2 | 3 |\n',
+        '| ![i](x.png) | b |\n| 1 |\n',
+    ]
+    for text in samples:
+        issues = lint.check_markdown_formatting(text, 't.md', existing_files={'x.png'})
+        assert issue_types(issues).count('table_column_mismatch') == old_table_issues(text), text
+
+def test_images_resolved_against_file_set():
+    existing = {'img_1.png', os.path.join('sub', 'img_2.png')}
+    text = '![a](img_1.png)\n![b](img_2.png)\n![c](https://example.com/x.png)\n![d](../img_1.png)\n'
+    issues = lint.check_markdown_formatting(text, 'a.md', 'sub', existing)
+    assert [i['message'] for i in issues] == ['Image file not found: img_1.png']
+
+def test_images_outside_root_resolved_against_root(tmp_path, monkeypatch):
+    root = tmp_path / 'book' / 'book_sections_md'
+    root.mkdir(parents=True)
+    (tmp_path / 'book' / 'book_pages_md').mkdir()
+    (tmp_path / 'book' / 'book_pages_md' / 'fig.png').write_bytes(b'png')
+    md_file = root / 'a.md'
+    md_file.write_text('![](../book_pages_md/fig.png)\n![](../book_pages_md/gone.png)\n')
+    # Lint from another directory: links are not resolved against the CWD
+    monkeypatch.chdir(tmp_path)
+    issues = next(lint.check_files([str(md_file)], str(root), workers=1))
+    assert [i['message'] for i in issues] == ['Image file not found: ../book_pages_md/gone.png']
+
+def test_rule_plugins_registered():
+    @lint.register_rule
+    class TodoRule(lint.Rule):
+        type = 'todo'
+        kinds = ('other',)
+        def visit(self, token):
+            return ()
+        def finish(self):
+            return [self.issue('found')]
+    try:
+        assert issue_types(lint.check_markdown_formatting('x\n', 'a.md'))[-1] == 'todo'
+    finally:
+        lint.RULES.remove(TodoRule)
+
+def test_main_streams_issues(tmp_path, monkeypatch):
+    section_dir = tmp_path / 'book_sections_md'
+    section_dir.mkdir()
+    (section_dir / 'img.png').write_bytes(b'png')
+    for i in range(6):
+        (section_dir / f's{i}.md').write_text(f'![a](img.png)\n![b](missing_{i}.png)\n```\n')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['check_section_markdown_formatting.py', '--workers', '2'])
+    lint.main()
+    issues = json.loads((tmp_path / 'issues.json').read_text())
+    assert len(issues) == 12
+    assert issues[0] == {'file': 's0.md', 'type': 'unclosed_code_block',
+                         'message': 'Odd number of triple backticks (```), possible unclosed code block.'}
+    monkeypatch.setattr(sys, 'argv', ['check_section_markdown_formatting.py', '--jsonl', str(section_dir)])
+    lint.main()
+    lines = (tmp_path / 'issues.jsonl').read_text().splitlines()
+    assert [json.loads(line) for line in lines] == issues
+
+def test_incremental_relints_only_changed_files(tmp_path):
+    section_dir = tmp_path / 'book_sections_md'
+    section_dir.mkdir()
+    for i in range(5):
+        (section_dir / f's{i}.md').write_text(f'# Section {i}\n')
+    (section_dir / 'fig.md').write_text('![a](img.png)\n')
+    md_files = sorted(str(p) for p in section_dir.glob('*.md'))
+    issue_lists, rechecked = lint.check_files_incremental(md_files, str(section_dir), workers=1)
+    assert rechecked == 6
+    assert issue_types(issue_lists[0]) == ['missing_image']
+
+    (section_dir / 's2.md').write_text('```\n')
+    issue_lists, rechecked = lint.check_files_incremental(md_files, str(section_dir), workers=1)
+    assert rechecked == 1
+    assert [issue_types(issues) for issues in issue_lists] == [['missing_image'], [], [], ['unclosed_code_block'], [], []]
+
+    # A new file in the directory only invalidates files that link images
+    (section_dir / 'img.png').write_bytes(b'png')
+    issue_lists, rechecked = lint.check_files_incremental(md_files, str(section_dir), workers=1)
+    assert rechecked == 1
+    assert issue_lists[0] == []
+    assert lint.check_files_incremental(md_files, str(section_dir), workers=1)[1] == 0
+
+def test_incremental_relints_when_outside_image_appears(tmp_path):
+    section_dir = tmp_path / 'book_sections_md'
+    section_dir.mkdir()
+    (section_dir / 'a.md').write_text('![](../book_pages_md/fig.png)\n')
+    (section_dir / 'b.md').write_text('# No images\n')
+    md_files = sorted(str(p) for p in section_dir.glob('*.md'))
+    issue_lists, rechecked = lint.check_files_incremental(md_files, str(section_dir), workers=1)
+    assert rechecked == 2
+    assert issue_types(issue_lists[0]) == ['missing_image']
+
+    # The image is outside the section dir, so the directory listing does not change
+    (tmp_path / 'book_pages_md').mkdir()
+    (tmp_path / 'book_pages_md' / 'fig.png').write_bytes(b'png')
+    issue_lists, rechecked = lint.check_files_incremental(md_files, str(section_dir), workers=1)
+    assert rechecked == 1
+    assert issue_lists == [[], []]
+
+    (tmp_path / 'book_pages_md' / 'fig.png').unlink()
+    issue_lists, rechecked = lint.check_files_incremental(md_files, str(section_dir), workers=1)
+    assert rechecked == 1
+    assert issue_types(issue_lists[0]) == ['missing_image']
+
+def test_new_section_keeps_image_entries_cached(tmp_path):
+    section_dir = tmp_path / 'book_sections_md'
+    section_dir.mkdir()
+    (section_dir / 'fig.md').write_text('![a](img.png)\n')
+    md_files = [str(section_dir / 'fig.md')]
+    assert lint.check_files_incremental(md_files, str(section_dir), workers=1)[1] == 1
+    (section_dir / 'new.md').write_text('# New section\n')
+    md_files.append(str(section_dir / 'new.md'))
+    # Only the new section is linted; fig.md's image lookup cannot have changed
+    assert lint.check_files_incremental(md_files, str(section_dir), workers=1)[1] == 1
+
+def test_small_inputs_checked_in_process(tmp_path, monkeypatch):
+    md_files = []
+    for i in range(lint.PARALLEL_MIN_FILES - 1):
+        (tmp_path / f's{i}.md').write_text('```\n')
+        md_files.append(str(tmp_path / f's{i}.md'))
+    monkeypatch.setattr(lint, 'ProcessPoolExecutor', None)
+    issue_lists = list(lint.check_files(md_files, str(tmp_path)))
+    assert [issue_types(issues) for issues in issue_lists] == [['unclosed_code_block']] * len(md_files)
@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import combine_section_markdown
+
+def make_pages(pages_dir, num_pages):
+    pages_dir.mkdir()
+    for i in range(1, num_pages + 1):
+        text = f"# Page {i}"
+        if i in (2, 3):
+            text += "\n![fig](shared.png)"
+        (pages_dir / f"page_{i:04d}.md").write_text(text)
+    (pages_dir / "shared.png").write_bytes(b"png")
+
+def test_sections_written_in_one_pass(tmp_path):
+    pages_dir = tmp_path / "book_pages_md"
+    out_dir = tmp_path / "book_sections_md"
+    make_pages(pages_dir, 5)
+    index = {"A": [1, 2], "A > A1": [3], "B": [4, 5, 6], "__all_pages__": [1, 2, 3, 4, 5, 6]}
+    cache = combine_section_markdown.assemble_sections(index, pages_dir, out_dir)
+    # Every existing page file is read exactly once, despite the section overlap
+    assert cache.reads == 5
+    a = (out_dir / "A.md").read_text()
+    assert a == '---\nsection: "A"\npages: [1, 2, 3]\n---\n\n# Page 1\n\n# Page 2\n![fig](shared.png)\n\n# Page 3\n![fig](shared.png)'
+    b = (out_dir / "B.md").read_text()
+    assert b.endswith("# Page 5\n\n<!-- Missing: page_0006.md -->")
+    assert (out_dir / "A_>_A1.md").exists()
+    assert (out_dir / "shared.png").read_bytes() == b"png"
+
+def test_combine_pages_and_collect_images(tmp_path):
+    pages_dir = tmp_path / "pages"
+    make_pages(pages_dir, 3)
+    content, images = combine_section_markdown.combine_pages_and_collect_images("S", [2, 3], pages_dir)
+    assert content == "# Page 2\n![fig](shared.png)\n\n# Page 3\n![fig](shared.png)"
+    assert images == {"shared.png"}
+
+def test_page_cache_is_bounded(tmp_path):
+    pages_dir = tmp_path / "pages"
+    make_pages(pages_dir, 5)
+    cache = combine_section_markdown.PageCache(pages_dir, maxsize=2)
+    for page in [1, 2, 1, 3, 1, 2]:
+        cache.get(page)
+    assert len(cache.pages) == 2
+    # 1, 2, 3 read once; 2 evicted by 3 and re-read
+    assert cache.reads == 4
+
+def test_main(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_pages(tmp_path / "book_pages_md", 3)
+    (tmp_path / "book_pages").mkdir()
+    (tmp_path / "book_pages" / "index.json").write_text(json.dumps({"Intro": [1], "Body": [2, 3], "__all_pages__": [1, 2, 3]}))
+    combine_section_markdown.main()
+    assert (tmp_path / "book_sections_md" / "Intro.md").read_text().endswith("# Page 1\n\n# Page 2\n![fig](shared.png)")
+    assert (tmp_path / "book_sections_md" / "shared.png").exists()
@@ -0,0 +1,54 @@
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import compile_tex
+
+def test_job_output_dir_is_isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    out_root = str(tmp_path / "build" / "out")
+    a = compile_tex.job_output_dir("build/all_problems.tex", out_root)
+    b = compile_tex.job_output_dir("build/all_problems_sol.tex", out_root)
+    c = compile_tex.job_output_dir("build/banks/Bank1/Bank1_all.tex", out_root)
+    assert len({a, b, c}) == 3
+    assert c == os.path.join(out_root, "banks", "Bank1", "Bank1_all")
+
+def test_compile_all_streams_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_run(tex_path, workdir, output_dir=None, timeout=None):
+        with lock:
+            running.append(tex_path)
+            peak.append(len(running))
+        # The slow document should finish last
+        time.sleep(0.2 if "slow" in tex_path else 0.01)
+        with lock:
+            running.remove(tex_path)
+        return "bad" not in tex_path, f"log for {tex_path}"
+
+    monkeypatch.setattr(compile_tex, "run_pdflatex", fake_run)
+    files = ["slow.tex", "a.tex", "b.tex", "bad.tex"]
+    results = list(compile_tex.compile_all(files, jobs=2, out_root=str(tmp_path / "out")))
+    assert sorted(r.tex_path for r in results) == sorted(files)
+    assert results[-1].tex_path == "slow.tex"
+    assert max(peak) <= 2
+    assert [r.tex_path for r in results if not r.success] == ["bad.tex"]
+    assert len({r.output_dir for r in results}) == 4
+    for r in results:
+        assert os.path.isdir(r.output_dir)
+
+def test_format_timing_table():
+    results = [
+        compile_tex.CompileResult("a.tex", True, "", 1.5, "out/a"),
+        compile_tex.CompileResult("b.tex", False, "", 3.0, "out/b"),
+    ]
+    table = compile_tex.format_timing_table(results).splitlines()
+    assert table[0].startswith("Document")
+    # Slowest job first
+    assert table[2].startswith("b.tex") and "FAIL" in table[2]
+    assert table[3].startswith("a.tex") and "OK" in table[3]
+    assert table[-1].rstrip().endswith("4.50")
@@ -54,3 +54,64 @@ def test_main_creates_md_files(monkeypatch, tmp_path):
         with open(md_file) as f:
             content = f.read()
             assert content.startswith("# Page")
+
+def test_convert_folder_parallel_writes_and_resumes(monkeypatch, tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    for i in range(6):
+        create_single_page_pdf(pdf_dir / f"page_{i+1:04d}.pdf")
+    output_dir = tmp_path / "mds"
+    output_dir.mkdir()
+    # Page 2 was converted by an earlier run and must not be redone
+    (output_dir / "page_0002.md").write_text("done earlier")
+    calls = []
+    monkeypatch.setattr(convert_pdfs, "pdf_page_to_text", lambda path: "" if path.endswith("0005.pdf") else f"text {os.path.basename(path)}")
+    def fake_api(text, page_num):
+        calls.append(page_num)
+        return f"# Page {page_num}"
+    monkeypatch.setattr(convert_pdfs, "openai_pdf_to_obsidian", fake_api)
+    convert_pdfs.convert_folder(str(pdf_dir), str(output_dir), workers=3, extract_workers=0)
+    assert sorted(calls) == [1, 3, 4, 6]
+    assert (output_dir / "page_0002.md").read_text() == "done earlier"
+    assert (output_dir / "page_0003.md").read_text() == "# Page 3"
+    assert not (output_dir / "page_0005.md").exists()
+
+def test_split_batch_response():
+    content = "<!-- PAGE 3 -->\n# Three\n\n<!-- PAGE 4 -->\n\n<!-- PAGE 5 -->\nFive\n"
+    assert convert_pdfs.split_batch_response(content, [3, 4, 5]) == {3: "# Three", 4: "", 5: "Five"}
+    # Missing or reordered markers can't be split reliably
+    assert convert_pdfs.split_batch_response("<!-- PAGE 3 -->\nx", [3, 4]) is None
+    assert convert_pdfs.split_batch_response("<!-- PAGE 4 -->\nx\n<!-- PAGE 3 -->\ny", [3, 4]) is None
+
+def test_pack_batches_respects_token_budget():
+    pages = [(1, "a" * 400), (2, "b" * 400), (3, "c" * 400), (4, "d" * 4000)]
+    batches = list(convert_pdfs.pack_batches(pages, 250))
+    assert [[p for p, _ in b] for b in batches] == [[1, 2], [3], [4]]
+
+def test_convert_batch_falls_back_to_per_page(monkeypatch):
+    monkeypatch.setattr(convert_pdfs, "chat_completion", lambda prompt, max_tokens, label: "no markers here")
+    monkeypatch.setattr(convert_pdfs, "openai_pdf_to_obsidian", lambda text, page_num: f"# Page {page_num}")
+    assert convert_pdfs.convert_batch([(1, "one"), (2, "two")]) == {1: "# Page 1", 2: "# Page 2"}
+
+def test_convert_folder_batched(monkeypatch, tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    for i in range(5):
+        create_single_page_pdf(pdf_dir / f"page_{i+1:04d}.pdf")
+    output_dir = tmp_path / "mds"
+    monkeypatch.setattr(convert_pdfs, "pdf_page_to_text", lambda path: f"text of {os.path.basename(path)}")
+    prompts = []
+    def fake_chat(prompt, max_tokens, label, raise_errors=False):
+        prompts.append(prompt)
+        import re
+        nums = re.findall(r"^=== PAGE (\d+) ===$", prompt, re.MULTILINE)
+        if not nums:
+            # Single-page request
+            return "# Page " + re.search(r"^Page (\d+) text:$", prompt, re.MULTILINE).group(1)
+        return "\n".join(f"<!-- PAGE {n} -->\n# Page {n}" for n in nums)
+    monkeypatch.setattr(convert_pdfs, "chat_completion", fake_chat)
+    convert_pdfs.convert_folder(str(pdf_dir), str(output_dir), batch_tokens=12)
+    # ~5 tokens per page of dummy text: two pages per request
+    assert len(prompts) == 3
+    for i in range(1, 6):
+        assert (output_dir / f"page_{i:04d}.md").read_text() == f"# Page {i}"
@@ -0,0 +1,65 @@
+import os
+import sys
+import fitz
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import extract_images_to_md
+
+def make_png(color):
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+    pix.set_rect(pix.irect, color)
+    return pix.tobytes("png")
+
+def create_pdf_with_images(path, num_pages=4):
+    doc = fitz.open()
+    logo = make_png((255, 0, 0))
+    logo_xref = 0
+    for i in range(num_pages):
+        page = doc.new_page(width=100, height=100)
+        # Same logo on every page, reusing one xref
+        logo_xref = page.insert_image(fitz.Rect(0, 0, 20, 20), stream=logo, xref=logo_xref)
+    # A second, unique figure on the last page
+    doc[num_pages - 1].insert_image(fitz.Rect(40, 40, 60, 60), stream=make_png((0, 0, 255)))
+    doc.save(str(path))
+    doc.close()
+
+def setup_pages(tmp_path, num_pages=4):
+    pdf_path = tmp_path / "book.pdf"
+    create_pdf_with_images(pdf_path, num_pages)
+    md_dir = tmp_path / "md"
+    md_dir.mkdir()
+    for i in range(num_pages):
+        (md_dir / f"page_{i+1:04d}.md").write_text(f"# Page {i+1}\n")
+    return pdf_path, md_dir
+
+def test_shared_image_written_once(tmp_path):
+    pdf_path, md_dir = setup_pages(tmp_path)
+    extract_images_to_md.extract_images_from_pdf(pdf_path, md_dir)
+    images = sorted(p.name for p in md_dir.glob("img_*"))
+    assert len(images) == 2
+    logo_refs = [(md_dir / f"page_{i:04d}.md").read_text() for i in range(1, 5)]
+    shared = [name for name in images if all(f"]({name})" in text for text in logo_refs)]
+    assert len(shared) == 1
+    assert logo_refs[-1].count("![") == 2
+
+def test_parallel_matches_serial_and_is_idempotent(tmp_path):
+    pdf_path, md_dir = setup_pages(tmp_path, num_pages=5)
+    extract_images_to_md.extract_images_from_pdf(pdf_path, md_dir, workers=2, chunk_size=2)
+    first = {p.name: p.read_text() for p in md_dir.glob("*.md")}
+    assert len(list(md_dir.glob("img_*"))) == 2
+    # Re-running does not duplicate references
+    extract_images_to_md.extract_images_from_pdf(pdf_path, md_dir, workers=2, chunk_size=2)
+    assert {p.name: p.read_text() for p in md_dir.glob("*.md")} == first
+
+def test_pages_without_markdown_are_skipped(tmp_path):
+    pdf_path, md_dir = setup_pages(tmp_path)
+    for p in md_dir.glob("*.md"):
+        p.unlink()
+    extract_images_to_md.extract_images_from_pdf(pdf_path, md_dir)
+    assert not list(md_dir.glob("img_*"))
+
+def test_unique_count_ignores_files_from_other_runs(tmp_path, capsys):
+    pdf_path, md_dir = setup_pages(tmp_path, num_pages=5)
+    (md_dir / "img_0123456789abcdef.png").write_bytes(b"from another book")
+    extract_images_to_md.extract_images_from_pdf(pdf_path, md_dir, workers=2, chunk_size=2)
+    # The shared logo is decoded in every chunk but counted once
+    assert "(6 image occurrences, 2 unique image files)" in capsys.readouterr().out
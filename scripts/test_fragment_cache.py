@@ -0,0 +1,97 @@
+import os
+import re
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import fitz
+import compile_tex
+import fragment_cache
+import generate_all_banks_tex
+
+def fake_compile_all(compiled):
+    """compile_all stand-in that renders a fragment's title or numbered \\question line into a PDF."""
+    def compile_all(tex_files, jobs=None, out_root=None, timeout=None, fmt_dir=None):
+        for tex_path in tex_files:
+            compiled.append(tex_path)
+            text = open(tex_path).read()
+            output_dir = compile_tex.job_output_dir(tex_path, out_root)
+            os.makedirs(output_dir, exist_ok=True)
+            with fitz.open() as doc:
+                page = doc.new_page(width=612, height=792)
+                if "\\maketitle" in text:
+                    page.insert_text((250, 100), re.search(r"\\title\{(.*)\}", text).group(1))
+                    page.insert_text((72, 140), "Questions")
+                else:
+                    number = int(re.search(r"\\setcounter\{question\}\{(\d+)\}", text).group(1)) + 1
+                    question = [line for line in text.splitlines() if line.startswith("\\question")][0]
+                    page.insert_text((60, 80), f"{number}.")
+                    page.insert_text((90, 80), question[:60])
+                    if "answers" in text:
+                        page.insert_text((90, 100), "Solution")
+                doc.save(os.path.join(output_dir, os.path.splitext(os.path.basename(tex_path))[0] + ".pdf"))
+            yield compile_tex.CompileResult(tex_path, True, "", 0.0, output_dir)
+    return compile_all
+
+def make_bank(bank_dir, n):
+    bank_dir.mkdir(parents=True)
+    for i in range(1, n + 1):
+        (bank_dir / f"problem{i}.tex").write_text(f"\\question What is {i}+{i}?\n\\begin{{solution}}{2 * i}\\end{{solution}}\n")
+    return [str(bank_dir / f"problem{i}.tex") for i in range(1, n + 1)]
+
+def make_cache():
+    return fragment_cache.FragmentCache(
+        {"exam": generate_all_banks_tex.EXAM_TEMPLATE, "solutions": generate_all_banks_tex.SOL_TEMPLATE}, "1in")
+
+def test_fragments_compiled_once_and_assembled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    compiled = []
+    monkeypatch.setattr(fragment_cache.compile_tex, "compile_all", fake_compile_all(compiled))
+    files = make_bank(tmp_path / "Bank1", 30)
+    cache = make_cache()
+    documents = [(str(tmp_path / "exam.pdf"), "exam", files, "Bank1"),
+                 (str(tmp_path / "sol.pdf"), "solutions", files, "Bank1 Solutions")]
+    assert cache.build_documents(documents) == []
+    assert len(compiled) == 62
+    # Fragments share the documents' preamble (and so their precompiled format),
+    # keep the exam class's label and resolve paths from the problem's directory
+    src = next(open(path).read() for path in compiled if "What is 1+1?" in open(path).read())
+    assert src.split(r"\csname endofdump\endcsname")[0].startswith("% main")
+    assert r"\renewcommand{\questionlabel}" not in src and r"\setcounter{question}{0}" in src
+    assert r"\def\input@path{{../../../Bank1/}}" in src
+
+    # The first 12 problems keep their numbers in the quiz: only its title is new
+    out = fragment_cache.build_document(cache, files[:12], "solutions", str(tmp_path / "quiz.pdf"), "Quiz")
+    assert len(compiled) == 63
+    with fitz.open(out) as doc:
+        text = "".join(page.get_text() for page in doc)
+    assert text.index("Quiz") < text.index("Questions") < text.index("1.") < text.index("What is 1+1?") < text.index("12.")
+    assert "Solution" in text and "13." not in text and "Question 1" not in text
+
+    # Editing one problem recompiles only its two fragments
+    (tmp_path / "Bank1" / "problem3.tex").write_text("\\question Changed\n")
+    assert cache.build_documents(documents) == []
+    assert len(compiled) == 65
+
+def test_exam_assembly_spreads_questions_like_vfill(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fragment_cache.compile_tex, "compile_all", fake_compile_all([]))
+    files = make_bank(tmp_path / "Bank1", 2)
+    cache = make_cache()
+    assert cache.build_documents([(str(tmp_path / "exam.pdf"), "exam", files, "T"),
+                                  (str(tmp_path / "sol.pdf"), "solutions", files, "T")]) == []
+
+    def question_tops(path):
+        with fitz.open(path) as doc:
+            return [block[1] for block in doc[0].get_text("blocks") if "What is" in block[4]]
+
+    exam, sol = question_tops(tmp_path / "exam.pdf"), question_tops(tmp_path / "sol.pdf")
+    # The page's leftover space goes after each question, so the second one starts mid-page
+    assert exam[1] - exam[0] > 250
+    assert sol[1] - sol[0] < 100
+
+def test_content_rect_crops_to_text():
+    with fitz.open() as doc:
+        page = doc.new_page(width=612, height=792)
+        assert fragment_cache.content_rect(page) is None
+        page.insert_text((100, 200), "Hello")
+        clip = fragment_cache.content_rect(page)
+        assert 90 < clip.x0 < 100 and clip.y1 < 210 and clip.height < 30
@@ -0,0 +1,79 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import generate_all_banks_tex as gen
+
+def render(template, title, files, out_dir):
+    # The whole-string rendering the streaming writer replaces
+    lines = [f"    \\input{{{os.path.relpath(fname, out_dir)}}}" for fname in files]
+    questions = "\n\\vfill\n".join(lines) + "\n\\vfill\n" if template is gen.EXAM_TEMPLATE else "\n".join(lines)
+    return template.format(exam_title=title, sol_title=title, author=gen.AUTHOR, date=gen.DATE,
+                           margin=gen.MARGIN, questions=questions)
+
+def test_streamed_documents_match_template(tmp_path):
+    for n in (0, 1, 5):
+        files = [str(tmp_path / "src" / "banks" / "Bank1" / f"problem{i}.tex") for i in range(1, n + 1)]
+        out_dir = tmp_path / "build" / str(n)
+        documents = [(str(out_dir / "exam.tex"), gen.EXAM_TEMPLATE, "Exam"),
+                     (str(out_dir / "sol.tex"), gen.SOL_TEMPLATE, "Solutions")]
+        # A generator is enough: the problems are iterated once for both documents
+        gen.write_tex_streams(documents, iter(files))
+        for out_path, template, title in documents:
+            assert open(out_path).read() == render(template, title, files, str(out_dir))
+
+def test_bundle_inlines_problem_bodies(tmp_path, monkeypatch):
+    bank = tmp_path / "Bank1"
+    bank.mkdir()
+    bodies = ["\\question One\n", "\\question Two, no trailing newline", "\\question Three\n\\begin{solution}3\\end{solution}\n"]
+    files = []
+    for i, body in enumerate(bodies, 1):
+        (bank / f"problem{i}.tex").write_text(body)
+        files.append(str(bank / f"problem{i}.tex"))
+    expected_exam = "".join(f"% source: {f}\n{b.rstrip(chr(10))}\n\\vfill\n" for f, b in zip(files, bodies))
+    expected_sol = "".join(f"% source: {f}\n{b.rstrip(chr(10))}\n" for f, b in zip(files, bodies))
+
+    def bundled(out_dir):
+        documents = [(str(out_dir / "exam.tex"), gen.EXAM_TEMPLATE, "Exam"),
+                     (str(out_dir / "sol.tex"), gen.SOL_TEMPLATE, "Solutions")]
+        gen.write_tex_streams(documents, files, bundle=True)
+        exam, sol = (open(path).read() for path, _, _ in documents)
+        return exam, sol
+
+    exam, sol = bundled(tmp_path / "a")
+    assert "\\input" not in exam
+    assert exam.split("\\begin{questions}\n")[1].split("\n\\end{questions}")[0] == expected_exam
+    assert sol.split("\\begin{questions}\n")[1].split("\n\\end{questions}")[0] == expected_sol
+
+    # Same output through the bulk-copy fallback
+    def no_sendfile(*args):
+        raise OSError("sendfile not supported")
+    monkeypatch.setattr(gen.os, "sendfile", no_sendfile)
+    assert bundled(tmp_path / "b") == (exam, sol)
+
+def make_banks(root, count, problems=3):
+    for b in range(1, count + 1):
+        bank = root / "src" / "banks" / f"Bank{b}"
+        bank.mkdir(parents=True)
+        for n in range(1, problems + 1):
+            (bank / f"problem{n}.tex").write_text(f"\\question Bank {b} problem {n}\n")
+
+def test_banks_discovered_and_rendered_in_parallel(tmp_path, monkeypatch, capsys):
+    make_banks(tmp_path, 11)
+    (tmp_path / "src" / "banks" / "Empty").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["generate_all_banks_tex.py", "--incremental", "--workers", "3", "--test"])
+    try:
+        gen.main()
+    except SystemExit as e:
+        assert e.code == 0
+    assert "[TEST] All expected .tex files exist" in capsys.readouterr().out
+    for b in range(1, 12):
+        assert (tmp_path / "build" / "banks" / f"Bank{b}" / f"Bank{b}_all_solutions.tex").exists()
+    combined = (tmp_path / "build" / "all_problems.tex").read_text()
+    # Banks in natural order: Bank2 before Bank10
+    inputs = [line.split("/")[3] for line in combined.splitlines() if "\\input" in line]
+    assert inputs[::3] == [f"Bank{b}" for b in range(1, 12)]
+    # A second run finds every output up to date from the merged manifest
+    monkeypatch.setattr(sys, "argv", ["generate_all_banks_tex.py", "--incremental", "--workers", "3"])
+    gen.main()
+    assert "0 of 24 .tex files rewritten" in capsys.readouterr().out
@@ -50,3 +50,95 @@ def test_get_next_problem_number(tmp_path):
     os.makedirs(tmp_path, exist_ok=True)
     n = generate_problem_via_api.get_next_problem_number(str(tmp_path))
     assert n == 1
+
+def test_run_batch_allocates_numbers_in_job_order(tmp_path, monkeypatch):
+    import asyncio
+    import time
+    section_a = tmp_path / "a.txt"
+    section_a.write_text("Section A")
+    section_b = tmp_path / "b.txt"
+    section_b.write_text("Section B")
+    banks_root = tmp_path / "banks"
+    (banks_root / "Bank1").mkdir(parents=True)
+    (banks_root / "Bank1" / "problem4.tex").write_text("existing")
+    monkeypatch.setattr(generate_problem_via_api, "BANKS_ROOT", str(banks_root))
+    monkeypatch.setattr(generate_problem_via_api, "get_context_text", lambda: "")
+
+    def fake_post(session, data):
+        prompt = data["prompt"]
+        if "numbered list" in prompt:
+            tag = "A" if "Section A" in prompt else "B"
+            return "\n".join(f"{i}. {tag} prompt {i}" for i in range(1, 4))
+        # Responses for earlier prompts arrive later
+        time.sleep(0.05 if "prompt 1" in prompt else 0.0)
+        return f"\\question {prompt.split(chr(10))[0]}\\begin{{solution}}ok\\end{{solution}}"
+
+    monkeypatch.setattr(generate_problem_via_api, "post_completion", fake_post)
+    jobs = [
+        {"section": str(section_a), "bank": "Bank1", "count": 2},
+        {"section": str(section_b), "bank": "Bank1", "count": 1},
+    ]
+    order = []
+    write_problem = generate_problem_via_api.write_problem
+    monkeypatch.setattr(generate_problem_via_api, "write_problem",
+                        lambda bank_dir, n, formatted: order.append(n) or write_problem(bank_dir, n, formatted))
+    written = asyncio.run(generate_problem_via_api.run_batch(jobs, concurrency=4))
+    assert len(written) == 3
+    # Written as responses arrive, without waiting for the slow first prompts
+    assert order[0] == 6
+    bank = banks_root / "Bank1"
+    assert "A prompt 1" in (bank / "problem5.tex").read_text()
+    assert "A prompt 2" in (bank / "problem6.tex").read_text()
+    assert "B prompt 1" in (bank / "problem7.tex").read_text()
+    assert (bank / "problem5.tex").read_text().startswith("% Example problem 5\n\\question")
+
+def test_run_batch_numbers_only_successful_problems(tmp_path, monkeypatch):
+    import asyncio
+    section = tmp_path / "a.txt"
+    section.write_text("Section A")
+    banks_root = tmp_path / "banks"
+    monkeypatch.setattr(generate_problem_via_api, "BANKS_ROOT", str(banks_root))
+    monkeypatch.setattr(generate_problem_via_api, "get_context_text", lambda: "")
+
+    def fake_post(session, data):
+        prompt = data["prompt"]
+        if "numbered list" in prompt:
+            return "\n".join(f"{i}. prompt {i}" for i in range(1, 4))
+        # The API call for the second prompt fails (post_completion returns '')
+        if "prompt 2" in prompt:
+            return ""
+        return f"\\question {prompt.split(chr(10))[0]}\\begin{{solution}}ok\\end{{solution}}"
+
+    monkeypatch.setattr(generate_problem_via_api, "post_completion", fake_post)
+    jobs = [{"section": str(section), "bank": "Bank1", "count": 3}]
+    written = asyncio.run(generate_problem_via_api.run_batch(jobs, concurrency=2))
+    assert [os.path.basename(f) for f in written] == ["problem1.tex", "problem2.tex"]
+    assert "prompt 3" in (banks_root / "Bank1" / "problem2.tex").read_text()
+
+def test_run_batch_concurrency_not_capped_by_default_executor(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+    count = 40
+    section = tmp_path / "a.txt"
+    section.write_text("Section A")
+    monkeypatch.setattr(generate_problem_via_api, "BANKS_ROOT", str(tmp_path / "banks"))
+    monkeypatch.setattr(generate_problem_via_api, "get_context_text", lambda: "")
+    # Every problem request waits for all the others to be in flight at once
+    barrier = threading.Barrier(count)
+
+    def fake_post(session, data):
+        if "numbered list" in data["prompt"]:
+            return "\n".join(f"{i}. prompt {i}" for i in range(1, count + 1))
+        barrier.wait(timeout=10)
+        return "\\question q\\begin{solution}ok\\end{solution}"
+
+    monkeypatch.setattr(generate_problem_via_api, "post_completion", fake_post)
+    jobs = [{"section": str(section), "bank": "Bank1", "count": count}]
+    assert len(asyncio.run(generate_problem_via_api.run_batch(jobs, concurrency=count))) == count
+
+def test_load_jobs_rejects_incomplete_jobs(tmp_path):
+    import json
+    job_file = tmp_path / "jobs.json"
+    job_file.write_text(json.dumps([{"section": "a.txt", "bank": "Bank1"}]))
+    with pytest.raises(ValueError):
+        generate_problem_via_api.load_jobs(str(job_file))
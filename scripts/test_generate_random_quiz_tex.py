@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import generate_random_quiz_tex
+
+def make_bank(bank_dir, n):
+    bank_dir.mkdir(parents=True)
+    for i in range(1, n + 1):
+        (bank_dir / f"problem{i}.tex").write_text(f"\\question Problem {i}\n")
+
+def test_write_quiz_variants(tmp_path):
+    bank_dir = tmp_path / "Bank1"
+    out_dir = tmp_path / "quizzes"
+    make_bank(bank_dir, 20)
+    variants = generate_random_quiz_tex.write_quiz_variants(str(bank_dir), 5, range(1, 51), out_dir=str(out_dir))
+    assert len(variants) == 50
+    # Only the variant pairs are written; nothing is added to the bank
+    assert len(os.listdir(out_dir)) == 100
+    assert sorted(os.listdir(bank_dir)) == sorted(f"problem{i}.tex" for i in range(1, 21))
+    seed, selected, exam_path, sol_path = variants[6]
+    assert seed == 7 and len(set(selected)) == 5
+    assert os.path.basename(exam_path) == "quiz_7.tex" and os.path.basename(sol_path) == "quiz_7_sol.tex"
+    exam = open(exam_path).read()
+    assert "Random Quiz 7 from" in exam
+    assert exam.count("\\input{") == 5 and exam.count("\\vfill") == 5
+    for line in exam.splitlines():
+        if "\\input{" in line:
+            assert os.path.exists(os.path.join(out_dir, line.split("{")[1].rstrip("}")))
+    assert "\\vfill" not in open(sol_path).read()
+    assert len({tuple(v[1]) for v in variants}) > 40
+
+def test_variants_reproducible_per_seed(tmp_path):
+    bank_dir = tmp_path / "Bank1"
+    make_bank(bank_dir, 30)
+    first = generate_random_quiz_tex.write_quiz_variants(str(bank_dir), 4, [3, 11], out_dir=str(tmp_path / "a"))
+    second = generate_random_quiz_tex.write_quiz_variants(str(bank_dir), 4, [11], out_dir=str(tmp_path / "b"))
+    assert first[1][1] == second[0][1]
+    assert open(first[1][2]).read() == open(second[0][2]).read()
+
+def test_batch_main(tmp_path, monkeypatch):
+    make_bank(tmp_path / "Bank1", 8)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["generate_random_quiz_tex.py", "--bank", "Bank1", "--problems", "3",
+                                      "--seeds", "4,9", "--out", "out", "--prefix", "student"])
+    generate_random_quiz_tex.main()
+    assert sorted(os.listdir(tmp_path / "out")) == ["student_4.tex", "student_4_sol.tex", "student_9.tex", "student_9_sol.tex"]
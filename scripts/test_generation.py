@@ -3,14 +3,22 @@
 Test script for LaTeX exam/quiz generation workflow.
 Checks:
 - All expected .tex files are generated and non-empty
-- All generated .tex files compile without errors (using pdflatex)
+- All generated .tex files compile without errors (using pdflatex, in parallel)
+
+Usage:
+    python3 scripts/test_generation.py [--jobs N]
 """
 import os
 import subprocess
 import sys
 
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+from compile_tex import compile_all, format_timing_table
+from problem_bank import ProblemBank, discover_banks
+
 BUILD_ROOT = "build"
-BANKS = ["Bank1", "Bank2"]
+# Every bank under src/banks that has problems gets its own pair of documents
+BANKS = [os.path.basename(d) for d in discover_banks(os.path.join("src", "banks")) if len(ProblemBank.scan(d))]
 
 # List of expected generated files (relative to workspace root)
 EXPECTED_FILES = [
@@ -22,23 +30,6 @@ for bank in BANKS:
     EXPECTED_FILES.append(os.path.join(bank_dir, f"{bank}_all.tex"))
     EXPECTED_FILES.append(os.path.join(bank_dir, f"{bank}_all_solutions.tex"))
 
-def run_pdflatex(tex_path, workdir):
-    """Run pdflatex in nonstopmode, return (success, output)"""
-    try:
-        result = subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", os.path.basename(tex_path)],
-            cwd=workdir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            timeout=30,
-            check=False,
-            encoding="utf-8"
-        )
-        success = (result.returncode == 0 and "! LaTeX Error" not in result.stdout)
-        return success, result.stdout
-    except Exception as e:
-        return False, str(e)
-
 def main():
     # 1. Run the generation script(s)
     print("[TEST] Running generate_all_banks_tex.py...")
@@ -65,17 +56,16 @@ def main():
         sys.exit(1)
     print("[TEST] All generated .tex files are non-empty.")
 
-    # 4. Try to compile each .tex file
+    # 4. Try to compile each .tex file (in parallel, each job in its own output dir)
+    jobs = int(sys.argv[sys.argv.index("--jobs") + 1]) if "--jobs" in sys.argv else None
     failed = []
-    for texfile in EXPECTED_FILES:
-        workdir = os.path.dirname(os.path.abspath(texfile))
-        print(f"[TEST] Compiling {texfile} ...", end=" ")
-        success, output = run_pdflatex(texfile, workdir)
-        if not success:
-            print("FAIL")
-            failed.append((texfile, output))
-        else:
-            print("OK")
+    results = []
+    for result in compile_all(EXPECTED_FILES, jobs=jobs):
+        print(f"[TEST] Compiling {result.tex_path} ... {'OK' if result.success else 'FAIL'}")
+        results.append(result)
+        if not result.success:
+            failed.append((result.tex_path, result.output))
+    print(format_timing_table(results))
     if failed:
         print("[FAIL] Some .tex files failed to compile:")
         for texfile, output in failed:
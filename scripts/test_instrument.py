@@ -0,0 +1,75 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import pytest
+
+import instrument
+
+@pytest.fixture
+def tracing(tmp_path, monkeypatch):
+    path = tmp_path / "trace.json"
+    monkeypatch.setattr(instrument, "enabled", True)
+    monkeypatch.setattr(instrument, "TRACE_FILE", str(path))
+    monkeypatch.setattr(instrument, "_events", [])
+    monkeypatch.setattr(instrument, "_counters", {})
+    return path
+
+def test_disabled_records_nothing(monkeypatch):
+    monkeypatch.setattr(instrument, "enabled", False)
+    monkeypatch.setattr(instrument, "_events", [])
+    monkeypatch.setattr(instrument, "_counters", {})
+    with instrument.span("stage"):
+        pass
+    instrument.count("pages", 3)
+    instrument.flush()
+    assert instrument._events == [] and instrument._counters == {}
+
+def test_spans_and_counters_written_to_trace(tracing):
+    @instrument.timed("work")
+    def work():
+        instrument.count("pages", 2)
+        instrument.count("pages")
+
+    with instrument.span("outer", pdf="book.pdf"):
+        work()
+    instrument.flush()
+    data = json.loads(tracing.read_text())
+    names = [e["name"] for e in data["traceEvents"]]
+    assert names == ["work", "outer"]
+    outer = data["traceEvents"][1]
+    assert outer["ph"] == "X" and outer["args"] == {"pdf": "book.pdf"}
+    assert outer["dur"] >= data["traceEvents"][0]["dur"]
+    assert data["counters"] == {"pages": 3}
+
+def test_span_recorded_when_block_raises(tracing):
+    with pytest.raises(ValueError):
+        with instrument.span("failing"):
+            raise ValueError("boom")
+    assert [e["name"] for e in instrument._events] == ["failing"]
+
+def test_worker_trace_path_includes_pid(tracing, monkeypatch):
+    monkeypatch.setenv("INSTRUMENT_MAIN_PID", "0")
+    assert instrument.trace_path() == str(tracing.parent / f"trace.{os.getpid()}.json")
+
+def test_aggregate_merges_trace_files(tmp_path):
+    traces = [
+        {"traceEvents": [{"name": "pdflatex", "ph": "X", "ts": 0, "dur": 2e6},
+                         {"name": "split_pdf", "ph": "X", "ts": 0, "dur": 1e6}],
+         "counters": {"pages": 10}},
+        {"traceEvents": [{"name": "pdflatex", "ph": "X", "ts": 0, "dur": 4e6}],
+         "counters": {"pages": 5, "llm.prompt_tokens": 100}},
+    ]
+    paths = []
+    for i, trace in enumerate(traces):
+        path = tmp_path / f"trace.{i}.json"
+        path.write_text(json.dumps(trace))
+        paths.append(str(path))
+    spans, counters = instrument.aggregate(paths)
+    assert spans["pdflatex"] == {"count": 2, "total": 6.0, "max": 4.0, "mean": 3.0}
+    assert spans["split_pdf"]["count"] == 1
+    assert counters == {"pages": 15, "llm.prompt_tokens": 100}
+    table = instrument.format_aggregate(spans, counters)
+    assert table.index("pdflatex") < table.index("split_pdf")
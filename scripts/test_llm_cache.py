@@ -0,0 +1,93 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import llm_cache
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, result):
+        self.result = result
+
+    def json(self):
+        return self.result
+
+def test_cache_key_uses_request_fields_only():
+    a = {"model": "m", "prompt": "p", "max_tokens": 10}
+    assert llm_cache.cache_key(a) == llm_cache.cache_key(dict(a, stream=False))
+    assert llm_cache.cache_key(a) != llm_cache.cache_key(dict(a, temperature=0.7))
+    assert llm_cache.cache_key(a) != llm_cache.cache_key(dict(a, max_tokens=11))
+
+def test_get_put_and_stats(tmp_path):
+    cache = llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3"))
+    payload = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    assert cache.get(payload) is None
+    cache.put(payload, {"choices": [{"text": "hello"}]})
+    assert cache.get(payload) == {"choices": [{"text": "hello"}]}
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0}
+    cache.close()
+    # Entries survive across processes/runs
+    reopened = llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert reopened.get(payload) == {"choices": [{"text": "hello"}]}
+
+def test_lru_eviction_by_size(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(llm_cache.time, "time", lambda: next(clock))
+    cache = llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=250)
+    body = {"text": "x" * 100}
+    for i in range(3):
+        if i == 2:
+            # Touch the first entry so the second becomes least recently used
+            cache.get({"prompt": "0"})
+        cache.put({"prompt": str(i)}, body)
+    assert cache.get({"prompt": "0"}) is not None
+    assert cache.get({"prompt": "1"}) is None
+    assert cache.get({"prompt": "2"}) is not None
+    assert cache.evictions == 1
+
+def test_disabled_cache_is_bypassed(tmp_path):
+    cache = llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3"), enabled=False)
+    cache.put({"prompt": "p"}, {"x": 1})
+    assert cache.get({"prompt": "p"}) is None
+    assert not (tmp_path / "cache.sqlite3").exists()
+
+def test_cached_post_only_calls_api_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3")))
+    calls = []
+    def fake_post(url, payload, headers=None, session=None, label=None):
+        calls.append(payload)
+        return FakeResponse({"choices": [{"text": "answer"}]})
+    monkeypatch.setattr(llm_cache.rate_limit, "post_with_retry", fake_post)
+    payload = {"model": "m", "prompt": "question", "max_tokens": 5}
+    first, response = llm_cache.cached_post("url", payload)
+    second, cached_response = llm_cache.cached_post("url", payload)
+    assert first == second == {"choices": [{"text": "answer"}]}
+    assert response is not None and cached_response is None
+    assert len(calls) == 1
+
+def test_cached_post_malformed_body_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3")))
+
+    class Malformed(FakeResponse):
+        def json(self):
+            raise ValueError("Expecting value")
+
+    monkeypatch.setattr(llm_cache.rate_limit, "post_with_retry", lambda *a, **k: Malformed(None))
+    payload = {"model": "m", "prompt": "question", "max_tokens": 5}
+    result, response = llm_cache.cached_post("url", payload)
+    assert result is None and isinstance(response, Malformed)
+    assert llm_cache.get_cache().get(payload) is None
+
+def test_sampled_requests_bypass_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.ResponseCache(str(tmp_path / "cache.sqlite3")))
+    calls = []
+    def fake_post(url, payload, headers=None, session=None, label=None):
+        calls.append(payload)
+        return FakeResponse({"choices": [{"text": f"sample {len(calls)}"}]})
+    monkeypatch.setattr(llm_cache.rate_limit, "post_with_retry", fake_post)
+    payload = {"model": "m", "prompt": "list prompts", "max_tokens": 5, "temperature": 0.7}
+    first, _ = llm_cache.cached_post("url", payload)
+    second, _ = llm_cache.cached_post("url", payload)
+    assert first != second and len(calls) == 2
+    llm_cache.cached_post("url", dict(payload, temperature=0))
+    assert llm_cache.cached_post("url", dict(payload, temperature=0))[1] is None
@@ -0,0 +1,50 @@
+import os
+import sys
+import fitz
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+os.environ.setdefault("MY_API_KEY", "test")
+import convert_pdfs
+import pdf_ingest
+
+def create_text_pdf(path, num_pages=3):
+    doc = fitz.open()
+    for i in range(num_pages):
+        page = doc.new_page(width=200, height=200)
+        page.insert_text((20, 40), f"Page text {i+1}")
+    doc.save(str(path))
+    doc.close()
+
+def test_page_ranges():
+    assert pdf_ingest.page_ranges(5, 2) == [(1, 2), (3, 4), (5, 5)]
+    assert pdf_ingest.page_ranges(0, 2) == []
+
+def test_iter_pages_reads_book_once(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    create_text_pdf(pdf_path, 3)
+    records = list(pdf_ingest.iter_pages(str(pdf_path)))
+    assert [r.page_number for r in records] == [1, 2, 3]
+    assert "Page text 2" in records[1].text
+    assert not list(tmp_path.glob("page_*.pdf"))
+
+def test_iter_pages_optionally_writes_page_pdfs(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    create_text_pdf(pdf_path, 3)
+    pages_dir = tmp_path / "pages"
+    records = list(pdf_ingest.iter_pages(str(pdf_path), pages=[2, 3], pages_dir=str(pages_dir)))
+    assert [r.page_number for r in records] == [2, 3]
+    assert sorted(p.name for p in pages_dir.glob("*.pdf")) == ["page_0002.pdf", "page_0003.pdf"]
+    with fitz.open(str(pages_dir / "page_0002.pdf")) as single:
+        assert single.page_count == 1
+        assert "Page text 2" in single[0].get_text()
+
+def test_convert_book_without_split_files(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "book.pdf"
+    create_text_pdf(pdf_path, 4)
+    out_dir = tmp_path / "book_md"
+    out_dir.mkdir()
+    (out_dir / "page_0001.md").write_text("done earlier")
+    monkeypatch.setattr(convert_pdfs, "openai_pdf_to_obsidian", lambda text, page_num: f"# {text.strip()}")
+    convert_pdfs.convert_book(str(pdf_path), str(out_dir), workers=2, extract_workers=0, chunk_size=2)
+    assert (out_dir / "page_0001.md").read_text() == "done earlier"
+    assert (out_dir / "page_0004.md").read_text() == "# Page text 4"
+    assert len(list(out_dir.glob("*.md"))) == 4
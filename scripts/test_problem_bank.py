@@ -0,0 +1,74 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import problem_bank
+from problem_bank import ProblemBank
+
+def make_bank(path, numbers):
+    path.mkdir(parents=True, exist_ok=True)
+    for n in numbers:
+        (path / f"problem{n}.tex").write_text(f"% Example problem {n}\n")
+    (path / "notes.txt").write_text("not a problem")
+    (path / "problem_draft.tex").write_text("not numbered")
+    return path
+
+def test_parse_problem_number():
+    assert problem_bank.parse_problem_number("problem12.tex") == 12
+    assert problem_bank.parse_problem_number("problem_draft.tex") is None
+    assert problem_bank.parse_problem_number("Bank1_all.tex") is None
+
+def test_scan_sorts_numerically(tmp_path):
+    bank_dir = make_bank(tmp_path / "Bank1", [10, 2, 1, 100])
+    bank = ProblemBank.scan(str(bank_dir))
+    assert bank.numbers == [1, 2, 10, 100]
+    assert bank.files() == [os.path.join(str(bank_dir), f"problem{n}.tex") for n in [1, 2, 10, 100]]
+    assert bank.next_number() == 101
+    assert 10 in bank and 3 not in bank
+    assert ProblemBank.scan(str(tmp_path / "missing")).next_number() == 1
+
+def test_add_updates_index_in_place(tmp_path):
+    bank = ProblemBank.scan(str(make_bank(tmp_path / "Bank1", [1, 5])))
+    bank.add(3)
+    bank.add(bank.next_number())
+    assert bank.numbers == [1, 3, 5, 6]
+    assert bank.path(3).endswith("problem3.tex")
+
+def test_persisted_index_reused_until_directory_changes(tmp_path, monkeypatch):
+    bank_dir = make_bank(tmp_path / "Bank1", [1, 2])
+    # Last changed well before the index is saved
+    past = os.stat(bank_dir).st_mtime_ns - 10**9
+    os.utime(bank_dir, ns=(past, past))
+    index_path = str(tmp_path / "index" / "Bank1.json")
+    assert ProblemBank.load(str(bank_dir), index_path).numbers == [1, 2]
+    # A valid persisted index is used without listing the directory
+    monkeypatch.setattr(ProblemBank, "scan", classmethod(lambda cls, d: (_ for _ in ()).throw(AssertionError("rescanned"))))
+    assert ProblemBank.load(str(bank_dir), index_path).numbers == [1, 2]
+    monkeypatch.undo()
+    # Adding a file changes the directory mtime and invalidates the index
+    (bank_dir / "problem7.tex").write_text("new")
+    bank = ProblemBank.load(str(bank_dir), index_path)
+    assert bank.numbers == [1, 2, 7]
+    # Problems registered through add() are persisted
+    (bank_dir / "problem8.tex").write_text("new")
+    bank.add(8)
+    assert ProblemBank.load(str(bank_dir), index_path).numbers == [1, 2, 7, 8]
+
+def test_racy_index_rescanned(tmp_path):
+    bank_dir = make_bank(tmp_path / "Bank1", [1, 2])
+    index_path = str(tmp_path / "index" / "Bank1.json")
+    ProblemBank.load(str(bank_dir), index_path)
+    # Coarse timestamps: a problem written in the same tick as the index save
+    # leaves the directory mtime unchanged
+    tick = os.stat(bank_dir).st_mtime_ns
+    (bank_dir / "problem3.tex").write_text("new")
+    os.utime(bank_dir, ns=(tick, tick))
+    os.utime(index_path, ns=(tick, tick))
+    assert ProblemBank.load(str(bank_dir), index_path).numbers == [1, 2, 3]
+
+def test_discover_banks_natural_order(tmp_path):
+    for name in ["Bank10", "Bank2", "Bank1", "Algebra"]:
+        (tmp_path / name).mkdir()
+    (tmp_path / "notes.txt").write_text("not a bank")
+    banks = problem_bank.discover_banks(str(tmp_path))
+    assert [os.path.basename(b) for b in banks] == ["Algebra", "Bank1", "Bank2", "Bank10"]
+    assert problem_bank.discover_banks(str(tmp_path), "Bank1*") == [str(tmp_path / "Bank1"), str(tmp_path / "Bank10")]
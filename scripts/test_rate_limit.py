@@ -0,0 +1,95 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import rate_limit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, usage=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = f"status {status_code}"
+        self._usage = usage
+
+    def json(self):
+        return {"usage": self._usage} if self._usage else {}
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+def make_limiter(rpm=60, tpm=6000):
+    clock = FakeClock()
+    return rate_limit.RateLimiter(rpm=rpm, tpm=tpm, clock=clock, sleep=clock.sleep), clock
+
+def test_request_budget_spaces_out_requests():
+    limiter, clock = make_limiter(rpm=60)
+    for _ in range(60):
+        limiter.acquire(0)
+    assert clock.now == 0.0
+    # Bucket is empty: the next request waits one second (60 rpm)
+    limiter.acquire(0)
+    assert abs(clock.now - 1.0) < 1e-9
+    assert limiter.metrics["throttled"] == 1
+
+def test_token_budget_is_corrected_by_usage():
+    limiter, clock = make_limiter(rpm=1000, tpm=600)
+    limiter.acquire(600)
+    # Actual usage was much lower than the estimate, so budget is refunded
+    limiter.record_usage({"prompt_tokens": 50, "completion_tokens": 50}, 600)
+    limiter.acquire(400)
+    assert clock.now == 0.0
+    assert limiter.metrics["prompt_tokens"] == 50
+
+def test_parse_retry_after():
+    assert rate_limit.parse_retry_after({"Retry-After": "7"}) == 7.0
+    assert rate_limit.parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert rate_limit.parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert rate_limit.parse_retry_after({"Retry-After": "soon"}) is None
+    assert rate_limit.parse_retry_after({}) is None
+
+def test_backoff_delay_is_jittered_and_capped():
+    assert rate_limit.backoff_delay(3, rng=lambda: 1.0) == 8.0
+    assert rate_limit.backoff_delay(3, rng=lambda: 0.5) == 4.0
+    assert rate_limit.backoff_delay(20, rng=lambda: 1.0) == rate_limit.MAX_DELAY
+    assert rate_limit.backoff_delay(0, retry_after=5, rng=lambda: 0.0) == 5
+
+def test_post_with_retry_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "random", lambda: 0.0)
+    limiter, clock = make_limiter()
+    session = FakeSession([
+        FakeResponse(429, {"Retry-After": "3"}),
+        FakeResponse(503),
+        FakeResponse(200, usage={"prompt_tokens": 10, "completion_tokens": 5}),
+    ])
+    response = rate_limit.post_with_retry("url", {"prompt": "x" * 40, "max_tokens": 10},
+                                          session=session, limiter=limiter)
+    assert response.status_code == 200
+    assert session.calls == 3
+    assert clock.now >= 3.0
+    assert limiter.metrics["rate_limited"] == 1
+    assert limiter.metrics["server_errors"] == 1
+    assert limiter.metrics["retries"] == 2
+    # The 429 slowed the request rate down
+    assert limiter.requests.rate < limiter.requests.max_rate
+
+def test_post_with_retry_does_not_retry_client_errors():
+    limiter, _ = make_limiter()
+    session = FakeSession([FakeResponse(401), FakeResponse(200)])
+    response = rate_limit.post_with_retry("url", {}, session=session, limiter=limiter)
+    assert response.status_code == 401
+    assert session.calls == 1
@@ -0,0 +1,162 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import fitz
+import pytest
+
+import convert_pdfs
+import run_pipeline
+
+def make_book(path, pages=6, section_every=2):
+    with fitz.open() as doc:
+        toc = []
+        for p in range(1, pages + 1):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Text of page {p}")
+            if (p - 1) % section_every == 0:
+                toc.append([1, f"Section {(p - 1) // section_every + 1}", p])
+        doc.set_toc(toc)
+        doc.save(str(path))
+
+def test_checkpoint_resumes_and_drops_torn_record(tmp_path):
+    pdf = tmp_path / "book.pdf"
+    make_book(pdf)
+    state = tmp_path / "state.jsonl"
+    cp = run_pipeline.Checkpoint(str(state), str(pdf))
+    cp.record("split:1", "page_0001.pdf")
+    cp.record("lint:A", [{"file": "A.md"}])
+    cp.close()
+    with open(state, "a") as f:
+        f.write('{"item": "split:2", "res')
+    cp = run_pipeline.Checkpoint(str(state), str(pdf))
+    assert cp.done == {"split:1": "page_0001.pdf", "lint:A": [{"file": "A.md"}]}
+    cp.record("split:2")
+    cp.close()
+    assert "split:2" in run_pipeline.Checkpoint(str(state), str(pdf)).done
+    # A modified PDF invalidates the log
+    make_book(pdf, pages=4)
+    assert run_pipeline.Checkpoint(str(state), str(pdf)).done == {}
+
+class FakeCheckpoint:
+    def __init__(self, done=None):
+        self.done = dict(done or {})
+        self.order = []
+
+    def record(self, item, result=None):
+        self.done[item] = result
+        self.order.append(item)
+
+def test_scheduler_prefers_later_stages_and_blocks_on_failure():
+    scheduler = run_pipeline.Scheduler()
+    calls = []
+
+    def work(key):
+        calls.append(key)
+        if key == "convert:2":
+            raise RuntimeError("boom")
+        return key
+
+    for page in (1, 2, 3):
+        scheduler.add(f"split:{page}", None, work, f"split:{page}")
+        scheduler.add(f"convert:{page}", None, work, f"convert:{page}", after=[f"split:{page}"])
+    scheduler.add("combine:A", None, work, "combine:A", after=["convert:1"])
+    scheduler.add("combine:B", None, work, "combine:B", after=["convert:2", "convert:3"])
+    checkpoint = FakeCheckpoint({"split:3": None})
+    failed = scheduler.run({}, {}, checkpoint)
+    assert failed == ["convert:2"]
+    assert "split:3" not in calls and "combine:B" not in calls
+    # Section A is combined as soon as its page is ready, before page 2 is split
+    assert calls.index("combine:A") < calls.index("split:2")
+
+def test_pooled_items_do_not_block_the_scheduler():
+    scheduler = run_pipeline.Scheduler()
+    started = threading.Event()
+    scheduler.add("problems:A", "bank", lambda: started.wait(5))
+    scheduler.add("convert:2", "llm", started.set)
+    with ThreadPoolExecutor(1) as llm_pool, ThreadPoolExecutor(1) as bank_pool:
+        checkpoint = FakeCheckpoint()
+        assert scheduler.run({"llm": llm_pool, "bank": bank_pool}, {"llm": 1, "bank": 1}, checkpoint) == []
+    # The problems item was still running when the convert item was dispatched
+    assert checkpoint.done["problems:A"] is True
+
+@pytest.fixture
+def book_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_book(tmp_path / "book.pdf")
+    return tmp_path
+
+def test_pipeline_builds_sections_and_resumes(book_dir, monkeypatch):
+    converted = []
+
+    def fake_convert(text, page_num, raise_errors=False):
+        converted.append(page_num)
+        if page_num == 4 and converted.count(4) == 1:
+            assert raise_errors
+            raise RuntimeError("API request failed for page 4")
+        if page_num == 6:
+            # Nothing useful on the page: the model returns an empty string
+            return ""
+        return f"# Page {page_num}\n\n{text.strip()}"
+
+    monkeypatch.setattr(convert_pdfs, "openai_pdf_to_obsidian", fake_convert)
+    pipeline = run_pipeline.BookPipeline("book.pdf", workers=2, cpu_workers=0)
+    assert pipeline.run() == ["convert:4"]
+    # The API error is recorded as a failure; the empty page is done
+    checkpoint = run_pipeline.Checkpoint(pipeline.state_path, "book.pdf")
+    checkpoint.close()
+    assert "convert:4" not in checkpoint.done and checkpoint.done["convert:6"] == "empty"
+    # Section 2 (pages 3-4, plus page 5 overlap) waits for page 4; the others are done
+    assert os.path.exists("book_sections_md/Section_1.md")
+    assert not os.path.exists("book_sections_md/Section_2.md")
+    # An empty page does not hold up its section
+    assert os.path.exists("book_sections_md/Section_3.md")
+
+    pipeline = run_pipeline.BookPipeline("book.pdf", workers=2, cpu_workers=0)
+    assert pipeline.run() == []
+    assert sorted(converted) == [1, 2, 3, 4, 4, 5, 6]
+    section = open("book_sections_md/Section_2.md", encoding="utf-8").read()
+    assert section.startswith('---\nsection: "Section 2"\npages: [3, 4, 5]\n---\n\n# Page 3')
+    assert "# Page 4" in section and "# Page 5" in section
+    with open("issues.json", encoding="utf-8") as f:
+        assert json.load(f) == []
+
+def test_problems_resume_after_crash_without_duplicates(tmp_path, monkeypatch):
+    import generate_problem_via_api
+    monkeypatch.chdir(tmp_path)
+    make_book(tmp_path / "book.pdf", pages=2)
+    monkeypatch.setattr(convert_pdfs, "openai_pdf_to_obsidian", lambda text, page_num, raise_errors=False: f"# Page {page_num}")
+    monkeypatch.setattr(generate_problem_via_api, "BANKS_ROOT", str(tmp_path / "banks"))
+    monkeypatch.setattr(generate_problem_via_api, "get_context_text", lambda: "")
+    monkeypatch.setattr(run_pipeline.BookPipeline, "build_banks", lambda self: None)
+    requests = []
+    crashed = []
+
+    def fake_post(session, data):
+        prompt = data["prompt"]
+        requests.append(prompt)
+        if "numbered list" in prompt:
+            return "1. first\n2. second\n3. third"
+        if "third" in prompt and not crashed:
+            crashed.append(prompt)
+            time.sleep(0.1)
+            raise ConnectionError("process killed mid-batch")
+        return "\\question q\\begin{solution}ok\\end{solution}"
+
+    monkeypatch.setattr(generate_problem_via_api, "post_completion", fake_post)
+    pipeline = run_pipeline.BookPipeline("book.pdf", problems=3, workers=3, cpu_workers=0)
+    assert pipeline.run() == ["problems:Section 1"]
+    assert len(list((tmp_path / "banks" / "Bank1").glob("problem*.tex"))) == 2
+
+    requests.clear()
+    pipeline = run_pipeline.BookPipeline("book.pdf", problems=3, workers=3, cpu_workers=0)
+    assert pipeline.run() == []
+    # Only the missing problem is requested again; the prompt list is reused
+    assert len(requests) == 1 and "third" in requests[0]
+    assert sorted(p.name for p in (tmp_path / "banks" / "Bank1").glob("problem*.tex")) == \
+        ["problem1.tex", "problem2.tex", "problem3.tex"]
@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from flat_to_nested import flat_to_nested
+from section_index import SectionIndex
+
+OLD_INDEX = {
+    "A": [1],
+    "A > A1": [2, 3],
+    "A > A2": [],
+    "B": [4, 5, 6],
+    "__all_pages__": [1, 2, 3, 4, 5, 6],
+}
+
+def make_index():
+    return SectionIndex.from_starts([("A", 1), ("A > A1", 2), ("A > A2", 4), ("B", 4)], 6)
+
+def test_intervals_and_lookups():
+    index = make_index()
+    assert index.keys() == ["A", "A > A1", "A > A2", "B"]
+    assert index.pages("A > A1") == range(2, 4)
+    # Starts on the same page as B, so it has no pages of its own
+    assert list(index.pages("A > A2")) == []
+    assert [index.section_at(p) for p in range(1, 7)] == ["A", "A > A1", "A > A1", "B", "B", "B"]
+    assert SectionIndex.from_starts([("Intro", 3)], 5).section_at(2) is None
+
+def test_tree_round_trip(tmp_path):
+    index = make_index()
+    data = index.to_dict()
+    assert data["total_pages"] == 6
+    assert data["sections"] == [
+        {"title": "A", "start": 1, "end": 1, "children": [
+            {"title": "A1", "start": 2, "end": 3},
+            {"title": "A2", "start": 4, "end": 3}]},
+        {"title": "B", "start": 4, "end": 6},
+    ]
+    index.save(tmp_path / "index.json")
+    loaded = SectionIndex.load(tmp_path / "index.json")
+    assert list(loaded) == list(index)
+
+def test_parent_without_page_and_child_before_parent():
+    # "Part I" has no page; "Ch 2" starts before its parent in page order
+    index = SectionIndex.from_starts([(("Part I", "Ch 1"), 1), (("Part I", "Ch 2"), 3), (("Ch 2",), 3),
+                                      (("Ch 2", "Sec"), 4)], 5)
+    data = index.to_dict()
+    assert data["sections"][0] == {"title": "Part I", "start": None, "end": None, "children": [
+        {"title": "Ch 1", "start": 1, "end": 2}, {"title": "Ch 2", "start": 3, "end": 2}]}
+    assert list(SectionIndex.from_dict(json.loads(json.dumps(data)))) == list(index)
+
+def test_reads_old_format():
+    index = SectionIndex.from_dict(OLD_INDEX)
+    assert list(index) == list(make_index())
+    assert index.total_pages == 6
+
+def test_flat_to_nested_accepts_both_formats():
+    nested = flat_to_nested(OLD_INDEX)
+    assert nested == flat_to_nested(make_index().to_dict())
+    assert nested["A"]["pages"] == [1]
+    assert nested["A"]["children"]["A1"] == {"pages": [2, 3], "children": {}}
+    assert nested["B"] == {"pages": [4, 5, 6], "children": {}}
@@ -7,6 +7,7 @@ from PyPDF2 import PdfWriter, PdfReader
 import sys
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 import split_pdf
+from section_index import SectionIndex
 
 def create_sample_pdf(path, num_pages=3):
     writer = PdfWriter()
@@ -32,8 +33,9 @@ def test_split_pdf_creates_pages_and_index(tmp_path):
     with open(index_file) as f:
         data = json.load(f)
     assert isinstance(data, dict)
-    # Check that __all_pages__ key exists and is correct
-    assert data["__all_pages__"] == [1, 2, 3, 4, 5]
+    # Check that the page count is recorded and is correct
+    assert data["total_pages"] == 5
+    assert list(SectionIndex.from_dict(data).all_pages()) == [1, 2, 3, 4, 5]
 
 def test_pad_page_number():
     assert split_pdf.pad_page_number(1, 5) == "0001"
@@ -123,8 +125,115 @@ def test_generate_index_section_ranges(tmp_path):
     index = split_pdf.generate_index(reader, str(out_dir))
     split_pdf.extract_outline = orig_extract_outline
     # Section A: pages 1-1, A1: 2-3, A2: 4-4, B: 5-6
-    assert index['A'] == [1]
-    assert index['A > A1'] == [2, 3]
-    assert index['A > A2'] == [4]
-    assert index['B'] == [5, 6]
-    assert index['__all_pages__'] == [1, 2, 3, 4, 5, 6]
+    assert list(index.pages('A')) == [1]
+    assert list(index.pages('A > A1')) == [2, 3]
+    assert list(index.pages('A > A2')) == [4]
+    assert list(index.pages('B')) == [5, 6]
+    assert list(index.all_pages()) == [1, 2, 3, 4, 5, 6]
+
+def create_pdf_with_outline(path, num_pages=6):
+    writer = PdfWriter()
+    for i in range(num_pages):
+        writer.add_blank_page(width=72, height=72)
+    chapter = writer.add_outline_item("Chapter 1", 0)
+    writer.add_outline_item("Section 1.1", 2, parent=chapter)
+    writer.add_outline_item("Chapter 2", 4)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def test_split_pdf_chunks_share_reader_with_index(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    out_dir = tmp_path / "pages"
+    create_pdf_with_outline(pdf_path)
+    reader = PdfReader(str(pdf_path))
+    files = split_pdf.split_pdf(str(pdf_path), str(out_dir), reader=reader, chunk_size=4)
+    assert [os.path.basename(f) for f in files] == [f"page_{i:04d}.pdf" for i in range(1, 7)]
+    # The same reader still resolves the outline after chunked splitting
+    index = split_pdf.generate_index(reader, str(out_dir))
+    assert list(index.pages("Chapter 1")) == [1, 2]
+    assert list(index.pages("Chapter 1 > Section 1.1")) == [3, 4]
+    assert list(index.pages("Chapter 2")) == [5, 6]
+
+def test_split_pdf_parallel_workers(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    out_dir = tmp_path / "pages"
+    create_sample_pdf(pdf_path, num_pages=7)
+    files = split_pdf.split_pdf(str(pdf_path), str(out_dir), workers=2, chunk_size=3)
+    assert [os.path.basename(f) for f in files] == [f"page_{i:04d}.pdf" for i in range(1, 8)]
+    for f in files:
+        assert len(PdfReader(f).pages) == 1
+
+def create_text_pdf(path, num_pages):
+    # Pages with content streams, so splitting has objects to resolve
+    import fitz
+    with fitz.open() as doc:
+        for i in range(num_pages):
+            doc.new_page().insert_text((72, 72), f"Page {i + 1}")
+        doc.save(str(path))
+
+def test_split_pdf_live_objects_flat_across_chunks(tmp_path, monkeypatch):
+    import gc
+    pdf_path = tmp_path / "book.pdf"
+    create_text_pdf(pdf_path, 40)
+    live = []
+    split_chunk = split_pdf._split_chunk
+
+    def measured(*args):
+        page_files = split_chunk(*args)
+        gc.collect()
+        live.append(len(gc.get_objects()))
+        return page_files
+
+    monkeypatch.setattr(split_pdf, "_split_chunk", measured)
+    split_pdf.split_pdf(str(pdf_path), str(tmp_path / "pages"), chunk_size=4)
+    assert len(live) == 10
+    # Ten times the pages of the first chunk, but no more live objects
+    assert live[-1] - live[0] < 10
+
+def test_split_workers_open_the_pdf_once(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "book.pdf"
+    create_sample_pdf(pdf_path, num_pages=6)
+    opened = []
+    monkeypatch.setattr(split_pdf, "PdfReader", lambda path: opened.append(path) or PdfReader(path))
+    split_pdf._init_split_worker(str(pdf_path))
+    files = [f for start in range(0, 6, 2) for f in split_pdf._split_range(str(tmp_path), start, start + 2, 6)]
+    assert opened == [str(pdf_path)]
+    assert len(files) == 6
+
+def test_main_with_workers(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "book.pdf"
+    create_pdf_with_outline(pdf_path)
+    out_dir = tmp_path / "pages"
+    monkeypatch.setattr(split_pdf.sys, 'argv', ['split_pdf.py', '--workers', '2', '--chunk-size', '2', str(pdf_path), str(out_dir)])
+    split_pdf.main()
+    assert len(list(out_dir.glob("page_*.pdf"))) == 6
+    assert (out_dir / "index.json").exists()
+
+def test_extract_outline_resolves_pages_in_bulk(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "book.pdf"
+    create_pdf_with_outline(pdf_path)
+    reader = PdfReader(str(pdf_path))
+    # Every destination resolves through the page map built once
+    monkeypatch.setattr(reader, "get_destination_page_number", lambda dest: pytest.fail("per-item lookup"))
+    assert split_pdf.extract_outline(reader) == [
+        {'title': 'Chapter 1', 'page': 1, 'children': [{'title': 'Section 1.1', 'page': 3, 'children': []}]},
+        {'title': 'Chapter 2', 'page': 5, 'children': []},
+    ]
+
+def test_extract_outline_unresolved_destination_has_no_page(tmp_path):
+    pdf_path = tmp_path / "book.pdf"
+    create_pdf_with_outline(pdf_path)
+    reader = PdfReader(str(pdf_path))
+    assert split_pdf.destination_page(reader, {'/Page': 99}, split_pdf.page_index_map(reader)) is None
+    assert split_pdf.destination_page(reader, {'/Page': 2}, split_pdf.page_index_map(reader)) == 3
+
+def test_generate_index_keeps_titles_as_a_tree(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "sample.pdf"
+    create_sample_pdf(pdf_path, num_pages=4)
+    outline = [{'title': 'Part A > B', 'page': 1, 'children': [{'title': 'Ch 1', 'page': 3, 'children': []}]}]
+    monkeypatch.setattr(split_pdf, "extract_outline", lambda r: outline)
+    split_pdf.generate_index(PdfReader(str(pdf_path)), str(tmp_path / "pages"))
+    with open(tmp_path / "pages" / "index.json") as f:
+        data = json.load(f)
+    assert data["sections"] == [{"title": "Part A > B", "start": 1, "end": 2,
+                                 "children": [{"title": "Ch 1", "start": 3, "end": 4}]}]
@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+import compile_tex
+import generate_all_banks_tex
+import tex_format
+
+class FakeRun:
+    """Stands in for subprocess.run: `pdflatex -ini` writes <jobname>.fmt."""
+    def __init__(self):
+        self.dumps = []
+        self.lock = threading.Lock()
+
+    def __call__(self, cmd, cwd=None, **kwargs):
+        class Result:
+            returncode = 0
+            stdout = "pdfTeX 3.141592653-2.6-1.40.25 (TeX Live 2023)\n"
+        if "-ini" in cmd:
+            jobname = [a for a in cmd if a.startswith("-jobname=")][0].split("=", 1)[1]
+            with self.lock:
+                self.dumps.append(cmd[-1])
+            with open(os.path.join(cwd, jobname + ".fmt"), "w") as f:
+                f.write("fmt")
+        return Result()
+
+def write_doc(path, template, title):
+    text = template.format(exam_title=title, sol_title=title, author="", date="", margin="1in", questions="")
+    path.write_text(text)
+    return str(path)
+
+def test_read_preamble(tmp_path):
+    doc = write_doc(tmp_path / "a.tex", generate_all_banks_tex.EXAM_TEMPLATE, "A")
+    preamble = tex_format.read_preamble(doc)
+    assert preamble.startswith("% main.tex")
+    assert preamble.rstrip().endswith(r"\usepackage[margin=1in]{geometry}")
+    assert r"\title" not in preamble
+    plain = tmp_path / "plain.tex"
+    plain.write_text("\\documentclass{article}\n\\begin{document}\nx\n\\end{document}\n")
+    assert tex_format.read_preamble(str(plain)) is None
+
+def test_format_built_once_per_preamble(tmp_path, monkeypatch):
+    fake = FakeRun()
+    monkeypatch.setattr(tex_format.subprocess, "run", fake)
+    tex_format.clear_state()
+    fmt_dir = str(tmp_path / "fmt")
+    docs = [write_doc(tmp_path / f"exam{i}.tex", generate_all_banks_tex.EXAM_TEMPLATE, f"Exam {i}") for i in range(4)]
+    docs += [write_doc(tmp_path / f"sol{i}.tex", generate_all_banks_tex.SOL_TEMPLATE, f"Sol {i}") for i in range(4)]
+    calls = []
+
+    def fake_pdflatex(tex_path, workdir, output_dir=None, timeout=None, fmt=None, fmt_dir=None):
+        calls.append(fmt)
+        return True, ""
+
+    monkeypatch.setattr(compile_tex, "run_pdflatex", fake_pdflatex)
+    results = list(compile_tex.compile_all(docs, jobs=4, out_root=str(tmp_path / "out"), fmt_dir=fmt_dir))
+    assert all(r.success for r in results)
+    # One format for the exam preamble and one for the solutions preamble
+    assert len(fake.dumps) == 2
+    assert len(set(calls)) == 2 and None not in calls
+    assert len([f for f in os.listdir(fmt_dir) if f.endswith(".fmt")]) == 2
+
+    # Changing the preamble gives a new format name; an unchanged one reuses the file
+    name = tex_format.ensure_format(docs[0], fmt_dir)
+    assert len(fake.dumps) == 2
+    changed = tmp_path / "changed.tex"
+    changed.write_text(open(docs[0]).read().replace("margin=1in", "margin=2cm"))
+    assert tex_format.ensure_format(str(changed), fmt_dir) != name
+    assert len(fake.dumps) == 3
+    tex_format.clear_state()
+
+def test_failed_format_falls_back(tmp_path, monkeypatch):
+    def failing_run(cmd, cwd=None, **kwargs):
+        class Result:
+            returncode = 1
+            stdout = "! LaTeX Error: File `mylatexformat.ltx' not found."
+        return Result()
+
+    monkeypatch.setattr(tex_format.subprocess, "run", failing_run)
+    tex_format.clear_state()
+    doc = write_doc(tmp_path / "a.tex", generate_all_banks_tex.EXAM_TEMPLATE, "A")
+    assert tex_format.ensure_format(doc, str(tmp_path / "fmt")) is None
+    assert tex_format.ensure_format(str(tmp_path / "missing.tex"), str(tmp_path / "fmt")) is None
+    tex_format.clear_state()
@@ -0,0 +1,106 @@
+"""
+Precompiled LaTeX formats for the generated exam documents.
+
+The document templates put \\csname endofdump\\endcsname right after their
+static preamble (document class and packages). Everything before that marker is
+dumped once into a custom format with mylatexformat, and documents are then
+compiled with -fmt so pdflatex skips loading the class and packages again.
+
+Formats live in build/fmt and are named after a hash of the preamble text and
+the pdflatex version, so editing a template (or upgrading TeX) simply produces
+a new format instead of loading a stale one.
+"""
+import hashlib
+import os
+import subprocess
+import threading
+
+ENDOFDUMP = r"\csname endofdump\endcsname"
+FMT_DIR = os.path.join("build", "fmt")
+TIMEOUT = 120
+
+_version = None
+_locks = {}
+_locks_lock = threading.Lock()
+_failed = set()
+
+def read_preamble(tex_path):
+    """Text before the endofdump marker of tex_path, or None if it has no marker."""
+    lines = []
+    with open(tex_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip() == ENDOFDUMP:
+                return "".join(lines)
+            if line.lstrip().startswith(r"\begin{document}"):
+                break
+            lines.append(line)
+    return None
+
+def engine_version(pdflatex="pdflatex"):
+    global _version
+    if _version is None:
+        try:
+            result = subprocess.run([pdflatex, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    encoding="utf-8", errors="replace", check=False)
+            _version = result.stdout.split("\n", 1)[0]
+        except OSError:
+            _version = ""
+    return _version
+
+def format_name(preamble, pdflatex="pdflatex"):
+    h = hashlib.sha256((engine_version(pdflatex) + "\0" + preamble).encode("utf-8"))
+    return f"exam_{h.hexdigest()[:16]}"
+
+def _lock_for(name):
+    with _locks_lock:
+        return _locks.setdefault(name, threading.Lock())
+
+def build_format(preamble, fmt_dir=FMT_DIR, pdflatex="pdflatex", timeout=TIMEOUT):
+    """Dump preamble into fmt_dir/<name>.fmt (once) and return the format name, or None on failure."""
+    name = format_name(preamble, pdflatex)
+    fmt_dir = os.path.abspath(fmt_dir)
+    fmt_path = os.path.join(fmt_dir, name + ".fmt")
+    with _lock_for(name):
+        if os.path.exists(fmt_path):
+            return name
+        if name in _failed:
+            return None
+        os.makedirs(fmt_dir, exist_ok=True)
+        with open(os.path.join(fmt_dir, name + ".tex"), "w", encoding="utf-8") as f:
+            f.write(preamble + ENDOFDUMP + "\n\\begin{document}\n\\end{document}\n")
+        # Dump under a temporary job name so an interrupted run never leaves a truncated .fmt
+        jobname = f"{name}.part"
+        cmd = [pdflatex, "-ini", "-interaction=nonstopmode", f"-jobname={jobname}",
+               "&pdflatex", "mylatexformat.ltx", f"{name}.tex"]
+        try:
+            result = subprocess.run(cmd, cwd=fmt_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    timeout=timeout, check=False, encoding="utf-8", errors="replace")
+            ok = result.returncode == 0 and os.path.exists(os.path.join(fmt_dir, jobname + ".fmt"))
+        except Exception as e:
+            result, ok = None, False
+            print(f"[WARN] Could not build format {name}: {e}")
+        if not ok:
+            if result is not None:
+                print(f"[WARN] Could not build format {name}; compiling without it (see {os.path.join(fmt_dir, jobname + '.log')})")
+            _failed.add(name)
+            return None
+        os.replace(os.path.join(fmt_dir, jobname + ".fmt"), fmt_path)
+        print(f"[INFO] Built LaTeX format {fmt_path}")
+        return name
+
+def ensure_format(tex_path, fmt_dir=FMT_DIR, pdflatex="pdflatex"):
+    """Format name to compile tex_path with, or None if it has no dumpable preamble."""
+    try:
+        preamble = read_preamble(tex_path)
+    except OSError:
+        # Let pdflatex report the unreadable document
+        return None
+    if preamble is None:
+        return None
+    return build_format(preamble, fmt_dir, pdflatex)
+
+def clear_state():
+    """Forget cached engine version and failed builds (for tests)."""
+    global _version
+    _version = None
+    _failed.clear()